@@ -0,0 +1,108 @@
+
+import collections
+
+import imageIO.png
+
+
+# A histogram of pixel values, built up one row at a time. Values are counted with a Counter, which does the
+# counting in C, so adding a row costs one call however wide it is. Any hashable numbers can be counted,
+# 8 bit values are the usual case but 16 bit and floating point values work too.
+class Histogram:
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.total = 0
+
+    def addRow(self, row):
+        self.counts.update(row)
+        self.total += len(row)
+
+    # smallest and largest value counted (None when nothing has been counted)
+    def minimum(self):
+        return min(self.counts) if self.counts else None
+
+    def maximum(self):
+        return max(self.counts) if self.counts else None
+
+    # Returns the counts in nr_bins equal width bins covering values from low up to (not including) high,
+    # by default the 256 values of an 8 bit image. Values outside the range go in the first or last bin.
+    def bins(self, nr_bins = 256, low = 0, high = 256):
+        histogram = [0] * nr_bins
+        scale = nr_bins / (high - low)
+        for value, count in self.counts.items():
+            index = int((value - low) * scale)
+            histogram[min(max(index, 0), nr_bins - 1)] += count
+        return histogram
+
+    # the cumulative histogram: the number of values in each bin or any bin before it
+    def cumulative(self, nr_bins = 256, low = 0, high = 256):
+        cumulative_histogram = []
+        running_total = 0
+        for count in self.bins(nr_bins, low, high):
+            running_total += count
+            cumulative_histogram.append(running_total)
+        return cumulative_histogram
+
+    # Returns the smallest value that at least percent % of the values are less than or equal to
+    # (the nearest rank percentile), so percentile(0) is the minimum and percentile(100) the maximum.
+    def percentile(self, percent):
+        if not self.counts:
+            return None
+        rank = max(1, -(-self.total * percent // 100))
+        running_total = 0
+        for value in sorted(self.counts):
+            running_total += self.counts[value]
+            if running_total >= rank:
+                return value
+        return self.maximum()
+
+    # Otsu's threshold: splits the counted values into a lower and an upper class with the largest variance
+    # between the two, and returns the smallest value of the upper class (so values >= it are the upper class).
+    # Returns the only value counted if there is just one, None if nothing has been counted.
+    def otsu(self):
+        values = sorted(self.counts)
+        if len(values) < 2:
+            return values[0] if values else None
+        total_sum = sum(value * count for value, count in self.counts.items())
+        lower_count = 0
+        lower_sum = 0
+        best_value, best_variance = values[-1], -1
+        for value, next_value in zip(values, values[1:]):
+            lower_count += self.counts[value]
+            lower_sum += value * self.counts[value]
+            upper_count = self.total - lower_count
+            difference = lower_sum / lower_count - (total_sum - lower_sum) / upper_count
+            variance = lower_count * upper_count * difference * difference
+            if variance > best_variance:
+                best_value, best_variance = next_value, variance
+        return best_value
+
+
+# returns the histogram of a pixel array (a list of rows, as used in QRCodeDetection)
+def histogramFromPixelArray(pixel_array):
+    histogram = Histogram()
+    for row in pixel_array:
+        histogram.addRow(row)
+    return histogram
+
+
+# Returns one histogram per channel from rows of interleaved values (such as the RGB rows read by imageIO.png),
+# in a single pass over the rows: no more than one row is held at a time.
+def histogramsFromRows(rows, planes = 1):
+    histograms = [Histogram() for channel in range(planes)]
+    for row in rows:
+        if planes == 1:
+            histograms[0].addRow(row)
+            continue
+        for channel, histogram in enumerate(histograms):
+            histogram.addRow(row[channel::planes])
+    return histograms
+
+
+# Reads a png file row by row, and returns the histograms of its red, green and blue channels,
+# or with greyscale=True a list holding the histogram of its greyscale (luma) values.
+# The image is never held in memory as a whole.
+def histogramsFromPNG(filename, greyscale = False):
+    (image_width, image_height, rows, info) = imageIO.png.Reader(filename=filename).asRGB8()
+    if greyscale:
+        return histogramsFromRows(imageIO.png.luma_rows(rows, image_width, 3, 8))
+    return histogramsFromRows(rows, 3)
@@ -1,6 +1,7 @@
 from matplotlib import pyplot
 
 import imageIO.png
+from Histogram import histogramFromPixelArray
 
 # this function reads an RGB color png file and returns width, height, as well as pixel arrays for r,g,b
 def readRGBImageToSeparatePixelArrays(input_filename):
@@ -57,11 +58,12 @@ def main():
     #pyplot.show()
 
     nr_bins = 64
-    dummy_histogram = [0.0 for i in range(nr_bins)]
-    print(dummy_histogram)
+    histogram = histogramFromPixelArray(pixel_array)
+    print("min={}, max={}, 5th percentile={}, 95th percentile={}".format(
+        histogram.minimum(), histogram.maximum(), histogram.percentile(5), histogram.percentile(95)))
 
     axs1[1].set_title('Histogram')
-    axs1[1].bar(range(nr_bins), dummy_histogram)
+    axs1[1].bar(range(nr_bins), histogram.bins(nr_bins))
 
     pyplot.show()
 
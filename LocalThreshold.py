@@ -0,0 +1,102 @@
+
+import collections
+import itertools
+import math
+import operator
+
+import imageIO.png
+
+LOCAL_METHODS = ("mean", "sauvola")
+
+
+# Local threshold modes are a method of localThresholdRows, "mean" or "sauvola", optionally followed by the
+# window size, an odd number such as "sauvola45". Returns (method, window), or None if threshold isn't one.
+def localThresholdMode(threshold, default_window = 31):
+    for method in LOCAL_METHODS:
+        if threshold.startswith(method) and (threshold == method or threshold[len(method):].isdigit()):
+            return method, int(threshold[len(method):] or default_window)
+    return None
+
+
+# Thresholds rows of values against a threshold computed for each pixel from the window x window pixels around it
+# (fewer at the borders), and yields rows of 255 (at or above its threshold) and 0, like computeThresholdGE.
+# Bright values are the foreground, as in an edge image:
+#     "mean":     the threshold is the local mean + offset
+#     "sauvola":  Sauvola's threshold on the inverted values, max_value - (max_value - mean) * (1 + k * (std / r - 1)),
+#                 which rises towards max_value * k over flat dark areas, so noise there isn't picked up
+# The local sums of the values and their squares come from a summed-area table that is only kept for the rows
+# in the window: column sums over the window rows, updated as a row enters and leaves, and prefix sums along
+# each row. A pixel's threshold then costs the same whatever the window size, and rows are read and yielded
+# one at a time, holding no more than window rows.
+# The window is centred on the pixel, so window must be odd; anything else raises ValueError.
+def localThresholdRows(rows, width, window = 31, method = "sauvola", k = 0.2, offset = 10, r = 128, max_value = 255):
+    if method not in LOCAL_METHODS:
+        raise ValueError("unknown local threshold method {!r}, expected one of {}".format(method, LOCAL_METHODS))
+    if window < 1 or window % 2 == 0:
+        raise ValueError("local threshold window must be an odd number of pixels, not {}".format(window))
+    return thresholdedRows(rows, width, window, method, k, offset, r, max_value)
+
+
+# the generator of localThresholdRows, for arguments that have been checked
+def thresholdedRows(rows, width, window, method, k, offset, r, max_value):
+    radius = window // 2
+    # the columns x0 to x1 (not included) of the window around each column, and how many there are
+    x0 = [max(0, x - radius) for x in range(width)]
+    x1 = [min(width, x + radius + 1) for x in range(width)]
+    columns = list(map(operator.sub, x1, x0))
+
+    column_sums = [0] * width
+    column_squares = [0] * width
+    window_rows = collections.deque()
+    first = 0
+
+    def thresholdRow(y):
+        nonlocal first, column_sums, column_squares
+        # drop the rows above the window of row y
+        while first < y - radius:
+            row, squares = window_rows.popleft()
+            column_sums = list(map(operator.sub, column_sums, row))
+            column_squares = list(map(operator.sub, column_squares, squares))
+            first += 1
+        sums = list(itertools.accumulate(column_sums, initial=0))
+        squares = list(itertools.accumulate(column_squares, initial=0))
+        window_sums = map(operator.sub, map(sums.__getitem__, x1), map(sums.__getitem__, x0))
+        window_squares = map(operator.sub, map(squares.__getitem__, x1), map(squares.__getitem__, x0))
+        nr_rows = len(window_rows)
+        result = []
+        for pixel, total, total_squares, nr_columns in zip(window_rows[y - first][0], window_sums, window_squares,
+                                                            columns):
+            count = nr_rows * nr_columns
+            mean = total / count
+            if method == "mean":
+                threshold = mean + offset
+            else:
+                deviation = math.sqrt(max(0, total_squares / count - mean * mean))
+                threshold = max_value - (max_value - mean) * (1 + k * (deviation / r - 1))
+            result.append(255 if pixel >= threshold else 0)
+        return result
+
+    y = 0
+    for row in rows:
+        row = list(row)
+        squares = [value * value for value in row]
+        window_rows.append((row, squares))
+        column_sums = list(map(operator.add, column_sums, row))
+        column_squares = list(map(operator.add, column_squares, squares))
+        # the window of row y is complete once the row radius below it has been read
+        if len(window_rows) + first - 1 >= y + radius:
+            yield thresholdRow(y)
+            y += 1
+    while y < first + len(window_rows):
+        yield thresholdRow(y)
+        y += 1
+
+
+# Reads a png file row by row, thresholds its greyscale (luma) values locally (see localThresholdRows)
+# and writes the result as a 1 bit png file. Only the rows in the window are held in memory.
+def localThresholdPNG(input_filename, output_filename, window = 31, method = "sauvola"):
+    (image_width, image_height, rows, info) = imageIO.png.Reader(filename=input_filename).asRGB8()
+    threshold_rows = localThresholdRows(imageIO.png.luma_rows(rows, image_width, 3, 8), image_width, window, method)
+    writer = imageIO.png.Writer(image_width, image_height, greyscale=True, bitdepth=1)
+    with open(output_filename, "wb") as file:
+        writer.write(file, ([value >> 7 for value in row] for row in threshold_rows))
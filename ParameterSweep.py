@@ -0,0 +1,169 @@
+
+import argparse
+import concurrent.futures
+import itertools
+import math
+import sys
+import time
+
+from LocalThreshold import localThresholdMode
+from PipelineGraph import DETECTION_DEFAULTS, buildDetectionGraph
+
+# The swept parameters, in the order their stages run. Every configuration is a run of the detection graph of
+# PipelineGraph, which caches each stage's result, so configurations that share the leading parameters share
+# that part of the pipeline, and it is computed only once per image.
+SWEEP_PARAMETERS = list(DETECTION_DEFAULTS)
+
+
+# the order values of a parameter are run in: numbers in increasing order, then anything else,
+# such as the automatic threshold modes
+def levelOrder(value):
+    if isinstance(value, str):
+        return (1, 0, value)
+    return (0, value, "")
+
+
+# the order configurations are run in: by their parameters in pipeline order, so that configurations sharing
+# a prefix run one after the other, while its results are still in the cache
+def configurationOrder(configuration):
+    return [levelOrder(configuration[parameter]) for parameter in SWEEP_PARAMETERS]
+
+
+# returns the list of configurations (dictionaries of SWEEP_PARAMETERS) in a grid, which is either a dictionary
+# of parameter -> list of values (every combination is swept) or already a list of configurations;
+# parameters not given keep their DETECTION_DEFAULTS value
+def expandGrid(grid):
+    if isinstance(grid, dict):
+        values = [grid.get(parameter, [DETECTION_DEFAULTS[parameter]]) for parameter in SWEEP_PARAMETERS]
+        return [dict(zip(SWEEP_PARAMETERS, combination)) for combination in itertools.product(*values)]
+    return [dict(DETECTION_DEFAULTS, **configuration) for configuration in grid]
+
+
+# Runs every configuration on one image through one detection graph, and returns one row per configuration
+# with its bounding box, the threshold value it used (the value an automatic mode such as "otsu" chose) and
+# seconds: the time the stages of the configuration would take on their own (see PipelineGraph.pathSeconds).
+# A configuration where a stage raises an exception gets a row with no bbox and the error instead, and the
+# seconds of the run that failed. Also returns the wall time of the whole sweep.
+def sweepImage(image, configurations):
+    name, pixel_array_r, pixel_array_g, pixel_array_b, image_width, image_height = image
+    graph = buildDetectionGraph()
+    sources = {"red": pixel_array_r, "green": pixel_array_g, "blue": pixel_array_b}
+    rows = []
+    start = time.perf_counter()
+    for configuration in sorted(configurations, key=configurationOrder):
+        run_start = time.perf_counter()
+        try:
+            values = graph.run(sources, image_width, image_height, configuration, ["bbox", "threshold_value"])
+        except Exception as error:
+            rows.append(dict(configuration, image=name, bbox=None, seconds=time.perf_counter() - run_start,
+                             error="{}: {}".format(type(error).__name__, error)))
+            continue
+        rows.append(dict(configuration, image=name, bbox=values["bbox"], threshold_value=values["threshold_value"],
+                         seconds=graph.pathSeconds("bbox")))
+    wall_seconds = time.perf_counter() - start
+    return rows, wall_seconds
+
+
+# Sweeps a grid (see expandGrid) over images, each a tuple (name, red, green, blue, width, height) of pixel arrays.
+# Images are swept in parallel in max_workers processes (in this process when max_workers is 1).
+# Returns the rows of every image (see sweepImage) and the wall time of each image's sweep by name.
+def runSweep(images, grid, max_workers = None):
+    configurations = expandGrid(grid)
+    rows = []
+    wall_seconds = {}
+    if max_workers == 1:
+        results = [sweepImage(image, configurations) for image in images]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+            results = list(executor.map(sweepImage, images, itertools.repeat(configurations)))
+    for image, (image_rows, seconds) in zip(images, results):
+        rows += image_rows
+        wall_seconds[image[0]] = seconds
+    return rows, wall_seconds
+
+
+def formatTable(rows, wall_seconds):
+    lines = ["{:<24} {:>5} {:>9} {:>6} {:>5}  {:<22} {:>9}".format(
+        "image", "blur", "threshold", "dilate", "erode", "bbox", "seconds")]
+    for row in rows:
+        threshold = row["threshold"]
+        if row.get("threshold_value", threshold) != threshold:
+            threshold = "{}={}".format(threshold, row["threshold_value"])
+        lines.append("{:<24} {:>5} {:>9} {:>6} {:>5}  {:<22} {:>9.3f}".format(
+            row["image"][:24], row["blur_iterations"], threshold, row["dilate_iterations"],
+            row["erode_iterations"], str(row["bbox"]) if row["bbox"] else row["error"][:22], row["seconds"]))
+    for name, seconds in wall_seconds.items():
+        separate = sum(row["seconds"] for row in rows if row["image"] == name)
+        lines.append("{}: swept in {:.3f}s, {:.3f}s as separate runs".format(name, seconds, separate))
+    return "\n".join(lines)
+
+
+# reads a png file into (name, red, green, blue, width, height), keeping only the centre crop x crop pixels if given
+def loadImage(filename, crop = None):
+    import QRCodeDetection
+
+    (image_width, image_height, r, g, b) = QRCodeDetection.readRGBImageToSeparatePixelArrays(filename)
+    if crop:
+        top = max(0, (image_height - crop) // 2)
+        left = max(0, (image_width - crop) // 2)
+        r, g, b = ([row[left:left + crop] for row in channel[top:top + crop]] for channel in (r, g, b))
+        image_width = min(image_width, crop)
+        image_height = min(image_height, crop)
+    return (filename, r, g, b, image_width, image_height)
+
+
+# parses a --threshold value: an edge threshold (an integer, or a decimal number such as 70.5), "otsu", "p" and
+# a percentile between 0 and 100 such as p90, or a local threshold mode with an odd window such as sauvola45
+# (see LocalThreshold.localThresholdMode); anything else is an argparse error
+def parseThreshold(text):
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        value = float(text)
+    except ValueError:
+        value = None
+    if value is not None and math.isfinite(value):
+        return value
+    if text == "otsu":
+        return text
+    if text.startswith("p"):
+        try:
+            if 0 <= float(text[1:]) <= 100:
+                return text
+        except ValueError:
+            pass
+    mode = localThresholdMode(text)
+    if mode is not None and mode[1] % 2 == 1:
+        return text
+    raise argparse.ArgumentTypeError("invalid threshold {!r}, expected a number, otsu, p and a percentile such as "
+                                     "p90, or mean or sauvola and an odd window such as sauvola45".format(text))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Sweep the QR code detection parameters over images.")
+    parser.add_argument("images", nargs="+", help="png files")
+    parser.add_argument("--blur", type=int, nargs="+", default=[2], help="box averaging passes")
+    parser.add_argument("--threshold", type=parseThreshold, nargs="+", default=[70],
+                        help="edge thresholds, or automatic modes: otsu, p and a percentile such as p90, "
+                             "or a local threshold such as sauvola or mean45")
+    parser.add_argument("--dilate", type=int, nargs="+", default=[2], help="dilation passes")
+    parser.add_argument("--erode", type=int, nargs="+", default=[2], help="erosion passes")
+    parser.add_argument("--crop", type=int, help="only use the centre CROP x CROP pixels of each image")
+    parser.add_argument("--workers", type=int, help="processes to sweep images in (default: one per CPU)")
+    args = parser.parse_args(argv[1:])
+
+    grid = {
+        "blur_iterations": args.blur,
+        "threshold": args.threshold,
+        "dilate_iterations": args.dilate,
+        "erode_iterations": args.erode,
+    }
+    images = [loadImage(filename, args.crop) for filename in args.images]
+    rows, wall_seconds = runSweep(images, grid, args.workers)
+    print(formatTable(rows, wall_seconds))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,305 @@
+
+import collections
+import concurrent.futures
+import functools
+import hashlib
+import sys
+import time
+
+
+# A node of a pipeline graph. function is called as
+#     function(*values of inputs, *values of params, image_width, image_height)
+# where inputs names other nodes (or sources given to PipelineGraph.run), and params names parameters.
+class StageNode:
+    def __init__(self, name, function, inputs, params = ()):
+        self.name = name
+        self.function = function
+        self.inputs = list(inputs)
+        self.params = list(params)
+
+
+# returns a hex digest for an image (a list of rows of numbers) or any other value given as a source
+def fingerprintValue(value):
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(value, (list, tuple)) and value and isinstance(value[0], (list, bytes, bytearray)):
+        digest.update("{}x{}".format(len(value[0]), len(value)).encode())
+        for row in value:
+            try:
+                digest.update(bytes(row))
+            except (TypeError, ValueError):
+                # not bytes sized numbers (floats, labels above 255), fall back to their text
+                digest.update(repr(row).encode())
+    else:
+        digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+
+# the types of stage result items that are immutable, so a copy of a result can share them
+SCALAR_TYPES = {int, float, bool, str, bytes, type(None)}
+
+
+# a rough size in bytes of a stage result: lists of rows (or of anything else, nested to any depth),
+# tuples of them, and dictionaries
+def estimateSize(value):
+    if isinstance(value, (list, tuple)):
+        size = sys.getsizeof(value)
+        types = set(map(type, value))
+        if types <= SCALAR_TYPES:
+            # small ints are shared, but every float is an object of its own
+            if types == {float}:
+                size += sys.getsizeof(0.0) * len(value)
+            elif float in types:
+                size += sys.getsizeof(0.0) * sum(type(item) is float for item in value)
+            return size
+        return size + sum(map(estimateSize, value))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(map(estimateSize, value.keys())) + sum(map(estimateSize, value.values()))
+    return sys.getsizeof(value)
+
+
+# a copy of a stage result that shares nothing mutable with it: lists, tuples and dictionaries are copied
+# to any depth, rows of numbers with a single list copy each
+def copyResult(value):
+    if isinstance(value, (list, tuple)):
+        if set(map(type, value)) <= SCALAR_TYPES:
+            return value[:] if isinstance(value, list) else value
+        return type(value)(map(copyResult, value))
+    if isinstance(value, dict):
+        return {key: copyResult(item) for key, item in value.items()}
+    return value
+
+
+# Least recently used cache of stage results, evicting the oldest results once their estimated size
+# goes over budget bytes. A result larger than the whole budget is not cached at all.
+# The cache keeps its own copy of each result and get returns a fresh copy (see copyResult), so a stage
+# or caller that changes a result in place can't change what later runs get from the cache.
+class ResultCache:
+    def __init__(self, budget = 512 * 2**20):
+        self.budget = budget
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default = None):
+        if key not in self.entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return copyResult(self.entries[key][0])
+
+    def put(self, key, value):
+        size = estimateSize(value)
+        if size > self.budget:
+            return
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[1]
+        self.entries[key] = (copyResult(value), size)
+        self.size += size
+        while self.size > self.budget:
+            old_key, (old_value, old_size) = self.entries.popitem(last=False)
+            self.size -= old_size
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+# calls function(*arguments), returning its result and the seconds it took
+def timedCall(function, arguments):
+    start = time.perf_counter()
+    value = function(*arguments)
+    return value, time.perf_counter() - start
+
+
+# A pipeline as a graph of StageNodes. Every result is cached under a fingerprint of the node, its parameters
+# and the fingerprints of its inputs, so running again with one parameter changed only re-executes the nodes
+# that depend on it. After each run, executed and cached list the node names that were run and reused,
+# and pathSeconds gives what a node would have cost without the cache.
+class PipelineGraph:
+    def __init__(self, nodes, defaults = None, cache = None):
+        self.nodes = collections.OrderedDict((node.name, node) for node in nodes)
+        self.defaults = dict(defaults or {})
+        self.cache = cache if cache is not None else ResultCache()
+        self.executed = []
+        self.cached = []
+        self.fingerprints = {}
+        # seconds each result took to compute, by fingerprint, kept after the result is evicted
+        self.seconds = {}
+
+    # nodes in an order where every node comes after its inputs
+    def topologicalOrder(self):
+        order = []
+        state = {}
+
+        def visit(name):
+            if state.get(name) == "done" or name not in self.nodes:
+                return
+            if state.get(name) == "visiting":
+                raise ValueError("pipeline graph has a cycle through {!r}".format(name))
+            state[name] = "visiting"
+            for input_name in self.nodes[name].inputs:
+                visit(input_name)
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name)
+        return order
+
+    # Runs the graph on sources (a dictionary of input values by name) and returns the values of targets
+    # (by default every node) as a dictionary. params override the graph's defaults.
+    # Nodes whose inputs are ready are submitted together to a ThreadPoolExecutor when max_workers is more
+    # than 1, or to executor if one is given. The stages of the detection pipeline are pure Python and hold
+    # the GIL, so in threads they still run one at a time: max_workers only helps stages that release the
+    # GIL (such as zlib or file reads). For stages running in parallel, give a ProcessPoolExecutor, which
+    # needs picklable stage functions and pays for pickling the inputs and results of every stage.
+    def run(self, sources, image_width, image_height, params = None, targets = None, max_workers = 1,
+            executor = None):
+        params = dict(self.defaults, **(params or {}))
+        order = self.topologicalOrder()
+        targets = list(targets or order)
+
+        fingerprints = {name: fingerprintValue(value) for name, value in sources.items()}
+        for name in order:
+            node = self.nodes[name]
+            for input_name in node.inputs:
+                if input_name not in fingerprints:
+                    raise ValueError("node {!r} needs {!r}, which is neither a node nor a source".format(
+                        name, input_name))
+            key = [name, repr([params[param] for param in node.params]), str((image_width, image_height))]
+            key += [fingerprints[input_name] for input_name in node.inputs]
+            fingerprints[name] = hashlib.blake2b("\0".join(key).encode(), digest_size=16).hexdigest()
+        self.fingerprints = fingerprints
+
+        # work back from the targets: a cached node stops the walk, anything else needs its inputs
+        missing = object()
+        values = dict(sources)
+        self.executed = []
+        self.cached = []
+        pending = []
+        needed = list(targets)
+        seen = set()
+        while needed:
+            name = needed.pop()
+            if name in seen or name in sources:
+                continue
+            seen.add(name)
+            value = self.cache.get(fingerprints[name], missing)
+            if value is not missing:
+                values[name] = value
+                self.cached.append(name)
+            else:
+                pending.append(name)
+                needed.extend(self.nodes[name].inputs)
+        pending.sort(key=order.index)
+
+        def arguments(node):
+            return ([values[input_name] for input_name in node.inputs] + [params[param] for param in node.params]
+                    + [image_width, image_height])
+
+        def finish(name, result):
+            (value, seconds) = result
+            values[name] = value
+            self.cache.put(fingerprints[name], value)
+            self.seconds[fingerprints[name]] = seconds
+            self.executed.append(name)
+
+        if executor is None and max_workers <= 1:
+            for name in pending:
+                node = self.nodes[name]
+                finish(name, timedCall(node.function, arguments(node)))
+        else:
+            own_executor = executor is None
+            if own_executor:
+                executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+            try:
+                running = {}
+                while pending or running:
+                    for name in [name for name in pending
+                                 if all(input_name in values for input_name in self.nodes[name].inputs)]:
+                        pending.remove(name)
+                        node = self.nodes[name]
+                        running[executor.submit(timedCall, node.function, arguments(node))] = name
+                    done, not_done = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        finish(running.pop(future), future.result())
+            finally:
+                if own_executor:
+                    executor.shutdown()
+
+        return {name: values[name] for name in targets}
+
+    # The seconds the last run would have spent on name if nothing had been cached: the time each result it
+    # depends on (itself included) took when it was computed, counting shared inputs once.
+    def pathSeconds(self, name):
+        names = set()
+        needed = [name]
+        while needed:
+            name = needed.pop()
+            if name in names or name not in self.nodes:
+                continue
+            names.add(name)
+            needed.extend(self.nodes[name].inputs)
+        return sum(self.seconds.get(self.fingerprints[name], 0) for name in names)
+
+
+# applies a stage function iterations times, such as two rounds of blurring
+def repeatStage(function, pixel_array, iterations, image_width, image_height):
+    for i in range(iterations):
+        pixel_array = function(pixel_array, image_width, image_height)
+    return pixel_array
+
+
+# one item of a node's result, such as the threshold value of (threshold value, threshold array)
+def itemStage(index, result, image_width, image_height):
+    return result[index]
+
+
+def selectStage(function, labelling, image_width, image_height):
+    (c_image, c_sizes) = labelling
+    return function(c_image, c_sizes, image_width, image_height)
+
+
+DETECTION_DEFAULTS = {
+    "blur_iterations": 2,
+    "threshold": 70,
+    "dilate_iterations": 2,
+    "erode_iterations": 2,
+}
+
+
+# The QR code detection pipeline of QRCodeDetection.computeQRCodeBoundingBox as a graph, on the sources
+# "red", "green" and "blue". The parameters are those of DETECTION_DEFAULTS. The node "bbox" is the result,
+# and "threshold_value" the value thresholded at (chosen from the edges when threshold is "otsu", "p90", ...).
+# detection is the QRCodeDetection module, imported here if not given.
+def buildDetectionGraph(detection = None, cache = None):
+    if detection is None:
+        import QRCodeDetection as detection
+    nodes = [
+        StageNode("greyscale", detection.computeRGBToGreyscale, ["red", "green", "blue"]),
+        StageNode("sobel_h", detection.computeHorizontalEdgesSobelAbsolute, ["greyscale"]),
+        StageNode("sobel_v", detection.computeVerticalEdgesSobelAbsolute, ["greyscale"]),
+        # the vertical edges go first, as in computeQRCodeBoundingBox
+        StageNode("magnitude", detection.edgeMagnitude, ["sobel_v", "sobel_h"]),
+        StageNode("blur", functools.partial(repeatStage, detection.computeBoxAveraging3x3),
+                  ["magnitude"], ["blur_iterations"]),
+        StageNode("rescale", detection.scaleTo0And255AndQuantize, ["blur"]),
+        StageNode("thresholding", detection.computeAutomaticThresholdGE, ["rescale"], ["threshold"]),
+        StageNode("threshold_value", functools.partial(itemStage, 0), ["thresholding"]),
+        StageNode("threshold", functools.partial(itemStage, 1), ["thresholding"]),
+        StageNode("dilate", functools.partial(repeatStage, detection.computeDilation8Nbh3x3FlatSE),
+                  ["threshold"], ["dilate_iterations"]),
+        StageNode("erode", functools.partial(repeatStage, detection.computeErosion8Nbh3x3FlatSE),
+                  ["dilate"], ["erode_iterations"]),
+        StageNode("label", detection.computeConnectedComponentLabeling, ["erode"]),
+        StageNode("select", functools.partial(selectStage, detection.computeBiggestComponent), ["label"]),
+        StageNode("bbox", detection.extractBoundingBox, ["select"]),
+    ]
+    return PipelineGraph(nodes, DETECTION_DEFAULTS, cache)
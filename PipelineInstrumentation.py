@@ -0,0 +1,158 @@
+
+import contextlib
+import json
+import sys
+import time
+import tracemalloc
+
+# the resource module only exists on unix, without it peak RSS is not reported
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# returns the peak resident set size of this process in bytes, or None if the platform can't tell us
+def peakResidentSetSize():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS reports bytes
+    if sys.platform == "darwin":
+        return peak
+    return peak * 1024
+
+
+# Records wall time, CPU time and memory allocated (via tracemalloc) for each stage of a pipeline.
+# The peak resident set size is the most the whole process has ever held, not a figure for any one stage,
+# so it is only reported with the totals, as process_peak_rss_bytes.
+# Use it as
+#     instrumentation = PipelineInstrumentation()
+#     with instrumentation.stage("read"):
+#         ...
+#     print(instrumentation.formatTable())
+# A stage that runs several times (such as two rounds of blurring) gets one record per run.
+# Values the pipeline chooses as it runs (such as an automatic threshold) are recorded with annotate.
+class PipelineInstrumentation:
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.records = []
+        self.annotations = {}
+        self.started_tracing = False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracing = True
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            record = {
+                "stage": name,
+                "wall_seconds": time.perf_counter() - wall_start,
+                "cpu_seconds": time.process_time() - cpu_start,
+                "allocated_bytes": None,
+                "peak_allocated_bytes": None,
+            }
+            if self.trace_memory:
+                memory_after, memory_peak = tracemalloc.get_traced_memory()
+                # memory still held at the end of the stage (usually its result), and the most held during it
+                record["allocated_bytes"] = memory_after - memory_before
+                record["peak_allocated_bytes"] = memory_peak - memory_before
+            self.records.append(record)
+
+    def annotate(self, name, value):
+        self.annotations[name] = value
+
+    # stops tracemalloc again if we were the ones that started it
+    def close(self):
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def report(self):
+        total = {
+            "wall_seconds": sum(record["wall_seconds"] for record in self.records),
+            "cpu_seconds": sum(record["cpu_seconds"] for record in self.records),
+            "process_peak_rss_bytes": peakResidentSetSize(),
+        }
+        return {"stages": list(self.records), "total": total, "annotations": dict(self.annotations)}
+
+    def toJSON(self, indent=2):
+        return json.dumps(self.report(), indent=indent)
+
+    def formatTable(self):
+        header = "{:<12} {:>10} {:>10} {:>14} {:>14}".format(
+            "stage", "wall ms", "cpu ms", "allocated KiB", "peak KiB")
+        lines = [header, "-" * len(header)]
+
+        def kib(value):
+            return "-" if value is None else "{:.1f}".format(value / 1024)
+
+        def mib(value):
+            return "-" if value is None else "{:.1f}".format(value / 2**20)
+
+        for record in self.records:
+            lines.append("{:<12} {:>10.1f} {:>10.1f} {:>14} {:>14}".format(
+                record["stage"], record["wall_seconds"] * 1000, record["cpu_seconds"] * 1000,
+                kib(record["allocated_bytes"]), kib(record["peak_allocated_bytes"])))
+        total = self.report()["total"]
+        lines.append("-" * len(header))
+        lines.append("{:<12} {:>10.1f} {:>10.1f}".format(
+            "total", total["wall_seconds"] * 1000, total["cpu_seconds"] * 1000))
+        lines.append("process peak RSS MiB: {}".format(mib(total["process_peak_rss_bytes"])))
+        for name, value in self.annotations.items():
+            lines.append("{}: {}".format(name, value))
+        return "\n".join(lines)
+
+
+# Stands in for PipelineInstrumentation when nothing should be recorded. Every stage is the same
+# do-nothing context manager, so an uninstrumented run only pays for entering and leaving it.
+class NullInstrumentation:
+    _null_stage = contextlib.nullcontext()
+
+    def stage(self, name):
+        return self._null_stage
+
+    def annotate(self, name, value):
+        pass
+
+    def close(self):
+        pass
+
+    def report(self):
+        return {"stages": [], "total": {}, "annotations": {}}
+
+
+# runs the QR code detection pipeline with instrumentation and prints the report,
+# as a table or (with --json) as JSON, also (for the stages run so far) if the pipeline fails
+def main(argv):
+    import QRCodeDetection
+
+    instrumentation = PipelineInstrumentation()
+
+    def printReport():
+        if "--json" in argv[1:]:
+            print(instrumentation.toJSON())
+        else:
+            print(instrumentation.formatTable())
+
+    try:
+        QRCodeDetection.main(instrumentation)
+    except BaseException:
+        # report the stages up to (and including) the one that failed
+        printReport()
+        raise
+    finally:
+        instrumentation.close()
+    printReport()
+
+
+if __name__ == "__main__":
+    main(sys.argv)
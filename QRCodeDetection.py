@@ -7,6 +7,12 @@ from PIL import Image
 
 import imageIO.png
 import math
+import zlib
+
+from Histogram import histogramFromPixelArray
+from LocalThreshold import localThresholdMode, localThresholdRows
+from TileActivity import activeRegions, activeTiles, cropRegion, downsample, tileVariances
+from PipelineInstrumentation import NullInstrumentation
 
 
 
@@ -71,13 +77,21 @@ def prepareRGBImageForImshowFromIndividualArrays(r,g,b,w,h):
     return rgbImage
     
 
-# This method takes a greyscale pixel array and writes it into a png file
+# This method takes a greyscale pixel array (integers between 0 and 255) and writes it into a png file
 def writeGreyscalePixelArraytoPNG(output_filename, pixel_array, image_width, image_height):
-    # now write the pixel array as a greyscale png
-    file = open(output_filename, 'wb')  # binary mode is important
-    writer = imageIO.png.Writer(image_width, image_height, greyscale=True)
-    writer.write(file, pixel_array)
-    file.close() 
+    # the rows are joined into one buffer, which the writer slices scanlines out of without per pixel work
+    pixel_buffer = bytearray().join(bytes(row) for row in pixel_array)
+    with open(output_filename, 'wb') as file:  # binary mode is important
+        writer = imageIO.png.Writer(image_width, image_height, greyscale=True)
+        writer.write(file, pixel_buffer)
+
+# This method takes a binary pixel array (such as a threshold or morphology result, any non-zero value
+# counts as set) and writes it into a 1 bit greyscale png file, which is much smaller than an 8 bit one
+def writeBinaryMaskPixelArraytoPNG(output_filename, pixel_array, image_width, image_height):
+    with open(output_filename, 'wb') as file:  # binary mode is important
+        # run length encoding compresses the long runs of set and unset pixels well, and quickly
+        writer = imageIO.png.Writer(image_width, image_height, greyscale=True, bitdepth=1, strategy=zlib.Z_RLE)
+        writer.write_packed(file, imageIO.png.pack_mask_rows(pixel_array))
     
 def computeRGBToGreyscale(pixel_array_r, pixel_array_g, pixel_array_b, image_width, image_height):
     greyscale_pixel_array = createInitializedGreyscalePixelArray(image_width, image_height)
@@ -91,30 +105,54 @@ def computeRGBToGreyscale(pixel_array_r, pixel_array_g, pixel_array_b, image_wid
             greyscale_pixel_array[i][j] = round(grey)
     return greyscale_pixel_array 
 
-def scaleTo0And255AndQuantize(pixel_array, image_width, image_height):
+# Stretches the values of pixel_array linearly so that the smallest becomes 0 and the largest 255, rounding to
+# integers. With clip_percent, the clip_percent and 100 - clip_percent percentiles (from one histogram pass)
+# are stretched to 0 and 255 instead, and values beyond them are clipped, so a few outliers don't flatten the contrast.
+# value_range gives the (smallest, largest) values to stretch instead, for an image processed in pieces.
+# For 8 bit values the result depends only on the value, so it is looked up in a table with bytes.translate;
+# floating point values (blurred edges) are quantized one by one.
+def scaleTo0And255AndQuantize(pixel_array, image_width, image_height, clip_percent = 0, value_range = None):
     
-    scale_array = createInitializedGreyscalePixelArray(image_width, image_height)
-   t_value = computeMinAndMaxValues(pixel_array, image_width, image_height)
+    if not pixel_array or not pixel_array[0]:
+        return createInitializedGreyscalePixelArray(image_width, image_height)
+    if value_range is not None:
+        t_value = value_range
+    elif clip_percent:
+        histogram = histogramFromPixelArray(pixel_array)
+        t_value = (histogram.percentile(clip_percent), histogram.percentile(100 - clip_percent))
+    else:
+        t_value = (min(map(min, pixel_array)), max(map(max, pixel_array)))
     
     if (t_value[0] == t_value[1]):
-        return scale_array
-    
-    for i in range(image_height):
-        for j in range(image_width):
-            pixel = pixel_array[i][j]
-            scale_array[i][j] = round((pixel - t_value[0]) * ((255 - 0) / (t_value[1] - t_value[0])) + 0)
-    return scale_array 
+        return createInitializedGreyscalePixelArray(image_width, image_height)
+
+    scale = (255 - 0) / (t_value[1] - t_value[0])
+
+    def quantize(pixel):
+        return min(255, max(0, round((pixel - t_value[0]) * scale + 0)))
+
+    try:
+        byte_rows = [bytes(row) for row in pixel_array]
+    except (TypeError, ValueError):
+        # not 8 bit values
+        byte_rows = None
+    if byte_rows is not None:
+        table = bytes(quantize(value) for value in range(256))
+        return [list(row.translate(table)) for row in byte_rows]
+
+    if clip_percent:
+        return [[quantize(pixel) for pixel in row] for row in pixel_array]
+    low = t_value[0]
+    return [[round((pixel - low) * scale + 0) for pixel in row] for row in pixel_array]
 
 def stretchContrast(pixel_array, image_width, image_height):
-    min_value = 255
-    max_value = 0
+    histogram = histogramFromPixelArray(pixel_array)
+    if histogram.total == 0:
+        return (255, 0)
 
-    for y in range(image_height):
-        for x in range(image_width):
-            if pixel_array[y][x] < min_value:
-                min_value = pixel_array[y][x]
-            if pixel_array[y][x] > max_value:
-                max_value = pixel_array[y][x]
+    # the range always includes 255 as the lowest minimum and 0 as the highest maximum
+    min_value = min(255, histogram.minimum())
+    max_value = max(0, histogram.maximum())
 
     return(min_value, max_value)
 
@@ -172,15 +210,47 @@ def computeBoxAveraging3x3(pixel_array, image_width, image_height):
             if x == 0 or y == 0 or x == image_height - 1 or y == image_width - 1:
                 row.append(0) 
             else: 
-                a = (pixel_array[y - 1][x - 1]) + (pixel_array[y - 1][x]) + (pixel_array[y - 1][x + 1])
-                b = (pixel_array[y][x - 1]) + (pixel_array[y][x]) + (pixel_array[y][x + 1])
-                c = (pixel_array[y + 1][x - 1]) + (pixel_array[y + 1][x]) + (pixel_array[y + 1][x + 1])
+                a = (pixel_array[x - 1][y - 1]) + (pixel_array[x - 1][y]) + (pixel_array[x - 1][y + 1])
+                b = (pixel_array[x][y - 1]) + (pixel_array[x][y]) + (pixel_array[x][y + 1])
+                c = (pixel_array[x + 1][y - 1]) + (pixel_array[x + 1][y]) + (pixel_array[x + 1][y + 1])
                 row.append((a + b + c) / 9)
         greyscale_edges.append(row)
     return greyscale_edges
              
 
+# Returns the value to threshold pixel_array at: threshold itself if it is a number, otherwise a value chosen
+# from one histogram pass over pixel_array. threshold is "otsu" for Otsu's method, or "p" and a percentile,
+# such as "p90" for the smallest value that at least 90% of the pixels are less than or equal to.
+# A local threshold mode (see localThresholdMode) is returned as it is, computeThresholdGE handles it.
+def computeThresholdValue(pixel_array, threshold, image_width, image_height):
+    if not isinstance(threshold, str) or localThresholdMode(threshold) is not None:
+        return threshold
+    histogram = histogramFromPixelArray(pixel_array)
+    if threshold == "otsu":
+        threshold_value = histogram.otsu()
+    elif threshold.startswith("p"):
+        threshold_value = histogram.percentile(float(threshold[1:]))
+    else:
+        raise ValueError("unknown threshold {!r}, expected a number, 'otsu' or 'p' and a percentile".format(threshold))
+    # an empty image, nothing to threshold
+    if threshold_value is None:
+        return 0
+    return threshold_value
+
+# This method thresholds each pixel against the mean (or Sauvola's threshold) of the window x window pixels
+# around it, which copes with uneven lighting where a single threshold for the whole image doesn't.
+def computeLocalThresholdGE(pixel_array, method, window, image_width, image_height):
+    return list(localThresholdRows(pixel_array, image_width, window, method))
+
+# threshold_value can also be a local threshold mode (see localThresholdMode)
 def computeThresholdGE(pixel_array, threshold_value, image_width, image_height):
+    if isinstance(threshold_value, str):
+        mode = localThresholdMode(threshold_value)
+        if mode is None:
+            raise ValueError("unknown local threshold {!r}, expected 'mean' or 'sauvola' and a window size".format(
+                threshold_value))
+        return computeLocalThresholdGE(pixel_array, mode[0], mode[1], image_width, image_height)
+
     threshold_array = []
     
     for i in range(image_height): 
@@ -193,10 +263,16 @@ def computeThresholdGE(pixel_array, threshold_value, image_width, image_height):
         threshold_array.append(row)
     return threshold_array 
 
+# Thresholds pixel_array with any threshold mode: a number, an automatic mode (see computeThresholdValue)
+# or a local mode (see localThresholdMode). Returns (threshold value used, threshold array).
+def computeAutomaticThresholdGE(pixel_array, threshold, image_width, image_height):
+    threshold_value = computeThresholdValue(pixel_array, threshold, image_width, image_height)
+    return threshold_value, computeThresholdGE(pixel_array, threshold_value, image_width, image_height)
+
 def computeDilation8Nbh3x3FlatSE(pixel_array, image_width, image_height):
     dilation = createInitializedGreyscalePixelArray(image_width, image_height)
-    for i in range(image_width-1):
-        for j in range(image_height-1):
+    for i in range(image_height-1):
+        for j in range(image_width-1):
             dilation[i][j] = 0
             
     for i in range(image_height):
@@ -204,20 +280,23 @@ def computeDilation8Nbh3x3FlatSE(pixel_array, image_width, image_height):
             if pixel_array[i][j] == pixel_array[0][j] and pixel_array[i][j] != 0:
                 for x in range(0, 2):
                     for y in range(0, 2):
-                        dilation[i + x][j + y] = 1
+                        if i + x < image_height and j + y < image_width:
+                            dilation[i + x][j + y] = 1
                         
             elif pixel_array[i][j] != 0:
                 for x in range(-1, 2):
                     for y in range(-1, 2):
-                        dilation[i + x][j + y] = 1
+                        # only the neighbours inside the image
+                        if 0 <= i + x < image_height and 0 <= j + y < image_width:
+                            dilation[i + x][j + y] = 1
                 
     
     return dilation 
 
 def computeErosion8Nbh3x3FlatSE(pixel_array, image_width, image_height):
     erosion = createInitializedGreyscalePixelArray(image_width, image_height)
-    for i in range(image_width-1):
-        for j in range(image_height-1):
+    for i in range(image_height-1):
+        for j in range(image_width-1):
             erosion[i][j] = 0
     
 
@@ -355,7 +434,7 @@ def computeBiggestComponent(c_image, c_sizes, image_width, image_height):
     return big_array
     
 def extractBoundingBox(pixel_array, image_width, image_height):
-    min_x = image_height
+    min_x = image_width
     min_y = image_height
     max_x = 0
     max_y = 0
@@ -375,44 +454,186 @@ def extractBoundingBox(pixel_array, image_width, image_height):
 
     return min_x, min_y, max_x, max_y
 
-def main():
+# This method runs the detection pipeline on the three colour pixel arrays and returns the bounding box
+# (min x, min y, max x, max y) of the largest connected edge region, which should be the QR code.
+# instrumentation records the time and memory of each stage (see PipelineInstrumentation.py),
+# by default nothing is recorded. The smoothed edges are thresholded at threshold, a number, an automatic
+# mode of computeThresholdValue such as "otsu", or a local mode such as "sauvola"; the value used is recorded
+# as the annotation "threshold".
+# With dump_prefix, the intermediate images are written to png files for inspection: the smoothed edges as
+# <dump_prefix>_edges.png, and the threshold, dilation and erosion results as 1 bit masks
+# (<dump_prefix>_threshold.png and so on). They are written outside the timed stages.
+def computeQRCodeBoundingBox(px_array_r, px_array_g, px_array_b, image_width, image_height, instrumentation = None,
+                             threshold = 70, dump_prefix = None):
+    if instrumentation is None:
+        instrumentation = NullInstrumentation()
+    stage = instrumentation.stage
+
+    def dump(name, pixel_array, write = writeBinaryMaskPixelArraytoPNG):
+        if dump_prefix is not None:
+            write("{}_{}.png".format(dump_prefix, name), pixel_array, image_width, image_height)
+
+    with stage("greyscale"):
+        greyscale_array = computeRGBToGreyscale(px_array_r, px_array_g, px_array_b, image_width, image_height)
+    with stage("rescale"):
+        scale_array = scaleTo0And255AndQuantize(greyscale_array, image_width, image_height)
+
+    with stage("sobel_h"):
+        horizontal_array = computeHorizontalEdgesSobelAbsolute(greyscale_array, image_width, image_height)
+
+    with stage("sobel_v"):
+        vertical_array = computeVerticalEdgesSobelAbsolute(greyscale_array, image_width, image_height)
+
+    with stage("magnitude"):
+        edge_magnitude_array = edgeMagnitude(vertical_array, horizontal_array, image_width, image_height)
+
+    smooth_edges = edge_magnitude_array
+    for i in range(2):
+        with stage("blur"):
+            smooth_edges = computeBoxAveraging3x3(smooth_edges, image_width, image_height)
+    with stage("rescale"):
+        smooth_edges = scaleTo0And255AndQuantize(smooth_edges, image_width, image_height)
+    dump("edges", smooth_edges, writeGreyscalePixelArraytoPNG)
+
+    with stage("threshold"):
+        (threshold_value, threshold_array) = computeAutomaticThresholdGE(smooth_edges, threshold, image_width,
+                                                                         image_height)
+        instrumentation.annotate("threshold", threshold_value)
+    dump("threshold", threshold_array)
+
+    with stage("dilate"):
+        dilation_array = computeDilation8Nbh3x3FlatSE(threshold_array, image_width, image_height)
+    with stage("dilate"):
+        dilation_array = computeDilation8Nbh3x3FlatSE(dilation_array, image_width, image_height)
+    dump("dilation", dilation_array)
+    with stage("erode"):
+        erosion_array = computeErosion8Nbh3x3FlatSE(dilation_array, image_width, image_height)
+    with stage("erode"):
+        erosion_array = computeErosion8Nbh3x3FlatSE(erosion_array, image_width, image_height)
+    dump("erosion", erosion_array)
+
+
+    with stage("label"):
+        (c_image, c_sizes) = computeConnectedComponentLabeling(erosion_array, image_width, image_height)
+
+    with stage("select"):
+        biggest_component = computeBiggestComponent(c_image, c_sizes, image_width, image_height)
+
+    with stage("bbox"):
+        return extractBoundingBox(biggest_component, image_width, image_height)
+
+# This method runs the detection pipeline like computeQRCodeBoundingBox, but only on the parts of the image that
+# aren't flat colour. A cheap pre-pass measures the variance of the greyscale image, downsampled by sample, in
+# tile_size x tile_size tiles, and the tiles with a variance above min_variance are active (features thinner
+# than sample pixels can be missed). The pipeline then runs on each group of active tiles and halo pixels around
+# it (see TileActivity.py), at its own size and never past the image, and the biggest component of all of them
+# gives the bounding box, in the coordinates of the whole image. The edges of all the groups are rescaled to the
+# same range, and an automatic threshold is chosen from all of them together. When the groups cover max_coverage
+# of the image or more, processing them costs about as much as the whole image, and computeQRCodeBoundingBox
+# runs on the whole image instead.
+# The numbers of active and all tiles are recorded as the annotation "active_tiles".
+def computeQRCodeBoundingBoxOnActiveTiles(px_array_r, px_array_g, px_array_b, image_width, image_height,
+                                          instrumentation = None, threshold = 70, tile_size = 32, halo = 16,
+                                          min_variance = 100, sample = 4, max_coverage = 0.5):
+    if instrumentation is None:
+        instrumentation = NullInstrumentation()
+    stage = instrumentation.stage
+
+    with stage("activity"):
+        small_arrays = [downsample(pixel_array, sample) for pixel_array in (px_array_r, px_array_g, px_array_b)]
+        small_width = len(small_arrays[0][0])
+        small_height = len(small_arrays[0])
+        small_greyscale = computeRGBToGreyscale(*small_arrays, small_width, small_height)
+        variances = tileVariances(small_greyscale, small_width, small_height, max(1, tile_size // sample))
+        tiles = activeTiles(variances, min_variance)
+        regions = activeRegions(tiles, max(1, tile_size // sample) * sample, halo, image_width, image_height)
+        # the regions don't overlap, mergeBoxes has merged any that touch
+        area = sum((box[2] - box[0]) * (box[3] - box[1]) for box in regions)
+    instrumentation.annotate("active_tiles", "{} of {}".format(len(tiles), len(variances) * len(variances[0])))
+    if not regions or area >= max_coverage * image_width * image_height:
+        return computeQRCodeBoundingBox(px_array_r, px_array_g, px_array_b, image_width, image_height,
+                                        instrumentation, threshold)
+
+    smooth_regions = []
+    for box in regions:
+        region_width = box[2] - box[0]
+        region_height = box[3] - box[1]
+        with stage("greyscale"):
+            greyscale_array = computeRGBToGreyscale(cropRegion(px_array_r, box), cropRegion(px_array_g, box),
+                                                    cropRegion(px_array_b, box), region_width, region_height)
+        with stage("sobel_h"):
+            horizontal_array = computeHorizontalEdgesSobelAbsolute(greyscale_array, region_width, region_height)
+        with stage("sobel_v"):
+            vertical_array = computeVerticalEdgesSobelAbsolute(greyscale_array, region_width, region_height)
+        with stage("magnitude"):
+            smooth_edges = edgeMagnitude(vertical_array, horizontal_array, region_width, region_height)
+        for i in range(2):
+            with stage("blur"):
+                smooth_edges = computeBoxAveraging3x3(smooth_edges, region_width, region_height)
+        smooth_regions.append(smooth_edges)
+
+    with stage("rescale"):
+        edge_values = [row for smooth_edges in smooth_regions for row in smooth_edges]
+        value_range = (min(map(min, edge_values)), max(map(max, edge_values)))
+        smooth_regions = [scaleTo0And255AndQuantize(smooth_edges, box[2] - box[0], box[3] - box[1],
+                                                    value_range=value_range)
+                          for box, smooth_edges in zip(regions, smooth_regions)]
+
+    with stage("threshold"):
+        threshold_value = computeThresholdValue([row for smooth_edges in smooth_regions for row in smooth_edges],
+                                                threshold, image_width, image_height)
+        instrumentation.annotate("threshold", threshold_value)
+
+    biggest = None
+    for box, smooth_edges in zip(regions, smooth_regions):
+        region_width = box[2] - box[0]
+        region_height = box[3] - box[1]
+        with stage("threshold"):
+            (threshold_value, morphology_array) = computeAutomaticThresholdGE(smooth_edges, threshold_value,
+                                                                              region_width, region_height)
+        for i in range(2):
+            with stage("dilate"):
+                morphology_array = computeDilation8Nbh3x3FlatSE(morphology_array, region_width, region_height)
+        for i in range(2):
+            with stage("erode"):
+                morphology_array = computeErosion8Nbh3x3FlatSE(morphology_array, region_width, region_height)
+        with stage("label"):
+            (c_image, c_sizes) = computeConnectedComponentLabeling(morphology_array, region_width, region_height)
+        size = max(c_sizes.values(), default=0)
+        if biggest is None or size > biggest[0]:
+            biggest = (size, box, c_image, c_sizes)
+
+    (size, box, c_image, c_sizes) = biggest
+    if size == 0:
+        # nothing found, the whole image is the biggest (background) component, as in computeQRCodeBoundingBox
+        return 0, 0, image_width - 1, image_height - 1
+    with stage("select"):
+        biggest_component = computeBiggestComponent(c_image, c_sizes, box[2] - box[0], box[3] - box[1])
+    with stage("bbox"):
+        (min_x, min_y, max_x, max_y) = extractBoundingBox(biggest_component, box[2] - box[0], box[3] - box[1])
+        return min_x + box[0], min_y + box[1], max_x + box[0], max_y + box[1]
+
+# instrumentation records the time and memory of each stage (see PipelineInstrumentation.py),
+# by default nothing is recorded; threshold is as for computeQRCodeBoundingBox.
+# With a tile_size, only the active tiles are processed (see computeQRCodeBoundingBoxOnActiveTiles).
+# Without one, dump_prefix writes the intermediate images as for computeQRCodeBoundingBox.
+def main(instrumentation = None, threshold = 70, tile_size = None, dump_prefix = None):
+    if instrumentation is None:
+        instrumentation = NullInstrumentation()
+
     filename = "./images/covid19QRCode/poster1small.png"
 
     # we read in the png file, and receive three pixel arrays for red, green and blue components, respectively
     # each pixel array contains 8 bit integer values between 0 and 255 encoding the color values
-    (image_width, image_height, px_array_r, px_array_g, px_array_b) = readRGBImageToSeparatePixelArrays(filename)
+    with instrumentation.stage("read"):
+        (image_width, image_height, px_array_r, px_array_g, px_array_b) = readRGBImageToSeparatePixelArrays(filename)
 
     pyplot.imshow(prepareRGBImageForImshowFromIndividualArrays(px_array_r, px_array_g, px_array_b, image_width, image_height))
 
-
-    greyscale_array = computeRGBToGreyscale(px_array_r, px_array_g, px_array_b, image_width, image_height)
-    scale_array = scaleTo0And255AndQuantize(greyscale_array, image_width, image_height)
-
-    horizontal_array = computeHorizontalEdgesSobelAbsolute(greyscale_array, image_width, image_height)
-
-    vertical_array = computeVerticalEdgesSobelAbsolute(greysale_array, image_width, image_height)
-
-    edge_magnitude_array = edgeMagnitude(vertical_array, horizontal_array, image_width, image_height)
-
-    smooth_edges = edge
-    for i in range(2):
-        smooth_edges = computeBoxAveraging3x3(smooth_edges, image_width, image_height)
-    smooth_edges = scaleTo0And255AndQuantize(smooth_edges, image_width, image_height)
-
-    threshold_array = computeThresholdGE(smooth_edges, 70, image_width, image_height)
-
-    dilation_array = computeDilation8Nbh3x3FlatSE(threshold_array, image_width, image_height)
-    dilation_array = computeDilation8Nbh3x3FlatSE(dilation_array, image_width, image_height)
-    erosion_array = computeErosion8Nbh3x3FlatSE(dilation_array, image_width, image_height)
-    erosion_array = computeErosion8Nbh3x3FlatSE(erosion_array, image_width, image_height)
-    morphological = erosion_array
-
-
-    (c_image, c_sizes) = computeConnectedComponentLabeling(erosion_array, image_width, image_height)
-
-    biggest_component = computeBiggestComponent(c_image, c_sizes, image_width, image_height)
-
-    minX, minY, maxX, maxY = extractBoundingBox(biggest_component, image_width, image_height) 
+    if tile_size:
+        minX, minY, maxX, maxY = computeQRCodeBoundingBoxOnActiveTiles(px_array_r, px_array_g, px_array_b, image_width, image_height, instrumentation, threshold, tile_size)
+    else:
+        minX, minY, maxX, maxY = computeQRCodeBoundingBox(px_array_r, px_array_g, px_array_b, image_width, image_height, instrumentation, threshold, dump_prefix)
     
     pyplot.imshow(prepareRGBImageForImshowFromIndividualArrays(px_array_r, px_array_g, px_array_b, image_width, image_height))
 
@@ -449,6 +670,8 @@ def main():
     # plot the current figure
     pyplot.show()
 
+    return minX, minY, maxX, maxY
+
 
 
 if __name__ == "__main__":
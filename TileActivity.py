@@ -0,0 +1,75 @@
+
+# A cheap pre-pass to find the parts of an image worth processing. Most of a poster is flat colour, where the
+# edge detection pipeline finds nothing, so the image is divided into tiles, and only the tiles whose values
+# vary (the active tiles) and a halo around them are processed. The result is sparse: a list of regions, each
+# a box (min x, min y, max x, max y), max not included, in the coordinates of the whole image, so that anything
+# found in a region's pixel array is moved back into the whole image by adding (min x, min y).
+
+
+# every factor-th pixel of every factor-th row
+def downsample(pixel_array, factor):
+    return [row[::factor] for row in pixel_array[::factor]]
+
+
+# Returns the variance of the values in each tile_size x tile_size tile (smaller at the right and bottom edges),
+# as a list of rows of tiles.
+def tileVariances(pixel_array, image_width, image_height, tile_size):
+    variances = []
+    for top in range(0, image_height, tile_size):
+        rows = pixel_array[top:top + tile_size]
+        tile_row = []
+        for left in range(0, image_width, tile_size):
+            values = [value for row in rows for value in row[left:left + tile_size]]
+            mean = sum(values) / len(values)
+            tile_row.append(sum(value * value for value in values) / len(values) - mean * mean)
+        variances.append(tile_row)
+    return variances
+
+
+# the set of (tile x, tile y) of the tiles with a variance above min_variance
+def activeTiles(variances, min_variance):
+    return {(tile_x, tile_y) for tile_y, tile_row in enumerate(variances)
+            for tile_x, variance in enumerate(tile_row) if variance > min_variance}
+
+
+# True if two boxes overlap or touch, so that something in one could be connected to something in the other
+def boxesTouch(box, other):
+    return box[0] <= other[2] and other[0] <= box[2] and box[1] <= other[3] and other[1] <= box[3]
+
+
+# merges boxes that touch until none do, each merged box being the bounding box of the ones it replaces
+def mergeBoxes(boxes):
+    boxes = list(boxes)
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        for box in boxes:
+            for index, other in enumerate(result):
+                if boxesTouch(box, other):
+                    result[index] = (min(box[0], other[0]), min(box[1], other[1]),
+                                     max(box[2], other[2]), max(box[3], other[3]))
+                    merged = True
+                    break
+            else:
+                result.append(box)
+        boxes = result
+    return boxes
+
+
+# Returns the boxes to process for a set of active tiles: groups of tiles that touch, grown by halo pixels on
+# every side (so that the filters near their edges see the same neighbourhood as in the whole image) and merged
+# where they touch.
+def activeRegions(tiles, tile_size, halo, image_width, image_height):
+    boxes = []
+    for (tile_x, tile_y) in tiles:
+        boxes.append((max(0, tile_x * tile_size - halo), max(0, tile_y * tile_size - halo),
+                      min(image_width, (tile_x + 1) * tile_size + halo),
+                      min(image_height, (tile_y + 1) * tile_size + halo)))
+    return mergeBoxes(boxes)
+
+
+# the part of pixel_array inside box
+def cropRegion(pixel_array, box):
+    (min_x, min_y, max_x, max_y) = box
+    return [row[min_x:max_x] for row in pixel_array[min_y:max_y]]
@@ -0,0 +1,116 @@
+
+import json
+import os
+
+# A baseline holds the timings of one machine and Python version. Comparing relative to the calibration
+# benchmark takes out most of the difference in overall speed, but not all of it (another CPU or Python version
+# can speed up some benchmarks more than others), so a baseline that a build is compared with has to be made
+# on the machine that runs the comparison: python -m benchmarks.BenchmarkRunner --save NAME.
+# benchmarks/baselines/reference.json is only an example, from the machine named in its "meta".
+BASELINE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+# timings shorter than this are mostly timer and scheduler noise, so they never count as regressions
+MINIMUM_SECONDS = 0.001
+# the benchmark that other timings are compared relative to (see BenchmarkRunner.benchmarkCalibration)
+CALIBRATION = "calibration"
+
+
+# name is either a path to a .json file or the name of a baseline in BASELINE_DIRECTORY
+def baselinePath(name):
+    if name.endswith(".json"):
+        return name
+    return os.path.join(BASELINE_DIRECTORY, name + ".json")
+
+
+# saves a report from BenchmarkRunner.runBenchmarks as a baseline and returns the file name
+def saveBaseline(report, name):
+    path = baselinePath(name)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+        file.write("\n")
+    return path
+
+
+def loadBaseline(name):
+    with open(baselinePath(name)) as file:
+        return json.load(file)
+
+
+# Compares the timings of two reports. Returns one row per benchmark, sorted by name, as a dictionary with
+# the baseline and current seconds, their ratio, and a status: "regression" when the current time is more than
+# threshold (a fraction, 0.35 is 35%) slower, "improvement" when it is that much faster, otherwise "ok";
+# "new" and "missing" for benchmarks in only one of the reports. The median of the repeats is compared
+# (statistic "median"), which moves less from run to run than the fastest ("seconds").
+# With normalise (and a calibration benchmark in both reports) the timings are multiples of the calibration
+# time, so that a machine that is faster or slower overall doesn't show up as a change: the "relative" timing
+# of a benchmark when both reports have one (each repeat divided by a calibration run made just before it),
+# otherwise its timing divided by the calibration timing of its report.
+def compareReports(baseline, current, threshold = 0.35, normalise = True, statistic = "median"):
+    baseline_results = baseline["results"]
+    current_results = current["results"]
+    normalise = normalise and CALIBRATION in baseline_results and CALIBRATION in current_results
+    baseline_scale = baseline_results[CALIBRATION][statistic] if normalise else 1
+    current_scale = current_results[CALIBRATION][statistic] if normalise else 1
+    rows = []
+    for name in sorted(set(baseline_results) | set(current_results)):
+        if normalise and name == CALIBRATION:
+            continue
+        row = {"name": name, "baseline": None, "current": None, "ratio": None, "normalised": normalise}
+        relative = normalise and all("relative" in results[name] for results in (baseline_results, current_results)
+                                     if name in results)
+        seconds = []
+        for key, results, scale in (("baseline", baseline_results, baseline_scale),
+                                    ("current", current_results, current_scale)):
+            if name in results:
+                seconds.append(results[name][statistic])
+                row[key] = results[name]["relative"] if relative else results[name][statistic] / scale
+
+        if row["baseline"] is None:
+            row["status"] = "new"
+        elif row["current"] is None:
+            row["status"] = "missing"
+        else:
+            row["ratio"] = row["current"] / row["baseline"] if row["baseline"] else float("inf")
+            if max(seconds) < MINIMUM_SECONDS:
+                row["status"] = "ok"
+            elif row["ratio"] > 1 + threshold:
+                row["status"] = "regression"
+            elif row["ratio"] < 1 / (1 + threshold):
+                row["status"] = "improvement"
+            else:
+                row["status"] = "ok"
+        rows.append(row)
+    return rows
+
+
+def regressions(rows):
+    return [row for row in rows if row["status"] == "regression"]
+
+
+def formatComparison(rows, baseline = None, current = None):
+    lines = []
+    # timings from different machines or Python versions can't be compared fairly unless they are normalised,
+    # so say so
+    if baseline is not None and current is not None and not any(row["normalised"] for row in rows):
+        for key in ("python", "platform"):
+            if baseline["meta"].get(key) != current["meta"].get(key):
+                lines.append("warning: baseline {} is {!r}, current is {!r}".format(
+                    key, baseline["meta"].get(key), current["meta"].get(key)))
+
+    if any(row["normalised"] for row in rows):
+        lines.append("timings are multiples of the {!r} benchmark of their report".format(CALIBRATION))
+
+    def seconds(value):
+        return "-" if value is None else "{:.4f}".format(value)
+
+    width = max([len(row["name"]) for row in rows] + [9])
+    lines.append("{:<{}} {:>10} {:>10} {:>7}  {}".format("benchmark", width, "baseline", "current", "ratio", "status"))
+    for row in rows:
+        ratio = "-" if row["ratio"] is None else "{:.2f}".format(row["ratio"])
+        lines.append("{:<{}} {:>10} {:>10} {:>7}  {}".format(
+            row["name"], width, seconds(row["baseline"]), seconds(row["current"]), ratio, row["status"]))
+    lines.append("{} regressions in {} benchmarks".format(len(regressions(rows)), len(rows)))
+    return "\n".join(lines)
@@ -0,0 +1,227 @@
+
+import argparse
+import datetime
+import io
+import operator
+import platform
+import statistics
+import sys
+import time
+from array import array
+
+import imageIO.png
+from PipelineInstrumentation import PipelineInstrumentation
+from benchmarks.BaselineComparison import (CALIBRATION, compareReports, formatComparison, loadBaseline, regressions,
+                                           saveBaseline)
+from benchmarks.SyntheticPosters import SyntheticPoster, posterSize
+
+FILTER_TYPES = [0, 1, 2, 3, 4, "adaptive"]
+BIT_DEPTHS = [1, 8, 16]
+# bytes.translate table thresholding 8 bit values to the 0 and 1 of a 1 bit image
+ONE_BIT = bytes(value >> 7 for value in range(256))
+# megapixels of the poster encoded for the calibration benchmark
+CALIBRATION_MEGAPIXELS = 0.25
+
+
+# the wall time of one call of function in seconds
+def timeOnce(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+# Summarises the times of the repeats of a benchmark as a result: the fastest ("seconds") and the median.
+# With the times of a calibration call made just before each repeat, also "relative", the median of each time
+# divided by its calibration time, which follows the speed of the machine as it changes during a run.
+def timingResult(times, calibration_times = None):
+    result = {"seconds": min(times), "median": statistics.median(times)}
+    if calibration_times:
+        result["relative"] = statistics.median(map(operator.truediv, times, calibration_times))
+    return result
+
+
+# calls function repeat times, each after a call of calibrate if given, and returns its timingResult
+def timeCall(function, repeat, calibrate = None):
+    times = []
+    calibration_times = []
+    for i in range(repeat):
+        if calibrate:
+            calibration_times.append(timeOnce(calibrate))
+        times.append(timeOnce(function))
+    return timingResult(times, calibration_times)
+
+
+# The images to encode for each bit depth, from an RGB poster: 16 bit and 1 bit are greyscale,
+# made from the luma of the poster. Returns a dictionary of mode name -> (Writer keyword arguments, rows).
+def pngModes(poster, bit_depths):
+    rgb_rows = list(poster.rows())
+    grey_rows = list(imageIO.png.luma_rows(rgb_rows, poster.width, 3, 8))
+    modes = {}
+    for bitdepth in bit_depths:
+        if bitdepth == 8:
+            modes["rgb8"] = (dict(greyscale=False), rgb_rows)
+            modes["grey8"] = (dict(greyscale=True), grey_rows)
+        elif bitdepth == 16:
+            modes["grey16"] = (dict(greyscale=True, bitdepth=16),
+                               [array("H", [value * 257 for value in row]) for row in grey_rows])
+        elif bitdepth == 1:
+            modes["grey1"] = (dict(greyscale=True, bitdepth=1), [row.translate(ONE_BIT) for row in grey_rows])
+        else:
+            raise ValueError("no benchmark for bit depth {}".format(bitdepth))
+    return modes
+
+
+# times imageIO.png encode and decode of a poster for every combination of mode, filter type and interlace
+# (calibrate as for timeCall)
+def benchmarkPNG(poster, label, repeat, filter_types = FILTER_TYPES, bit_depths = BIT_DEPTHS, calibrate = None):
+    results = {}
+    for mode, (options, rows) in pngModes(poster, bit_depths).items():
+        for filter_type in filter_types:
+            for interlace in (False, True):
+                writer = imageIO.png.Writer(poster.width, poster.height, filter_type=filter_type,
+                                            interlace=interlace, **options)
+
+                def encode():
+                    file = io.BytesIO()
+                    writer.write(file, rows)
+                    return file.getvalue()
+
+                data = encode()
+
+                def decode():
+                    for row in imageIO.png.Reader(bytes=data).read()[2]:
+                        pass
+
+                for operation, function in (("encode", encode), ("decode", decode)):
+                    name = "png/{}/{}/filter={}/interlace={}/{}".format(
+                        operation, mode, filter_type, int(interlace), label)
+                    results[name] = timeCall(function, repeat, calibrate)
+    return results
+
+
+# Returns a function doing a fixed amount of work, the filter 0 encode of an RGB poster, that timings are
+# compared relative to, so that timings from machines of different speeds, or from a machine whose speed
+# changes during a run, can be compared (see BaselineComparison.compareReports).
+def calibrationFunction(seed = 0):
+    width, height = posterSize(CALIBRATION_MEGAPIXELS)
+    poster = SyntheticPoster(width, height, seed=seed)
+    rows = list(poster.rows())
+    writer = imageIO.png.Writer(width, height, greyscale=False, filter_type=0)
+    return lambda: writer.write(io.BytesIO(), rows)
+
+
+# the timing of the calibration function on its own, which every report includes whatever is benchmarked
+def benchmarkCalibration(repeat, seed = 0):
+    return {CALIBRATION: timeCall(calibrationFunction(seed), repeat)}
+
+
+# QRCodeDetection imports libraries (matplotlib, pyzbar, PIL) that benchmark machines may not have,
+# so it is only imported when the pipeline is benchmarked. Returns the module, or None with a message.
+def importDetection():
+    try:
+        import QRCodeDetection
+    except (ImportError, SyntaxError) as error:
+        print("skipping pipeline benchmarks, QRCodeDetection can't be imported: {}".format(error), file=sys.stderr)
+        return None
+    return QRCodeDetection
+
+
+# times each stage of QRCodeDetection.computeQRCodeBoundingBox, the time of a stage that runs more than once
+# (blur, dilate, ...) is the total for the run (calibrate as for timeCall)
+def benchmarkPipeline(detection, poster, label, repeat, calibrate = None):
+    arrays = poster.toPixelArrays()
+    stage_times = {}
+    calibration_times = []
+    for i in range(repeat):
+        if calibrate:
+            calibration_times.append(timeOnce(calibrate))
+        instrumentation = PipelineInstrumentation(trace_memory=False)
+        detection.computeQRCodeBoundingBox(*arrays, poster.width, poster.height, instrumentation)
+        totals = {}
+        for record in instrumentation.records:
+            totals[record["stage"]] = totals.get(record["stage"], 0) + record["wall_seconds"]
+        totals["total"] = sum(totals.values())
+        for stage, seconds in totals.items():
+            stage_times.setdefault(stage, []).append(seconds)
+
+    results = {}
+    for stage, times in stage_times.items():
+        results["pipeline/{}/{}".format(stage, label)] = timingResult(times, calibration_times)
+    return results
+
+
+def runBenchmarks(megapixels = (0.25,), pipeline_megapixels = (0.25,), repeat = 5, qr_codes = 1,
+                  filter_types = FILTER_TYPES, bit_depths = BIT_DEPTHS, seed = 0):
+    results = benchmarkCalibration(repeat, seed)
+    calibrate = calibrationFunction(seed)
+    for size in megapixels:
+        width, height = posterSize(size)
+        poster = SyntheticPoster(width, height, qr_codes=qr_codes, seed=seed)
+        results.update(benchmarkPNG(poster, "{}MP".format(size), repeat, filter_types, bit_depths, calibrate))
+
+    if pipeline_megapixels:
+        detection = importDetection()
+        if detection is not None:
+            for size in pipeline_megapixels:
+                width, height = posterSize(size)
+                poster = SyntheticPoster(width, height, qr_codes=qr_codes, seed=seed)
+                results.update(benchmarkPipeline(detection, poster, "{}MP".format(size), repeat, calibrate))
+
+    meta = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "qr_codes": qr_codes,
+        "seed": seed,
+    }
+    return {"meta": meta, "results": results}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.BenchmarkRunner",
+                                     description="Time imageIO.png and the QR code detection pipeline "
+                                                 "on synthetic posters.")
+    parser.add_argument("--megapixels", type=float, nargs="*", default=[0.25],
+                        help="poster sizes for the PNG benchmarks, 0.25 to 50 (default 0.25)")
+    parser.add_argument("--pipeline-megapixels", type=float, nargs="*", default=[0.25],
+                        help="poster sizes for the pipeline benchmarks (default 0.25, give no sizes to skip)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="runs of each benchmark, their median is compared (default 5)")
+    parser.add_argument("--qr-codes", type=int, default=1, help="QR-like patterns on each poster")
+    parser.add_argument("--filters", nargs="*", default=FILTER_TYPES,
+                        type=lambda f: f if f == "adaptive" else int(f), help="PNG filter types")
+    parser.add_argument("--bitdepths", type=int, nargs="*", default=BIT_DEPTHS, choices=BIT_DEPTHS,
+                        help="PNG bit depths")
+    parser.add_argument("--save", metavar="NAME", help="save the results as a baseline")
+    parser.add_argument("--compare", metavar="NAME",
+                        help="compare the results with a saved baseline, made on this machine")
+    parser.add_argument("--threshold", type=float, default=0.35,
+                        help="slow down, as a fraction, that counts as a regression (default 0.35, "
+                             "above the run to run noise of the medians)")
+    parser.add_argument("--absolute", action="store_true",
+                        help="compare seconds as they are, not relative to the calibration benchmark")
+    args = parser.parse_args(argv[1:])
+
+    for size in args.megapixels + args.pipeline_megapixels:
+        if not 0.25 <= size <= 50:
+            parser.error("poster sizes should be between 0.25 and 50 megapixels, not {}".format(size))
+
+    report = runBenchmarks(args.megapixels, args.pipeline_megapixels, args.repeat, args.qr_codes,
+                           args.filters, args.bitdepths)
+    for name, result in sorted(report["results"].items()):
+        print("{:<60} {:.4f}".format(name, result["seconds"]))
+    if args.save:
+        print("saved baseline", saveBaseline(report, args.save))
+    if args.compare:
+        baseline = loadBaseline(args.compare)
+        rows = compareReports(baseline, report, args.threshold, normalise=not args.absolute)
+        print(formatComparison(rows, baseline, report))
+        # a non-zero exit status fails the build when there are regressions
+        if regressions(rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
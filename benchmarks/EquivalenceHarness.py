@@ -0,0 +1,285 @@
+
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import time
+
+import imageIO.png
+from benchmarks.SyntheticPosters import SyntheticPoster
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the stages that can have more than one implementation, in pipeline order, with the QRCodeDetection function
+# that is the reference for each, and how outputs are compared:
+# "pixels" by pixel differences, "labels" as partitions up to relabelling, "bbox" by corner deltas
+STAGES = [
+    ("greyscale", "computeRGBToGreyscale", "pixels"),
+    ("sobel_h", "computeHorizontalEdgesSobelAbsolute", "pixels"),
+    ("sobel_v", "computeVerticalEdgesSobelAbsolute", "pixels"),
+    ("blur", "computeBoxAveraging3x3", "pixels"),
+    ("dilate", "computeDilation8Nbh3x3FlatSE", "pixels"),
+    ("erode", "computeErosion8Nbh3x3FlatSE", "pixels"),
+    ("label", "computeConnectedComponentLabeling", "labels"),
+    ("bbox", "extractBoundingBox", "bbox"),
+]
+STAGE_KINDS = {stage: kind for stage, function_name, kind in STAGES}
+
+# stage -> backend name -> (function, tolerance), every backend of a stage takes the same arguments as the reference
+# and its outputs may differ from the reference by up to tolerance (for "pixels" stages)
+BACKENDS = {stage: {} for stage, function_name, kind in STAGES}
+
+
+# adds an implementation of a stage to be checked against the reference
+def registerBackend(stage, name, function, tolerance = 0):
+    if stage not in BACKENDS:
+        raise ValueError("unknown stage {!r}, expected one of {}".format(stage, ", ".join(BACKENDS)))
+    BACKENDS[stage][name] = (function, tolerance)
+
+
+# registers the QRCodeDetection functions as the "reference" backend of every stage;
+# returns the module, or None when it can't be imported (it needs matplotlib, pyzbar and PIL)
+def registerReference():
+    try:
+        import QRCodeDetection
+    except (ImportError, SyntaxError) as error:
+        print("QRCodeDetection can't be imported, there is no reference to compare with: {}".format(error),
+              file=sys.stderr)
+        return None
+    for stage, function_name, kind in STAGES:
+        registerBackend(stage, "reference", getattr(QRCodeDetection, function_name))
+    return QRCodeDetection
+
+
+# greyscale conversion with the 16 bit lane luma of imageIO.png, which uses integer weights (77, 150, 29) / 256
+# and so can be 1 off the floating point reference
+def computeRGBToGreyscaleLanes(pixel_array_r, pixel_array_g, pixel_array_b, image_width, image_height):
+    rgb_rows = []
+    for y in range(image_height):
+        row = bytearray(3 * image_width)
+        row[0::3] = bytes(pixel_array_r[y])
+        row[1::3] = bytes(pixel_array_g[y])
+        row[2::3] = bytes(pixel_array_b[y])
+        rgb_rows.append(row)
+    return [list(row) for row in imageIO.png.luma_rows(rgb_rows, image_width, 3, 8)]
+
+
+registerBackend("greyscale", "lanes", computeRGBToGreyscaleLanes, tolerance=1)
+
+
+# An input for every stage, of random sizes that are mostly not square. Every other input has binary images
+# with pixels set on the border, and the last one is all foreground, so the edges of the morphology are checked
+# as well as the inside.
+def randomInputs(rng, count, min_size = 3, max_size = 40):
+    inputs = []
+    for n in range(count):
+        width = rng.randrange(min_size, max_size + 1)
+        height = rng.randrange(min_size, max_size + 1)
+
+        def randomImage(values, zero_border = False):
+            image = [[rng.choice(values) for x in range(width)] for y in range(height)]
+            if zero_border:
+                for y in range(height):
+                    for x in range(width):
+                        if x in (0, width - 1) or y in (0, height - 1):
+                            image[y][x] = 0
+            return image
+
+        if n == count - 1:
+            binary = [[255] * width for y in range(height)]
+        else:
+            binary = randomImage([0, 0, 255], zero_border=n % 2 == 0)
+        stage_inputs = {
+            "greyscale": (randomImage(range(256)), randomImage(range(256)), randomImage(range(256))),
+            "sobel_h": (randomImage(range(256)),),
+            "sobel_v": (randomImage(range(256)),),
+            "blur": (randomImage([rng.uniform(0, 360) for i in range(64)]),),
+            "dilate": (binary,),
+            "erode": (binary,),
+            "label": (binary,),
+            "bbox": (binary,),
+        }
+        inputs.append(("random{}_{}x{}".format(n, width, height), width, height, stage_inputs))
+    return inputs
+
+
+# runs the reference pipeline on an RGB image, and returns the input each stage sees there
+def pipelineInputs(detection, pixel_array_r, pixel_array_g, pixel_array_b, image_width, image_height):
+    grey = detection.computeRGBToGreyscale(pixel_array_r, pixel_array_g, pixel_array_b, image_width, image_height)
+    horizontal = detection.computeHorizontalEdgesSobelAbsolute(grey, image_width, image_height)
+    vertical = detection.computeVerticalEdgesSobelAbsolute(grey, image_width, image_height)
+    magnitude = detection.edgeMagnitude(vertical, horizontal, image_width, image_height)
+    smooth = detection.computeBoxAveraging3x3(magnitude, image_width, image_height)
+    smooth = detection.computeBoxAveraging3x3(smooth, image_width, image_height)
+    smooth = detection.scaleTo0And255AndQuantize(smooth, image_width, image_height)
+    threshold = detection.computeThresholdGE(smooth, 70, image_width, image_height)
+    dilated = detection.computeDilation8Nbh3x3FlatSE(threshold, image_width, image_height)
+    (labels, sizes) = detection.computeConnectedComponentLabeling(dilated, image_width, image_height)
+    biggest = detection.computeBiggestComponent(labels, sizes, image_width, image_height)
+    return {
+        "greyscale": (pixel_array_r, pixel_array_g, pixel_array_b),
+        "sobel_h": (grey,),
+        "sobel_v": (grey,),
+        "blur": (magnitude,),
+        "dilate": (threshold,),
+        "erode": (dilated,),
+        "label": (dilated,),
+        "bbox": (biggest,),
+    }
+
+
+# the sample images in the repository and a synthetic poster, each cropped to a square window of at most
+# max_side pixels (see randomInputs) around its centre
+def corpusInputs(detection, max_side = 96):
+    images = []
+    for filename in sorted(glob.glob(os.path.join(REPOSITORY, "images", "**", "*.png"), recursive=True)):
+        width, height, rows, info = imageIO.png.Reader(filename=filename).asRGB8()
+        images.append((os.path.basename(filename), width, height, [bytearray(row) for row in rows]))
+    poster = SyntheticPoster(3 * max_side, 4 * max_side, seed=1)
+    images.append(("synthetic_poster", poster.width, poster.height, list(poster.rows())))
+
+    inputs = []
+    for name, width, height, rows in images:
+        crop_height = crop_width = min(width, height, max_side)
+        top = (height - crop_height) // 2
+        left = (width - crop_width) // 2
+        window = [row[3 * left:3 * (left + crop_width)] for row in rows[top:top + crop_height]]
+        channels = tuple([list(row[channel::3]) for row in window] for channel in range(3))
+        stage_inputs = pipelineInputs(detection, *channels, crop_width, crop_height)
+        inputs.append((name, crop_width, crop_height, stage_inputs))
+    return inputs
+
+
+def comparePixels(reference, result):
+    differences = [abs(a - b) for reference_row, row in zip(reference, result) for a, b in zip(reference_row, row)]
+    shape_matches = len(reference) == len(result) and all(
+        len(reference_row) == len(row) for reference_row, row in zip(reference, result))
+    return {
+        "max_difference": max(differences) if shape_matches else None,
+        "mean_difference": sum(differences) / len(differences) if shape_matches else None,
+        "differing_pixels": sum(1 for d in differences if d) if shape_matches else None,
+    }
+
+
+# Two labellings are the same partition when there is a one to one mapping between their labels
+# (0, the background, must map to 0). Counts the pixels that break the mapping, and checks the sizes agree.
+def compareLabels(reference, result):
+    (reference_labels, reference_sizes), (labels, sizes) = reference, result
+    forward = {0: 0}
+    backward = {0: 0}
+    mismatched = 0
+    for reference_row, row in zip(reference_labels, labels):
+        for a, b in zip(reference_row, row):
+            if forward.setdefault(a, b) != b or backward.setdefault(b, a) != a:
+                mismatched += 1
+    sizes_match = mismatched == 0 and all(
+        sizes.get(forward[label]) == size for label, size in reference_sizes.items() if label in forward)
+    return {"mismatched_pixels": mismatched, "components": (len(reference_sizes), len(sizes)),
+            "sizes_match": sizes_match}
+
+
+def compareBoxes(reference, result):
+    deltas = [b - a for a, b in zip(reference, result)]
+    return {"deltas": deltas, "max_difference": max(abs(d) for d in deltas)}
+
+
+def agrees(kind, comparison, tolerance):
+    if kind == "pixels":
+        return comparison["max_difference"] is not None and comparison["max_difference"] <= tolerance
+    if kind == "labels":
+        return comparison["mismatched_pixels"] == 0 and comparison["sizes_match"]
+    return comparison["max_difference"] <= tolerance
+
+
+def timed(function, arguments):
+    start = time.perf_counter()
+    try:
+        return function(*arguments), time.perf_counter() - start, None
+    except Exception as error:
+        return None, time.perf_counter() - start, "{}: {}".format(type(error).__name__, error)
+
+
+# Runs every backend of every stage on every input, and returns one row per (stage, input, backend) with the
+# comparison against the reference, the verdict ("pass", "fail" or "error"), and both timings.
+def runHarness(inputs, stages = None):
+    comparers = {"pixels": comparePixels, "labels": compareLabels, "bbox": compareBoxes}
+    rows = []
+    for stage, function_name, kind in STAGES:
+        if stages and stage not in stages:
+            continue
+        backends = BACKENDS[stage]
+        if "reference" not in backends:
+            continue
+        for name, width, height, stage_inputs in inputs:
+            arguments = stage_inputs[stage] + (width, height)
+            reference, reference_seconds, reference_error = timed(backends["reference"][0], arguments)
+            for backend, (function, tolerance) in sorted(backends.items()):
+                if backend == "reference":
+                    continue
+                result, seconds, error = timed(function, arguments)
+                row = {"stage": stage, "input": name, "backend": backend, "seconds": seconds,
+                       "reference_seconds": reference_seconds, "speedup": reference_seconds / seconds if seconds else None}
+                # a backend that fails where the reference does is still equivalent
+                if error or reference_error:
+                    row["verdict"] = "pass" if error and reference_error else "error"
+                    row["error"] = error or "reference " + reference_error
+                else:
+                    row["comparison"] = comparers[kind](reference, result)
+                    row["verdict"] = "pass" if agrees(kind, row["comparison"], tolerance) else "fail"
+                rows.append(row)
+    return rows
+
+
+def formatRows(rows):
+    lines = ["{:<10} {:<24} {:<10} {:<8} {:>10} {:>10} {:>10} {:>8}  {}".format(
+        "stage", "input", "backend", "verdict", "max diff", "mean diff", "ref ms", "speedup", "details")]
+    for row in rows:
+        comparison = row.get("comparison", {})
+        mean = comparison.get("mean_difference")
+        details = row.get("error", "")
+        if STAGE_KINDS[row["stage"]] == "labels" and comparison:
+            details = "{} mismatched pixels, components {} vs {}".format(
+                comparison["mismatched_pixels"], *comparison["components"])
+        elif STAGE_KINDS[row["stage"]] == "bbox" and comparison:
+            details = "deltas {}".format(comparison["deltas"])
+        lines.append("{:<10} {:<24} {:<10} {:<8} {:>10} {:>10} {:>10.2f} {:>8}  {}".format(
+            row["stage"], row["input"][:24], row["backend"], row["verdict"],
+            "-" if comparison.get("max_difference") is None else "{:g}".format(comparison["max_difference"]),
+            "-" if mean is None else "{:.4f}".format(mean),
+            row["reference_seconds"] * 1000,
+            "-" if row["speedup"] is None else "{:.2f}x".format(row["speedup"]), details))
+    failures = [row for row in rows if row["verdict"] != "pass"]
+    lines.append("{} of {} comparisons failed".format(len(failures), len(rows)))
+    return "\n".join(lines)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.EquivalenceHarness",
+                                     description="Check every backend of each pipeline stage against "
+                                                 "the QRCodeDetection reference.")
+    parser.add_argument("--random", type=int, default=20, help="number of random inputs (default 20)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-corpus", action="store_true", help="skip the repository and synthetic images")
+    parser.add_argument("--max-side", type=int, default=96, help="crop corpus images to this size (default 96)")
+    parser.add_argument("--stages", nargs="*", choices=list(BACKENDS), help="only check these stages")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv[1:])
+
+    detection = registerReference()
+    if detection is None:
+        return 2
+    inputs = randomInputs(random.Random(args.seed), args.random)
+    if not args.no_corpus:
+        inputs += corpusInputs(detection, args.max_side)
+    rows = runHarness(inputs, args.stages)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(formatRows(rows))
+    return 1 if any(row["verdict"] != "pass" for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,170 @@
+
+import io
+import math
+import random
+
+import imageIO.png
+
+# number of modules along each side of a QR-like pattern (the size of a version 2 QR code)
+QR_MODULES = 25
+# the light border around a QR code, in modules
+QUIET_ZONE = 4
+
+
+# returns (width, height) of a poster with roughly the given number of megapixels, in portrait orientation
+def posterSize(megapixels, aspect = 0.75):
+    height = int(round(math.sqrt(megapixels * 1e6 / aspect)))
+    width = int(round(height * aspect))
+    return width, height
+
+
+# returns a QR_MODULES x QR_MODULES grid of 0 (dark) / 1 (light) modules: a finder pattern in three corners,
+# timing patterns between them, and random data modules everywhere else
+def makeQRModules(rng):
+    modules = [[rng.randrange(2) for x in range(QR_MODULES)] for y in range(QR_MODULES)]
+
+    def finder(top, left):
+        for y in range(-1, 8):
+            for x in range(-1, 8):
+                if 0 <= top + y < QR_MODULES and 0 <= left + x < QR_MODULES:
+                    ring = max(abs(y - 3), abs(x - 3))
+                    # dark 7x7 ring, light ring, dark 3x3 centre, light separator around it all
+                    modules[top + y][left + x] = 0 if ring in (0, 1, 3) else 1
+
+    finder(0, 0)
+    finder(0, QR_MODULES - 7)
+    finder(QR_MODULES - 7, 0)
+    for i in range(8, QR_MODULES - 8):
+        modules[6][i] = i % 2
+        modules[i][6] = i % 2
+    return modules
+
+
+# A synthetic poster: a lit, tinted paper background with a few text-like blocks,
+# one or more QR-like patterns, and noise. The same arguments always give the same image.
+#
+# noise is the size of the per-pixel noise (0 to 64), contrast (0 to 1) how far the darkest ink is from the paper,
+# and the lighting falls off by up to 20% from the top of the poster to the bottom.
+# qr_boxes lists the (min x, min y, max x, max y) of each QR pattern, quiet zone excluded.
+class SyntheticPoster:
+    def __init__(self, width, height, qr_codes = 1, noise = 12, contrast = 0.8, seed = 0):
+        if not 0 <= noise <= 64:
+            raise ValueError("noise should be between 0 and 64, not {}".format(noise))
+        self.width = width
+        self.height = height
+        self.noise = noise
+        self.contrast = contrast
+        self.seed = seed
+        rng = random.Random(seed)
+
+        # (top, left, rows per entry, list of grey level bytearrays) for each pattern drawn on the poster
+        self.patterns = []
+        self.qr_boxes = []
+        self.addTextBlocks(rng)
+        self.addQRCodes(rng, qr_codes)
+
+        # a pool of noise rows, each row uses one of them rotated by a random amount
+        self.noise_rows = [bytes(rng.randrange(2 * noise + 1) for x in range(width))
+                           for i in range(8)] if noise else []
+
+    # returns one pixel row of grey levels (0 is ink, 255 is paper) for a row of dark / light modules
+    @staticmethod
+    def moduleRow(modules, module_size, dark = 0, light = 255):
+        row = bytearray()
+        for module in modules:
+            row += bytes([light if module else dark]) * module_size
+        return row
+
+    def addTextBlocks(self, rng):
+        # a few blocks of horizontal "lines of text" in mid grey, so that there are edges away from the QR codes
+        for i in range(4):
+            block_width = rng.randrange(self.width // 4, self.width // 2)
+            line_height = max(1, self.height // 120)
+            lines = rng.randrange(3, 8)
+            top = rng.randrange(0, max(1, self.height - 2 * line_height * lines))
+            left = rng.randrange(0, max(1, self.width - block_width))
+            grey = rng.randrange(60, 160)
+            rows = []
+            for line in range(lines):
+                rows += [bytearray([grey]) * block_width] * line_height
+                rows += [bytearray([255]) * block_width] * line_height
+            self.patterns.append((top, left, 1, rows))
+
+    def addQRCodes(self, rng, qr_codes):
+        for i in range(qr_codes):
+            # each QR code is between a tenth and a quarter of the shorter side
+            side = min(self.width, self.height)
+            module_size = max(1, rng.randrange(side // 10, side // 4 + 1) // QR_MODULES)
+            outer = (QR_MODULES + 2 * QUIET_ZONE) * module_size
+            top = rng.randrange(0, max(1, self.height - outer))
+            left = rng.randrange(0, max(1, self.width - outer))
+            modules = makeQRModules(rng)
+            quiet = [1] * QUIET_ZONE
+            rows = [self.moduleRow(quiet * 2 + [1] * QR_MODULES, module_size)] * QUIET_ZONE
+            rows += [self.moduleRow(quiet + row + quiet, module_size) for row in modules]
+            rows += [self.moduleRow(quiet * 2 + [1] * QR_MODULES, module_size)] * QUIET_ZONE
+            self.patterns.append((top, left, module_size, rows))
+            inner = QUIET_ZONE * module_size
+            self.qr_boxes.append((left + inner, top + inner,
+                                  left + inner + QR_MODULES * module_size - 1,
+                                  top + inner + QR_MODULES * module_size - 1))
+
+    # translate tables from grey level to the red, green and blue of the poster, for one lighting level
+    def channelTables(self, lighting):
+        span = 255 - 2 * self.noise
+        ink = span * (1 - self.contrast)
+        tables = []
+        # slightly warm paper
+        for tint in (1.0, 0.96, 0.9):
+            paper = span * lighting * tint
+            low = min(ink, paper)
+            tables.append(bytes(int(low + (paper - low) * level / 255) for level in range(256)))
+        return tables
+
+    # yields the poster one RGB row (a bytearray of 3 * width values) at a time
+    def rows(self):
+        width = self.width
+        rng = random.Random(self.seed + 1)
+        table_cache = {}
+        for y in range(self.height):
+            grey = bytearray([255]) * width
+            for top, left, step, rows in self.patterns:
+                index = y - top
+                if 0 <= index < len(rows) * step:
+                    row = rows[index // step]
+                    grey[left:left + len(row)] = row[:width - left]
+
+            # 32 lighting levels are plenty, and keep the number of tables small
+            level = 31 - (32 * y) // (self.height + 1)
+            if level not in table_cache:
+                table_cache[level] = self.channelTables(0.8 + 0.2 * level / 31)
+            rgb = bytearray(3 * width)
+            for channel, table in enumerate(table_cache[level]):
+                values = grey.translate(table)
+                if self.noise_rows:
+                    # the tables leave room for the noise, so no lane overflows a byte
+                    noise = rng.choice(self.noise_rows)
+                    shift = rng.randrange(width)
+                    noise = noise[shift:] + noise[:shift]
+                    lanes = imageIO.png.to_lanes(values) + imageIO.png.to_lanes(noise)
+                    values = imageIO.png.from_lanes(lanes, width)
+                rgb[channel::3] = values
+            yield rgb
+
+    # returns the PNG file for the poster as bytes; keyword arguments are passed to imageIO.png.Writer
+    def toPNG(self, **kwargs):
+        file = io.BytesIO()
+        writer = imageIO.png.Writer(self.width, self.height, greyscale=False, **kwargs)
+        writer.write(file, self.rows())
+        return file.getvalue()
+
+    # returns the red, green and blue pixel arrays, as readRGBImageToSeparatePixelArrays would
+    def toPixelArrays(self):
+        pixel_array_r = []
+        pixel_array_g = []
+        pixel_array_b = []
+        for row in self.rows():
+            pixel_array_r.append(list(row[0::3]))
+            pixel_array_g.append(list(row[1::3]))
+            pixel_array_b.append(list(row[2::3]))
+        return pixel_array_r, pixel_array_g, pixel_array_b
@@ -0,0 +1,3 @@
+# Benchmarks for imageIO.png and the QR code detection pipeline, on synthetic posters.
+# Run them with
+#     python -m benchmarks.BenchmarkRunner --help
@@ -173,15 +173,20 @@ from __future__ import print_function
 
 __version__ = "0.0.20"
 
+import asyncio
 import collections
+import concurrent.futures
+import contextlib
 import io   # For io.BytesIO
 import itertools
 import math
 # http://www.python.org/doc/2.4.4/lib/module-operator.html
 import operator
+import queue
 import re
 import struct
 import sys
+import threading
 # http://www.python.org/doc/2.4.4/lib/module-warnings.html
 import warnings
 import zlib
@@ -189,7 +194,8 @@ import zlib
 from array import array
 
 
-__all__ = ['Image', 'Reader', 'Writer', 'write_chunks', 'from_array']
+__all__ = ['AsyncReader', 'AsyncWriter', 'Image', 'Reader',
+           'ValidationPolicy', 'Writer', 'write_chunks', 'from_array']
 
 
 # The PNG signature.
@@ -224,6 +230,27 @@ def adam7_generate(width, height):
         yield ((xstart, y, xstep) for y in range(ystart, height, ystep))
 
 
+def adam7_passes(width, height):
+    """
+    Describe the reduced images of an Adam7 interlaced image
+    of size `width` by `height` pixels.
+
+    Returns a list with an (xstart, ystart, xstep, ystep, ppr) tuple
+    for each pass that has any pixels;
+    `ppr` is the number of pixels in each row of the reduced image,
+    and the rows are ``range(ystart, height, ystep)``.
+    """
+
+    passes = []
+    for xstart, ystart, xstep, ystep in adam7:
+        if xstart >= width or ystart >= height:
+            continue
+        # Pixels per row (reduced pass image)
+        ppr = (width - xstart + xstep - 1) // xstep
+        passes.append((xstart, ystart, xstep, ystep, ppr))
+    return passes
+
+
 # Models the 'pHYs' chunk (used by the Reader)
 Resolution = collections.namedtuple('_Resolution', 'x y unit_is_meter')
 
@@ -373,7 +400,11 @@ class Writer:
                  chunk_limit=2**20,
                  x_pixels_per_unit=None,
                  y_pixels_per_unit=None,
-                 unit_is_meter=False):
+                 unit_is_meter=False,
+                 filter_type=0,
+                 compress_workers=None,
+                 compress_block=2**17,
+                 strategy=None):
         """
         Create a PNG encoder object.
 
@@ -414,6 +445,17 @@ class Writer:
         unit_is_meter
           `True` to indicate that the unit (for the `pHYs`
           chunk) is metre.
+        filter_type
+          Scanline filter: 0 to 4 (default 0) to use one filter
+          for every row, or ``'adaptive'`` to choose one for each row.
+        compress_workers
+          Number of threads compressing the image data in parallel;
+          default ``None`` (compress in the calling thread).
+        compress_block
+          Size in bytes of the blocks compressed in parallel.
+        strategy
+          ``zlib`` compression strategy, such as ``zlib.Z_RLE``;
+          default: ``None`` (``zlib.Z_DEFAULT_STRATEGY``).
 
         The image size (in pixels) can be specified either by using the
         `width` and `height` arguments, or with the single `size`
@@ -522,6 +564,41 @@ class Writer:
         compressing the image.
         In order to avoid using large amounts of memory,
         multiple ``IDAT`` chunks may be created.
+
+        The `filter_type` argument controls the scanline filtering
+        that is done before compression
+        (see http://www.w3.org/TR/PNG/#9Filters).
+        It can be one of the PNG filter types:
+        0 (None), 1 (Sub), 2 (Up), 3 (Average), or 4 (Paeth),
+        which is then used for every row;
+        or ``'adaptive'``, which chooses a filter for each row
+        by trying them all and keeping the one with
+        the smallest sum of absolute (signed) values.
+        Filtering generally makes the image compress better,
+        but it costs encoding time
+        (``'adaptive'`` encodes 8 bit images several times slower
+        than the default 0),
+        so it is only done when asked for.
+        The PNG specification recommends 0 for
+        colour mapped images and bit depths less than 8.
+
+        When `compress_workers` is given,
+        the filtered image data is cut into blocks of
+        (at least) `compress_block` bytes,
+        which are compressed concurrently
+        (``zlib`` releases the GIL while it works)
+        in the style of ``pigz``:
+        each block is primed with the last 32 KiB of the block before,
+        and ends on a byte boundary so that
+        the blocks can be joined into a single ``zlib`` stream.
+        Each block is written as its own ``IDAT`` chunk.
+        The output is a little larger than
+        when compressing in a single thread.
+
+        The `strategy` argument is passed to ``zlib``.
+        ``zlib.Z_RLE`` is fast and suits images with long runs of
+        the same value (such as masks with bit depth 1);
+        ``zlib.Z_FILTERED`` suits images with small filtered values.
         """
 
         # At the moment the `planes` argument is ignored;
@@ -545,6 +622,10 @@ class Writer:
             raise ProtocolError(
                 "transparent colour not allowed with alpha channel")
 
+        if filter_type not in ('adaptive', 0, 1, 2, 3, 4):
+            raise ProtocolError(
+                "filter_type must be 0 to 4 or 'adaptive'")
+
         # bitdepth is either single integer, or tuple of integers.
         # Convert to tuple.
         try:
@@ -605,11 +686,15 @@ class Writer:
         self.bitdepth = int(bitdepth)
         self.compression = compression
         self.chunk_limit = chunk_limit
+        self.compress_workers = compress_workers
+        self.compress_block = compress_block
+        self.strategy = strategy
         self.interlace = bool(interlace)
         self.palette = palette
         self.x_pixels_per_unit = x_pixels_per_unit
         self.y_pixels_per_unit = y_pixels_per_unit
         self.unit_is_meter = bool(unit_is_meter)
+        self.filter_type = filter_type
 
         self.color_type = (4 * self.alpha +
                            2 * (not greyscale) +
@@ -634,6 +719,21 @@ class Writer:
         Supply the rows in the normal image order;
         the interlacing is carried out internally.
 
+        `rows` can also be a single contiguous buffer of
+        1-byte (8-bit or less) or 2-byte (16-bit) values,
+        such as a ``bytearray``, ``array.array``, ``memoryview``, or
+        a ``numpy`` array of any shape (the height comes first and
+        there should be ``self.height * self.width * self.planes``
+        values in total).
+        The scanlines are then sliced straight out of the buffer,
+        with no Python code run for each value.
+        What remains is the filtering and compression:
+        a 1000x1000 8-bit greyscale buffer is written
+        in about 2ms with ``compression=0``,
+        and in 4ms (flat colour) to 70ms (a detailed image)
+        at the default compression level;
+        ``filter_type='adaptive'`` adds about 80ms to 200ms more.
+
         .. note ::
 
           Interlacing requires the entire image to be in working memory.
@@ -642,6 +742,14 @@ class Writer:
         # Values per row
         vpr = self.width * self.planes
 
+        view = buffer_values(rows)
+        if view is not None and view.itemsize == 1 + (self.bitdepth > 8):
+            if len(view) != vpr * self.height:
+                raise ProtocolError(
+                    "Expected %d values in buffer but got %d values" %
+                    (vpr * self.height, len(view)))
+            return self.write_array(outfile, view)
+
         def check_rows(rows):
             """
             Yield each row in rows,
@@ -664,7 +772,15 @@ class Writer:
 
         if self.interlace:
             fmt = 'BH'[self.bitdepth > 8]
-            a = array(fmt, itertools.chain(*check_rows(rows)))
+            a = array(fmt)
+            for row in check_rows(rows):
+                if fmt == 'B' and isinstance(row, (bytes, bytearray)):
+                    # Bulk copy, rather than value by value.
+                    a.frombytes(row)
+                elif isarray(row) and row.typecode != fmt:
+                    a.extend(iter(row))
+                else:
+                    a.extend(row)
             return self.write_array(outfile, a)
 
         nrows = self.write_passes(outfile, check_rows(rows))
@@ -723,39 +839,81 @@ class Writer:
 
         self.write_preamble(outfile)
 
+        # Filter unit, the byte distance to the previous pixel;
+        # see :meth:`Reader.undo_filter`.
+        fu = max(1, int(math.ceil(self.psize)))
+        # Row numbers (in file order) that begin a reduced image,
+        # where there is no previous line for filtering.
+        pass_starts = {0}
+        if self.interlace:
+            n = 0
+            for x, ystart, xstep, ystep, ppr in adam7_passes(
+                    self.width, self.height):
+                n += len(range(ystart, self.height, ystep))
+                pass_starts.add(n)
+        nrows = 0
+
+        if self.compress_workers:
+            limit = self.compress_block
+        else:
+            limit = self.chunk_limit
+
+        def blocks():
+            """
+            Yield the filtered scanlines,
+            each with its filter type byte,
+            in blocks of a little over `limit` bytes.
+            """
+
+            nonlocal nrows
+            previous = None
+            # data accumulates bytes to be compressed for the IDAT chunk;
+            # it's compressed when sufficiently large.
+            data = bytearray()
+            for i, row in enumerate(rows):
+                nrows = i + 1
+                if self.filter_type == 0:
+                    # Add "None" filter type.
+                    data.append(0)
+                    data.extend(row)
+                else:
+                    row = bytes(row)
+                    if i in pass_starts:
+                        previous = None
+                    if self.filter_type == 'adaptive':
+                        filter_type, filtered = filter_scanline_adaptive(
+                            fu, row, previous)
+                    else:
+                        filter_type = self.filter_type
+                        filtered = filter_scanline(
+                            filter_type, fu, row, previous)
+                    data.append(filter_type)
+                    data.extend(filtered)
+                    previous = row
+                if len(data) > limit:
+                    yield data
+                    data = bytearray()
+            yield data
+
         # http://www.w3.org/TR/PNG/#11IDAT
-        if self.compression is not None:
-            compressor = zlib.compressobj(self.compression)
+        level = self.compression
+        if level is None:
+            level = zlib.Z_DEFAULT_COMPRESSION
+        strategy = self.strategy
+        if strategy is None:
+            strategy = zlib.Z_DEFAULT_STRATEGY
+        if self.compress_workers:
+            compressed = join_pieces(compress_parallel(
+                blocks(), level, self.compress_workers, strategy),
+                self.chunk_limit)
         else:
-            compressor = zlib.compressobj()
-
-        # data accumulates bytes to be compressed for the IDAT chunk;
-        # it's compressed when sufficiently large.
-        data = bytearray()
-
-        for i, row in enumerate(rows):
-            # Add "None" filter type.
-            # Currently, it's essential that this filter type be used
-            # for every scanline as
-            # we do not mark the first row of a reduced pass image;
-            # that means we could accidentally compute
-            # the wrong filtered scanline if we used
-            # "up", "average", or "paeth" on such a line.
-            data.append(0)
-            data.extend(row)
-            if len(data) > self.chunk_limit:
-                compressed = compressor.compress(data)
-                if len(compressed):
-                    write_chunk(outfile, b'IDAT', compressed)
-                data = bytearray()
-
-        compressed = compressor.compress(bytes(data))
-        flushed = compressor.flush()
-        if len(compressed) or len(flushed):
-            write_chunk(outfile, b'IDAT', compressed + flushed)
+            compressed = compress_serial(blocks(), level, strategy)
+        for data in compressed:
+            if len(data):
+                write_chunk(outfile, b'IDAT', data)
         # http://www.w3.org/TR/PNG/#11IEND
         write_chunk(outfile, b'IEND')
-        return i + 1
+        return nrows
 
     def write_preamble(self, outfile):
         # http://www.w3.org/TR/PNG/#5PNG-file-signature
@@ -831,7 +989,12 @@ class Writer:
             if type(pixels) != array:
                 # Coerce to array type
                 fmt = 'BH'[self.bitdepth > 8]
-                pixels = array(fmt, pixels)
+                if isinstance(pixels, memoryview):
+                    a = array(fmt)
+                    a.frombytes(pixels.cast('B'))
+                    pixels = a
+                else:
+                    pixels = array(fmt, pixels)
             self.write_passes(outfile, self.array_scanlines_interlace(pixels))
         else:
             self.write_passes(outfile, self.array_scanlines(pixels))
@@ -859,36 +1022,34 @@ class Writer:
         """
 
         # http://www.w3.org/TR/PNG/#8InterlaceMethods
-        # Array type.
-        fmt = 'BH'[self.bitdepth > 8]
         # Value per row
         vpr = self.width * self.planes
+        planes = self.planes
 
         # Each iteration generates a scanline starting at (x, y)
         # and consisting of every xstep pixels.
-        for lines in adam7_generate(self.width, self.height):
-            for x, y, xstep in lines:
-                # Pixels per row (of reduced image)
-                ppr = int(math.ceil((self.width - x) / float(xstep)))
-                # Values per row (of reduced image)
-                reduced_row_len = ppr * self.planes
+        # The slices are worked out once for each pass.
+        for x, ystart, xstep, ystep, ppr in adam7_passes(
+                self.width, self.height):
+            # Values per row (of reduced image)
+            reduced_row_len = ppr * planes
+            skip = planes * xstep
+            for y in range(ystart, self.height, ystep):
+                offset = y * vpr + x * planes
                 if xstep == 1:
                     # Easy case: line is a simple slice.
-                    offset = y * vpr
                     yield pixels[offset: offset + vpr]
                     continue
+                end_offset = (y + 1) * vpr
                 # We have to step by xstep,
                 # which we can do one plane at a time
                 # using the step in Python slices.
-                row = array(fmt)
-                # There's no easier way to set the length of an array
-                row.extend(pixels[0:reduced_row_len])
-                offset = y * vpr + x * self.planes
-                end_offset = (y + 1) * vpr
-                skip = self.planes * xstep
-                for i in range(self.planes):
-                    row[i::self.planes] = \
-                        pixels[offset + i: end_offset: skip]
+                if planes == 1:
+                    yield pixels[offset: end_offset: skip]
+                    continue
+                row = pixels[0:reduced_row_len]
+                for i in range(planes):
+                    row[i::planes] = pixels[offset + i: end_offset: skip]
                 yield row
 
 
@@ -917,6 +1078,132 @@ def write_chunks(out, chunks):
         write_chunk(out, *chunk)
 
 
+def compress_serial(blocks, level, strategy=zlib.Z_DEFAULT_STRATEGY):
+    """
+    Compress the data from the iterable `blocks`
+    into a single ``zlib`` stream, yielding it piece by piece,
+    roughly one piece for each block (a piece may be empty).
+    The ``zlib`` header is part of the first piece
+    that has any deflate data
+    (rather than a piece of its own, as the compressor returns it),
+    and the end of the stream is part of the last piece.
+    """
+
+    compressor = zlib.compressobj(
+        level, zlib.DEFLATED, zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, strategy)
+    piece = b''
+    for block in blocks:
+        if len(piece) > 2:
+            yield piece
+            piece = b''
+        piece += compressor.compress(block)
+    yield piece + compressor.flush()
+
+
+def compress_parallel(blocks, level, workers,
+                      strategy=zlib.Z_DEFAULT_STRATEGY):
+    """
+    Compress the data from the iterable `blocks`
+    into a single ``zlib`` stream, yielding it piece by piece,
+    one piece for each block;
+    the ``zlib`` header is part of the first piece,
+    and the end of the stream part of the last.
+    Blocks are compressed concurrently by
+    a pool of `workers` threads.
+
+    This is the scheme used by ``pigz``:
+    each block is compressed as raw deflate data,
+    using the last 32 KiB (the deflate window) of
+    the data before it as a preset dictionary,
+    and ended with a sync flush so that it finishes on a byte boundary.
+    The pieces are then joined together between
+    a ``zlib`` header and trailer.
+    """
+
+    # The zlib header; https://tools.ietf.org/html/rfc1950
+    cmf = 0x78
+    if level in (-1, 6):
+        flevel = 2
+    else:
+        flevel = (0, 0, 1, 1, 1, 1, 2, 3, 3, 3)[level]
+    flg = flevel << 6
+    flg += (31 - (cmf * 256 + flg) % 31) % 31
+    header = struct.pack('BB', cmf, flg)
+
+    checksum = zlib.adler32(b'')
+
+    def deflated():
+        nonlocal checksum
+        dictionary = b''
+        pending = collections.deque()
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            for block in blocks:
+                block = bytes(block)
+                checksum = zlib.adler32(block, checksum)
+                pending.append(pool.submit(
+                    deflate_block, block, dictionary, level, strategy))
+                dictionary = (dictionary + block)[-2 ** 15:]
+                # Keep a bounded number of blocks in flight.
+                while len(pending) > 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    # Each piece is held back until the next one is ready,
+    # so that the header and the end of the stream
+    # don't make chunks of their own.
+    piece = header
+    for i, data in enumerate(deflated()):
+        if i:
+            yield piece
+            piece = data
+        else:
+            piece += data
+    # An empty final block ends the deflate stream.
+    yield (piece + deflate_block(b'', b'', level, strategy, final=True) +
+           struct.pack('!I', checksum & 0xffffffff))
+
+
+def join_pieces(pieces, limit):
+    """
+    Join the ``bytes`` from the iterable `pieces`
+    into pieces of a little over `limit` bytes
+    (and what is left at the end).
+    """
+
+    data = bytearray()
+    for piece in pieces:
+        data.extend(piece)
+        if len(data) > limit:
+            yield data
+            data = bytearray()
+    if data:
+        yield data
+
+
+def deflate_block(block, dictionary, level,
+                  strategy=zlib.Z_DEFAULT_STRATEGY, final=False):
+    """
+    Compress `block` as raw deflate data
+    (for :meth:`compress_parallel`),
+    priming the compressor with `dictionary` (if not empty).
+    Unless `final` is true the result is
+    ended with a sync flush,
+    so that more deflate data can be appended to it.
+    """
+
+    args = (level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL,
+            strategy)
+    if dictionary:
+        compressor = zlib.compressobj(*args, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(*args)
+    data = compressor.compress(block)
+    if final:
+        return data + compressor.flush()
+    return data + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
 def rescale_rows(rows, rescale):
     """
     Take each row in rows (an iterator) and yield
@@ -927,9 +1214,8 @@ def rescale_rows(rows, rescale):
     with one element per channel.
     """
 
-    # One factor for each channel
-    fs = [float(2 ** s[1] - 1)/float(2 ** s[0] - 1)
-          for s in rescale]
+    # One table for each channel
+    tables = [make_rescale_table(*s) for s in rescale]
 
     # Assume all target_bitdepths are the same
     target_bitdepths = set(s[1] for s in rescale)
@@ -941,15 +1227,60 @@ def rescale_rows(rows, rescale):
     n_chans = len(rescale)
 
     for row in rows:
-        rescaled_row = array(typecode, iter(row))
+        if n_chans == 1:
+            yield map_values(tables[0], row, typecode)
+            continue
+        rescaled_row = array(typecode, bytes(len(row) * (1 + (typecode == 'H'))))
         for i in range(n_chans):
-            channel = array(
-                typecode,
-                (int(round(fs[i] * x)) for x in row[i::n_chans]))
-            rescaled_row[i::n_chans] = channel
+            rescaled_row[i::n_chans] = map_values(
+                tables[i], row[i::n_chans], typecode)
         yield rescaled_row
 
 
+def make_rescale_table(source_bitdepth, target_bitdepth):
+    """
+    Make a table (see :meth:`make_value_table`) that rescales
+    every `source_bitdepth` bit value to `target_bitdepth` bits,
+    so that 0 maps to 0 and the maximum value maps to the maximum value.
+    """
+
+    factor = float(2 ** target_bitdepth - 1) / float(2 ** source_bitdepth - 1)
+    return make_value_table(
+        [int(round(x * factor)) for x in range(2 ** source_bitdepth)])
+
+
+def make_value_table(values):
+    """
+    Make a table for :meth:`map_values` from the list `values`,
+    where ``values[x]`` is the result for the input value x.
+    When all the inputs and results fit in a byte,
+    the table is a 256-byte ``bytes.translate`` table,
+    otherwise it's the list itself.
+    """
+
+    if len(values) <= 256 and max(values) <= 255:
+        return bytes(values).ljust(256, b'\x00')
+    return values
+
+
+def map_values(table, values, typecode):
+    """
+    Map each of `values` through the table made by :meth:`make_value_table`,
+    returning an array of `typecode` ('B' or 'H').
+    This is a single ``bytes.translate`` for byte tables,
+    and a ``map`` over the table's ``__getitem__`` otherwise;
+    either way, no Python code runs for each value.
+    """
+
+    if isinstance(table, bytes) and typecode == 'B':
+        if isarray(values):
+            values = values.tobytes()
+        elif not isinstance(values, (bytes, bytearray)):
+            values = bytes(values)
+        return array('B', values.translate(table))
+    return array(typecode, map(table.__getitem__, values))
+
+
 def pack_rows(rows, bitdepth):
     """Yield packed rows that are a byte array.
     Each byte is packed with the values from several pixels.
@@ -959,29 +1290,98 @@ def pack_rows(rows, bitdepth):
     assert 8 % bitdepth == 0
 
     # samples per byte
-    spb = int(8 / bitdepth)
-
-    def make_byte(block):
-        """Take a block of (2, 4, or 8) values,
-        and pack them into a single byte.
-        """
-
-        res = 0
-        for v in block:
-            res = (res << bitdepth) + v
-        return res
+    spb = 8 // bitdepth
+    tables = sub_byte_pack_tables[bitdepth]
 
     for row in rows:
         a = bytearray(row)
         # Adding padding bytes so we can group into a whole
         # number of spb-tuples.
-        n = float(len(a))
-        extra = math.ceil(n / spb) * spb - n
-        a.extend([0] * int(extra))
-        # Pack into bytes.
-        # Each block is the samples for one byte.
-        blocks = group(a, spb)
-        yield bytearray(make_byte(block) for block in blocks)
+        a.extend(bytes(-len(a) % spb))
+        if a and max(a) >> bitdepth:
+            raise ProtocolError(
+                "values must be less than 2**%d for bitdepth %d" %
+                (bitdepth, bitdepth))
+        n = len(a) // spb
+        # Shift the k-th sample of every byte into place,
+        # then OR the spb shifted byte strings together
+        # (as big integers, which has no carries between bytes).
+        packed = 0
+        for k, table in enumerate(tables):
+            packed |= int.from_bytes(a[k::spb].translate(table), 'big')
+        yield bytearray(packed.to_bytes(n, 'big'))
+
+
+def pack_mask_rows(rows):
+    """
+    Yield each row of a binary mask packed into
+    a byte array for bit depth 1:
+    each non-zero (true) value becomes a 1 bit,
+    each zero (false) value becomes a 0 bit.
+    The values can be of any type (``int``, ``float``, ``bool``),
+    so this works directly on thresholded
+    or morphology output (0/255 or 0/1).
+    """
+
+    for row in rows:
+        if isinstance(row, (bytes, bytearray)):
+            row = row.translate(mask_bits)
+        else:
+            row = bytes(map(bool, row))
+        yield from pack_rows([row], 1)
+
+
+def unpack_sub_byte(bs, bitdepth, width):
+    """
+    Unpack a row of bytes that are packed with
+    1-, 2-, or 4-bit values into a bytearray of `width` values;
+    the inverse of :meth:`pack_rows` for a single row.
+    """
+
+    # Samples per byte
+    spb = 8 // bitdepth
+    bs = bytes(bs)
+    out = bytearray(len(bs) * spb)
+    # The k-th sample of every byte is extracted with
+    # a single translate and written into place with a strided slice.
+    for k, table in enumerate(sub_byte_unpack_tables[bitdepth]):
+        out[k::spb] = bs.translate(table)
+    del out[width:]
+    return out
+
+
+def make_sub_byte_tables(bitdepth):
+    """
+    Make the ``bytes.translate`` tables
+    used to pack and unpack `bitdepth` bit values (1, 2, or 4).
+    Returns a (*pack*, *unpack*) pair, each a list with
+    one 256-byte table for each sample position in a byte,
+    most significant first.
+    For sample position k, the *unpack* table maps a byte
+    to the sample at position k;
+    the *pack* table maps a sample value to
+    that value shifted into position k.
+    """
+
+    spb = 8 // bitdepth
+    mask = 2 ** bitdepth - 1
+    shifts = [bitdepth * i for i in reversed(range(spb))]
+    unpack = [bytes((o >> shift) & mask for o in range(256))
+              for shift in shifts]
+    pack = [bytes((o << shift) & 0xff for o in range(256))
+            for shift in shifts]
+    return pack, unpack
+
+
+# Maps 0 to 0 and any other byte to 1.
+mask_bits = bytes([0]) + bytes([1]) * 255
+
+sub_byte_pack_tables = {}
+sub_byte_unpack_tables = {}
+for _bitdepth in (1, 2, 4):
+    (sub_byte_pack_tables[_bitdepth],
+     sub_byte_unpack_tables[_bitdepth]) = make_sub_byte_tables(_bitdepth)
+del _bitdepth
 
 
 def unpack_rows(rows):
@@ -989,8 +1389,56 @@ def unpack_rows(rows):
     to being a sequence of bytes.
     """
     for row in rows:
-        fmt = '!%dH' % len(row)
-        yield bytearray(struct.pack(fmt, *row))
+        if isinstance(row, memoryview):
+            a = array('H')
+            a.frombytes(row.cast('B'))
+        elif isarray(row):
+            a = array('H', row)
+        else:
+            # A list (or similar) already holds one Python object
+            # per value, and struct is the fastest way to pack those.
+            fmt = '!%dH' % len(row)
+            yield bytearray(struct.pack(fmt, *row))
+            continue
+        if sys.byteorder == 'little':
+            a.byteswap()
+        yield bytearray(a.tobytes())
+
+
+def unpack_16(bs):
+    """
+    Convert a row of bytes holding big-endian 16-bit values
+    into a fresh ``array('H')`` of those values.
+    """
+
+    a = array('H', bs)
+    if sys.byteorder == 'little':
+        a.byteswap()
+    return a
+
+
+def buffer_values(x):
+    """
+    If `x` is a C-contiguous buffer of
+    unsigned 1-byte or 2-byte values
+    (``bytearray``, ``array('B')``, ``array('H')``, ``numpy.uint8``, ...),
+    return a flat ``memoryview`` of its values
+    (format ``'B'`` or ``'H'``);
+    otherwise return ``None``.
+    """
+
+    try:
+        view = memoryview(x)
+    except TypeError:
+        return None
+    if not view.c_contiguous:
+        return None
+    format = view.format.lstrip('@=')
+    if format in ('B', '?'):
+        return view.cast('B')
+    if format == 'H':
+        return view.cast('B').cast('H')
+    return None
 
 
 def make_palette_chunks(palette):
@@ -1206,6 +1654,25 @@ def from_array(a, mode=None, info={}):
         if info['planes'] != planes:
             raise Error("info['planes'] should match mode.")
 
+    # A contiguous 2D or 3D buffer (such as a numpy array) has
+    # everything we need in its shape and format,
+    # and is written straight from the buffer (see :meth:`Writer.write`).
+    view = buffer_values(a)
+    if view is not None:
+        shape = memoryview(a).shape
+        if len(shape) in (2, 3):
+            if 'width' not in info:
+                if len(shape) == 3:
+                    info['width'] = shape[1]
+                else:
+                    info['width'] = shape[1] // planes
+            if 'bitdepth' not in info:
+                if memoryview(a).format == '?':
+                    info['bitdepth'] = 1
+                else:
+                    info['bitdepth'] = 8 * view.itemsize
+            return Image(a, info)
+
     # In order to work out whether we the array is 2D or 3D we need its
     # first row, which requires that we take a copy of its iterator.
     # We may also need the first row to derive width and bitdepth.
@@ -1296,14 +1763,83 @@ class Image:
         w.write(file, self.rows)
 
 
+class ValidationPolicy:
+    """
+    How much checking a :class:`Reader` does on its input.
+
+    There are three profiles:
+
+    ``'full'``
+      Check the CRC of every chunk,
+      check that every chunk type is made of ASCII letters,
+      and warn about chunks in the wrong order
+      (``PLTE`` after ``IDAT``, for example).
+      This is the default, and what you want for files
+      from anywhere else.
+    ``'header'``
+      Check the CRC and chunk type only for the
+      ``IHDR`` and ``IEND`` chunks, so that
+      the metadata is known to be right and
+      a truncated file is still noticed.
+    ``'trusted'``
+      No CRC, chunk type, or ordering checks.
+      Only for PNG files that were just written by
+      :class:`Writer` (cached intermediate images, for example),
+      where decoding should only cost the inflate and unfilter.
+
+    Structural checks that decoding depends on
+    (chunk lengths, ``IHDR`` contents, the size of the image data)
+    are made whatever the profile.
+
+    `counters` is a :class:`collections.Counter` recording
+    the work done by every :class:`Reader` that uses this policy:
+    ``chunks``, ``crc_checked``, ``crc_skipped``, ``crc_bytes``
+    (bytes covered by CRC checks), and ``type_checked``.
+    """
+
+    profiles = ('full', 'header', 'trusted')
+
+    def __init__(self, profile='full'):
+        if profile not in self.profiles:
+            raise ProtocolError(
+                "validation profile must be one of %s, not %r"
+                % (", ".join(self.profiles), profile))
+        self.profile = profile
+        self.counters = collections.Counter()
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, self.profile)
+
+    def check_chunk(self, type):
+        """
+        Return ``True`` if the CRC and type of
+        the chunk with type `type` should be checked.
+        """
+
+        if self.profile == 'full':
+            return True
+        if self.profile == 'header':
+            return type in (b'IHDR', b'IEND')
+        return False
+
+    def check_order(self):
+        """Return ``True`` if chunk ordering should be checked."""
+
+        return self.profile == 'full'
+
+
 class Reader:
     """
     Pure Python PNG decoder in pure Python.
     """
 
-    def __init__(self, _guess=None, filename=None, file=None, bytes=None):
+    def __init__(self, _guess=None, filename=None, file=None, bytes=None,
+                 decompress_block=2**16,
+                 pipeline=0,
+                 validation='full'):
         """
-        The constructor expects exactly one keyword argument.
+        The constructor expects exactly one keyword argument
+        for the input.
         If you supply a positional argument instead,
         it will guess the input type.
         Choose from the following keyword arguments:
@@ -1315,6 +1851,39 @@ class Reader:
         bytes
           ``bytes`` or ``bytearray`` with PNG data.
 
+        The remaining keyword arguments tune decoding:
+
+        decompress_block
+          Maximum size, in bytes, of each block of
+          decompressed image data (default 64 KiB).
+          Peak decode memory is bounded by this,
+          not by the size of the ``IDAT`` chunks in the file.
+          0 means no limit (one block per ``IDAT`` chunk).
+        pipeline
+          When non-zero, decode in a pipeline of threads:
+          one thread reads and checksums the chunks,
+          another decompresses them,
+          and the thread consuming the rows undoes the filtering.
+          The value is the number of blocks that may be
+          queued between one stage and the next.
+          Default 0 (decode everything in the calling thread).
+
+        Both file reads and ``zlib`` release the GIL, so
+        the pipeline hides I/O and decompression latency
+        behind the filtering (for example, with large images on
+        network storage).
+        In pipelined mode the file object must not be used
+        by anything else until all the rows have been read.
+
+        validation
+          How thoroughly to check the input:
+          a :class:`ValidationPolicy`, or the name of
+          one of its profiles
+          (``'full'``, ``'header'``, or ``'trusted'``).
+          Default ``'full'``.
+          Pass the same policy object to several readers to
+          accumulate their counters.
+
         """
         keywords_supplied = (
             (_guess is not None) +
@@ -1332,6 +1901,11 @@ class Reader:
         # past the 4 bytes that specify the chunk type).
         # See preamble method for how this is used.
         self.atchunk = None
+        self.decompress_block = decompress_block
+        self.pipeline = pipeline
+        if not isinstance(validation, ValidationPolicy):
+            validation = ValidationPolicy(validation)
+        self.validation = validation
 
         if _guess is not None:
             if isarray(_guess):
@@ -1360,6 +1934,9 @@ class Reader:
 
         If the optional `lenient` argument evaluates to `True`,
         checksum failures will raise warnings rather than exceptions.
+
+        Whether the checksum is verified at all is decided by
+        the reader's :class:`ValidationPolicy`.
         """
 
         self.validate_signature()
@@ -1380,6 +1957,22 @@ class Reader:
         checksum = self.file.read(4)
         if len(checksum) != 4:
             raise ChunkError('Chunk %s too short for checksum.' % type)
+        return self._check_chunk(type, data, checksum, lenient)
+
+    def _check_chunk(self, type, data, checksum, lenient=False):
+        """
+        Check the `checksum` (4 bytes) of a chunk,
+        as allowed by the validation policy;
+        returns a (*type*, *data*) tuple.
+        """
+
+        counters = self.validation.counters
+        counters['chunks'] += 1
+        if not self.validation.check_chunk(type):
+            counters['crc_skipped'] += 1
+            return type, data
+        counters['crc_checked'] += 1
+        counters['crc_bytes'] += len(data) + 4
         verify = zlib.crc32(type)
         verify = zlib.crc32(data, verify)
         verify = struct.pack('!I', verify)
@@ -1466,29 +2059,31 @@ class Reader:
 
         # Values per row (of the target image)
         vpr = self.width * self.planes
+        planes = self.planes
 
         # Values per image
         vpi = vpr * self.height
         # Interleaving writes to the output array randomly
         # (well, not quite), so the entire output array must be in memory.
-        # Make a result array, and make it big enough.
+        # Make a result array, and make it big enough
+        # (straight from a zeroed buffer, without a temporary list).
         if self.bitdepth > 8:
-            a = array('H', [0] * vpi)
+            a = array('H', bytes(2 * vpi))
         else:
-            a = bytearray([0] * vpi)
+            a = bytearray(vpi)
         source_offset = 0
 
-        for lines in adam7_generate(self.width, self.height):
+        # The slices are worked out once for each pass.
+        for x, ystart, xstep, ystep, ppr in adam7_passes(
+                self.width, self.height):
+            # Row size in bytes for this pass.
+            row_size = int(math.ceil(self.psize * ppr))
+            skip = planes * xstep
             # The previous (reconstructed) scanline.
             # `None` at the beginning of a pass
             # to indicate that there is no previous line.
             recon = None
-            for x, y, xstep in lines:
-                # Pixels per row (reduced pass image)
-                ppr = int(math.ceil((self.width - x) / float(xstep)))
-                # Row size in bytes for this pass.
-                row_size = int(math.ceil(self.psize * ppr))
-
+            for y in range(ystart, self.height, ystep):
                 filter_type = raw[source_offset]
                 source_offset += 1
                 scanline = raw[source_offset: source_offset + row_size]
@@ -1496,17 +2091,16 @@ class Reader:
                 recon = self.undo_filter(filter_type, scanline, recon)
                 # Convert so that there is one element per pixel value
                 flat = self._bytes_to_values(recon, width=ppr)
+                offset = y * vpr + x * planes
                 if xstep == 1:
                     assert x == 0
-                    offset = y * vpr
                     a[offset: offset + vpr] = flat
+                elif planes == 1:
+                    a[offset: (y + 1) * vpr: skip] = flat
                 else:
-                    offset = y * vpr + x * self.planes
                     end_offset = (y + 1) * vpr
-                    skip = self.planes * xstep
-                    for i in range(self.planes):
-                        a[offset + i: end_offset: skip] = \
-                            flat[i:: self.planes]
+                    for i in range(planes):
+                        a[offset + i: end_offset: skip] = flat[i::planes]
 
         return a
 
@@ -1530,21 +2124,12 @@ class Reader:
         if self.bitdepth == 8:
             return bytearray(bs)
         if self.bitdepth == 16:
-            return array('H',
-                         struct.unpack('!%dH' % (len(bs) // 2), bs))
+            return unpack_16(bs)
 
         assert self.bitdepth < 8
         if width is None:
             width = self.width
-        # Samples per byte
-        spb = 8 // self.bitdepth
-        out = bytearray()
-        mask = 2**self.bitdepth - 1
-        shifts = [self.bitdepth * i
-                  for i in reversed(list(range(spb)))]
-        for o in bs:
-            out.extend([mask & (o >> i) for i in shifts])
-        return out[:width]
+        return unpack_sub_byte(bs, self.bitdepth, width)
 
     def _iter_straight_packed(self, byte_blocks):
         """Iterator that undoes the effect of filtering;
@@ -1597,6 +2182,8 @@ class Reader:
 
         If the optional `lenient` argument evaluates to `True`,
         checksum failures will raise warnings rather than exceptions.
+        Which checks are made is decided by
+        the reader's :class:`ValidationPolicy`.
         """
 
         self.validate_signature()
@@ -1621,12 +2208,23 @@ class Reader:
         x = self.file.read(8)
         if not x:
             return None
+        return self._parse_chunk_header(x)
+
+    def _parse_chunk_header(self, x):
+        """
+        Parse the 8 bytes `x` that start a chunk;
+        return a (*length*, *type*) pair.
+        """
+
         if len(x) != 8:
             raise FormatError(
                 'End of file whilst reading chunk length and type.')
         length, type = struct.unpack('!I4s', x)
         if length > 2 ** 31 - 1:
             raise FormatError('Chunk %s is too large: %d.' % (type, length))
+        if not self.validation.check_chunk(type):
+            return length, type
+        self.validation.counters['type_checked'] += 1
         # Check that all bytes are in valid ASCII range.
         # https://www.w3.org/TR/2003/REC-PNG-20031110/#5Chunk-layout
         type_bytes = set(bytearray(type))
@@ -1706,7 +2304,7 @@ class Reader:
 
     def _process_PLTE(self, data):
         # http://www.w3.org/TR/PNG/#11PLTE
-        if self.plte:
+        if self.plte and self.validation.check_order():
             warnings.warn("Multiple PLTE chunks present.")
         self.plte = data
         if len(data) % 3 != 0:
@@ -1720,7 +2318,7 @@ class Reader:
     def _process_bKGD(self, data):
         try:
             if self.colormap:
-                if not self.plte:
+                if not self.plte and self.validation.check_order():
                     warnings.warn(
                         "PLTE chunk is required before bKGD chunk.")
                 self.background = struct.unpack('B', data)
@@ -1735,7 +2333,9 @@ class Reader:
         self.trns = data
         if self.colormap:
             if not self.plte:
-                warnings.warn("PLTE chunk is required before tRNS chunk.")
+                if self.validation.check_order():
+                    warnings.warn(
+                        "PLTE chunk is required before tRNS chunk.")
             else:
                 if len(data) > len(self.plte) / 3:
                     # Was warning, but promoted to Error as it
@@ -1774,6 +2374,26 @@ class Reader:
             struct.unpack(fmt, data)
         self.unit_is_meter = bool(unit)
 
+    def raw_size(self):
+        """
+        Return the size, in bytes,
+        of the decompressed image data implied by the ``IHDR`` chunk:
+        every scanline (of every reduced image, when interlaced)
+        together with its filter type byte.
+        """
+
+        if not self.interlace:
+            return self.height * (self.row_bytes + 1)
+        size = 0
+        for xstart, ystart, xstep, ystep in adam7:
+            if xstart >= self.width:
+                continue
+            rows = len(range(ystart, self.height, ystep))
+            # Pixels per row (reduced pass image)
+            ppr = int(math.ceil((self.width - xstart) / float(xstep)))
+            size += rows * (int(math.ceil(self.psize * ppr)) + 1)
+        return size
+
     def read(self, lenient=False):
         """
         Read the PNG file and decode it.
@@ -1786,8 +2406,13 @@ class Reader:
 
         If the optional `lenient` argument evaluates to True,
         checksum failures will raise warnings rather than exceptions.
+        Which checks are made is decided by
+        the reader's :class:`ValidationPolicy`
+        (see the `validation` argument of :class:`Reader`).
         """
 
+        check_order = self.validation.check_order()
+
         def iteridat():
             """Iterator that yields all the ``IDAT`` chunks as strings."""
             while True:
@@ -1799,30 +2424,47 @@ class Reader:
                     continue
                 # type == b'IDAT'
                 # http://www.w3.org/TR/PNG/#11IDAT
-                if self.colormap and not self.plte:
+                if check_order and self.colormap and not self.plte:
                     warnings.warn("PLTE chunk is required before IDAT chunk")
                 yield data
 
         self.preamble(lenient=lenient)
-        raw = decompress(iteridat())
+        idat = iteridat()
+        if self.pipeline:
+            idat = threaded(idat, self.pipeline)
+        raw = decompress(idat,
+                         max_length=self.decompress_block,
+                         limit=self.raw_size())
+        if self.pipeline:
+            raw = threaded(raw, self.pipeline)
 
         if self.interlace:
             def rows_from_interlace():
                 """Yield each row from an interlaced PNG."""
                 # It's important that this iterator doesn't read
                 # IDAT chunks until it yields the first row.
-                bs = bytearray(itertools.chain(*raw))
-                arraycode = 'BH'[self.bitdepth > 8]
+                bs = bytearray()
+                for block in raw:
+                    bs.extend(block)
                 # Like :meth:`group` but
                 # producing an array.array object for each row.
                 values = self._deinterlace(bs)
+                if not isarray(values):
+                    values = array('B', values)
                 vpr = self.width * self.planes
                 for i in range(0, len(values), vpr):
-                    row = array(arraycode, values[i:i+vpr])
-                    yield row
+                    yield values[i:i+vpr]
             rows = rows_from_interlace()
         else:
             rows = self._iter_bytes_to_values(self._iter_straight_packed(raw))
+        return self.width, self.height, rows, self._info()
+
+    def _info(self):
+        """
+        The *info* dictionary returned by :meth:`read`,
+        made from the metadata read by :meth:`preamble`.
+        """
+
         info = dict()
         for attr in 'greyscale alpha planes bitdepth interlace'.split():
             info[attr] = getattr(self, attr)
@@ -1837,7 +2479,7 @@ class Reader:
                                           self.unit_is_meter)
         if self.plte:
             info['palette'] = self.palette()
-        return self.width, self.height, rows, info
+        return info
 
     def read_flat(self):
         """
@@ -1943,42 +2585,14 @@ class Reader:
             info['bitdepth'] = 8
             info['planes'] = 3 + bool(self.trns)
             plte = self.palette()
-
-            def iterpal(pixels):
-                for row in pixels:
-                    row = [plte[x] for x in row]
-                    yield array('B', itertools.chain(*row))
-            pixels = iterpal(pixels)
+            pixels = expand_palette_rows(pixels, plte)
         elif self.trns:
-            # It would be nice if there was some reasonable way
-            # of doing this without generating a whole load of
-            # intermediate tuples.  But tuples does seem like the
-            # easiest way, with no other way clearly much simpler or
-            # much faster.  (Actually, the L to LA conversion could
-            # perhaps go faster (all those 1-tuples!), but I still
-            # wonder whether the code proliferation is worth it)
             it = self.transparent
             maxval = 2 ** info['bitdepth'] - 1
             planes = info['planes']
             info['alpha'] = True
             info['planes'] += 1
-            typecode = 'BH'[info['bitdepth'] > 8]
-
-            def itertrns(pixels):
-                for row in pixels:
-                    # For each row we group it into pixels, then form a
-                    # characterisation vector that says whether each
-                    # pixel is opaque or not.  Then we convert
-                    # True/False to 0/maxval (by multiplication),
-                    # and add it as the extra channel.
-                    row = group(row, planes)
-                    opa = map(it.__ne__, row)
-                    opa = map(maxval.__mul__, opa)
-                    opa = list(zip(opa))    # convert to 1-tuples
-                    yield array(
-                        typecode,
-                        itertools.chain(*map(operator.add, row, opa)))
-            pixels = itertrns(pixels)
+            pixels = add_transparency_rows(pixels, planes, maxval, it)
         targetbitdepth = None
         if self.sbit:
             sbit = struct.unpack('%dB' % len(self.sbit), self.sbit)
@@ -1990,11 +2604,14 @@ class Reader:
                 raise Error('sBIT chunk %r has a 0-entry' % sbit)
         if targetbitdepth:
             shift = info['bitdepth'] - targetbitdepth
+            table = make_value_table(
+                [p >> shift for p in range(2 ** info['bitdepth'])])
+            typecode = 'BH'[targetbitdepth > 8]
             info['bitdepth'] = targetbitdepth
 
             def itershift(pixels):
                 for row in pixels:
-                    yield [p >> shift for p in row]
+                    yield map_values(table, row, typecode)
             pixels = itershift(pixels)
         return x, y, pixels, info
 
@@ -2004,12 +2621,19 @@ class Reader:
         width, height, pixels, info = get()
         maxval = 2**info['bitdepth'] - 1
         targetmaxval = 2**targetbitdepth - 1
-        factor = float(targetmaxval) / float(maxval)
+        sourcebitdepth = info['bitdepth']
+        typecode = 'BH'[targetbitdepth > 8]
         info['bitdepth'] = targetbitdepth
 
         def iterscale():
+            if maxval == 2**16 - 1 and targetmaxval == 2**8 - 1:
+                for row in pixels:
+                    yield rescale_16_to_8(row)
+                return
+            # Only built here: for 16-bit sources it has 65536 entries.
+            table = make_rescale_table(sourcebitdepth, targetbitdepth)
             for row in pixels:
-                yield [int(round(x * factor)) for x in row]
+                yield map_values(table, row, typecode)
         if maxval == targetmaxval:
             return width, height, pixels, info
         else:
@@ -2050,7 +2674,7 @@ class Reader:
 
         return self._as_rescale(self.asRGBA, 8)
 
-    def asRGB(self):
+    def asRGB(self, out=None):
         """
         Return image as RGB pixels.
         RGB colour images are passed through unchanged;
@@ -2063,6 +2687,14 @@ class Reader:
         the *info* reflect the returned pixels, not the source image.
         In particular,
         for this method ``info['greyscale']`` will be ``False``.
+
+        If `out` is given, greyscale rows are expanded into it
+        instead of into a freshly allocated row;
+        it should be a ``bytearray`` (or ``array('H')`` for
+        bit depths above 8) of ``3 * width`` values.
+        Every row yielded is then that same `out` object,
+        so each row must be used (or copied) before
+        the next one is requested.
         """
 
         width, height, pixels, info = self.asDirect()
@@ -2072,23 +2704,43 @@ class Reader:
             return width, height, pixels, info
         info['greyscale'] = False
         info['planes'] = 3
-
-        if info['bitdepth'] > 8:
-            def newarray():
-                return array('H', [0])
-        else:
-            def newarray():
-                return bytearray([0])
+        bitdepth = info['bitdepth']
 
         def iterrgb():
             for row in pixels:
-                a = newarray() * 3 * width
-                for i in range(3):
-                    a[i::3] = row
+                if out is None:
+                    a = new_pixel_array(bitdepth, width, 3)
+                else:
+                    a = out
+                convert_l_to_rgb(row, a)
                 yield a
         return width, height, iterrgb(), info
 
-    def asRGBA(self):
+    def asRGB_flat(self, out=None):
+        """
+        Like :meth:`asRGB`, but return the pixel data as
+        a single array of values (as :meth:`read_flat` does).
+        Greyscale images are expanded with a few strided copies
+        over the whole image rather than a few for every row.
+        If `out` is given, the values are written into it;
+        it should be a ``bytearray`` (or ``array('H')``)
+        of ``3 * width * height`` values.
+        """
+
+        width, height, pixels, info = self.asDirect()
+        if info['alpha']:
+            raise Error("will not convert image with alpha channel to RGB")
+        pixels = flatten_rows(pixels, info['bitdepth'])
+        if not info['greyscale']:
+            return width, height, copy_into(pixels, out), info
+        info['greyscale'] = False
+        info['planes'] = 3
+        if out is None:
+            out = new_pixel_array(info['bitdepth'], width * height, 3)
+        convert_l_to_rgb(pixels, out)
+        return width, height, out, info
+
+    def asRGBA(self, out=None):
         """
         Return image as RGBA pixels.
         Greyscales are expanded into RGB triplets;
@@ -2098,71 +2750,459 @@ class Reader:
         In particular, for this method
         ``info['greyscale']`` will be ``False``, and
         ``info['alpha']`` will be ``True``.
+
+        If `out` is given, converted rows are written into it
+        instead of into a freshly allocated row
+        (see :meth:`asRGB`);
+        it should have ``4 * width`` values.
         """
 
         width, height, pixels, info = self.asDirect()
         if info['alpha'] and not info['greyscale']:
             return width, height, pixels, info
-        typecode = 'BH'[info['bitdepth'] > 8]
-        maxval = 2**info['bitdepth'] - 1
-        maxbuffer = struct.pack('=' + typecode, maxval) * 4 * width
+        convert = rgba_conversion(info)
+        bitdepth = info['bitdepth']
+        if out is not None:
+            # Only the alpha channel needs to be initialized;
+            # the conversion fills in the rest.
+            out[3::4] = new_pixel_array(bitdepth, width, 4)[3::4]
+
+        def iterrgba():
+            for row in pixels:
+                if out is None:
+                    a = new_pixel_array(bitdepth, width, 4)
+                else:
+                    a = out
+                convert(row, a)
+                yield a
+        info['alpha'] = True
+        info['greyscale'] = False
+        info['planes'] = 4
+        return width, height, iterrgba(), info
 
-        if info['bitdepth'] > 8:
-            def newarray():
-                return array('H', maxbuffer)
-        else:
-            def newarray():
-                return bytearray(maxbuffer)
+    def asRGBA_flat(self, out=None):
+        """
+        Like :meth:`asRGBA`, but return the pixel data as
+        a single array of values (as :meth:`read_flat` does).
+        The conversion is a few strided copies
+        over the whole image rather than a few for every row.
+        If `out` is given, the values are written into it;
+        it should be a ``bytearray`` (or ``array('H')``)
+        of ``4 * width * height`` values.
+        """
 
-        if info['alpha'] and info['greyscale']:
-            # LA to RGBA
-            def convert():
-                for row in pixels:
-                    # Create a fresh target row, then copy L channel
-                    # into first three target channels, and A channel
-                    # into fourth channel.
-                    a = newarray()
-                    convert_la_to_rgba(row, a)
-                    yield a
-        elif info['greyscale']:
-            # L to RGBA
-            def convert():
-                for row in pixels:
-                    a = newarray()
-                    convert_l_to_rgba(row, a)
-                    yield a
+        width, height, pixels, info = self.asDirect()
+        pixels = flatten_rows(pixels, info['bitdepth'])
+        if info['alpha'] and not info['greyscale']:
+            return width, height, copy_into(pixels, out), info
+        convert = rgba_conversion(info)
+        if out is None:
+            out = new_pixel_array(info['bitdepth'], width * height, 4)
         else:
-            assert not info['alpha'] and not info['greyscale']
-            # RGB to RGBA
-
-            def convert():
-                for row in pixels:
-                    a = newarray()
-                    convert_rgb_to_rgba(row, a)
-                    yield a
+            out[3::4] = new_pixel_array(
+                info['bitdepth'], width * height, 4)[3::4]
+        convert(pixels, out)
         info['alpha'] = True
         info['greyscale'] = False
         info['planes'] = 4
-        return width, height, convert(), info
+        return width, height, out, info
+
+
+class RowDecoder:
+    """
+    Push-style decoder for the image data of a PNG file:
+    the compressed ``IDAT`` data is given to :meth:`feed`
+    in pieces of any size, and
+    each call to :meth:`decode` returns the rows that
+    can be finished so far.
+    Used by :class:`AsyncReader`,
+    which runs :meth:`decode` in an executor.
+
+    `reader` is a :class:`Reader` that has read the preamble.
+    Each call to :meth:`decode` decompresses at most
+    `max_length` bytes, which bounds the work (and memory) per call.
+    Interlaced images cannot be decoded a row at a time:
+    all their rows are returned by the final call.
+    """
+
+    def __init__(self, reader, max_length=2**18):
+        self.reader = reader
+        self.max_length = max_length
+        self.limit = reader.raw_size()
+        self.total = 0
+        self.decompressor = zlib.decompressobj()
+        # Compressed bytes not yet decompressed.
+        self.tail = b''
+        # Decompressed bytes not yet made into rows.
+        self.pending = bytearray()
+        # The previous (reconstructed) scanline.
+        self.recon = None
+
+    def feed(self, data):
+        """Add more compressed data."""
+
+        self.tail += data
+
+    def decode(self, final=False):
+        """
+        Decompress some of the data fed so far;
+        return a (*rows*, *more*) pair.
+        *rows* is a list of the rows finished
+        (as for :meth:`Reader.read`);
+        *more* is ``True`` when calling again without
+        feeding more data may return more rows.
+        `final` should be ``True`` once
+        all of the image data has been fed.
+        """
+
+        d = self.decompressor
+        block = d.decompress(self.tail, self.max_length)
+        self.tail = d.unconsumed_tail
+        more = bool(self.tail) or len(block) == self.max_length
+        done = final and not more
+        if done:
+            block += d.flush()
+        self.total += len(block)
+        if self.total > self.limit:
+            raise FormatError(
+                "Decompressed IDAT data exceeds %d bytes"
+                " expected from IHDR." % self.limit)
+        self.pending.extend(block)
+
+        r = self.reader
+        if r.interlace:
+            if not done:
+                return [], more
+            values = r._deinterlace(self.pending)
+            if not isarray(values):
+                values = array('B', values)
+            vpr = r.width * r.planes
+            rows = [values[i:i+vpr] for i in range(0, len(values), vpr)]
+            return rows, more
+
+        rows = []
+        a = self.pending
+        rb = r.row_bytes
+        offset = 0
+        while len(a) - offset >= rb + 1:
+            filter_type = a[offset]
+            scanline = a[offset + 1: offset + rb + 1]
+            offset += rb + 1
+            self.recon = r.undo_filter(filter_type, scanline, self.recon)
+            rows.append(r._bytes_to_values(self.recon))
+        del a[:offset]
+        if done and a:
+            raise FormatError('Wrong size for decompressed IDAT chunk.')
+        return rows, more
+
+
+class AsyncReader:
+    """
+    PNG decoder for :mod:`asyncio` programs.
+
+    The file is read from `stream`, which is
+    an :class:`asyncio.StreamReader` or
+    any object with a coroutine method ``read(n)``.
+    Chunks are read without blocking the event loop;
+    decompression and unfiltering, which are CPU bound,
+    are done in `executor`
+    (``None`` means the event loop's default executor),
+    in batches of at most `batch_size` decompressed bytes.
+    Rows are only decoded as fast as they are consumed,
+    so a slow consumer holds back reading of the stream.
+
+    The remaining keyword arguments are passed to :class:`Reader`
+    (for example `validation`).
+    """
+
+    def __init__(self, stream, executor=None, batch_size=2**18,
+                 **kwargs):
+        self.stream = stream
+        self.executor = executor
+        self.batch_size = batch_size
+        self.reader_options = kwargs
+        self.reader = None
+
+    async def _read_exactly(self, n):
+        """
+        Read `n` bytes from the stream;
+        fewer are returned only at the end of the stream.
+        """
+
+        readexactly = getattr(self.stream, 'readexactly', None)
+        if readexactly is not None:
+            try:
+                return await readexactly(n)
+            except asyncio.IncompleteReadError as e:
+                return e.partial
+        data = b''
+        while len(data) < n:
+            more = await self.stream.read(n - len(data))
+            if not more:
+                break
+            data += more
+        return data
+
+    async def _chunk_data(self, length, type):
+        """Read the data and checksum of a chunk, and check them."""
+
+        data = await self._read_exactly(length)
+        if len(data) != length:
+            raise ChunkError(
+                'Chunk %s too short for required %i octets.'
+                % (type, length))
+        checksum = await self._read_exactly(4)
+        if len(checksum) != 4:
+            raise ChunkError('Chunk %s too short for checksum.' % type)
+        return data, checksum
+
+    async def preamble(self, lenient=False):
+        """
+        Read the stream up to the first ``IDAT`` chunk, and
+        process the metadata as :meth:`Reader.preamble` does.
+        Afterwards the :class:`Reader` is available as `reader`.
+        """
+
+        if self.reader is not None:
+            return
+        # The chunks before IDAT are small, so they are collected
+        # and given to an ordinary Reader, which checks them.
+        head = bytearray(await self._read_exactly(8))
+        if len(head) == 8:
+            while True:
+                x = await self._read_exactly(8)
+                head.extend(x)
+                if len(x) != 8:
+                    break
+                length, type = struct.unpack('!I4s', x)
+                if type == b'IDAT':
+                    break
+                if length > 2 ** 31 - 1:
+                    raise FormatError(
+                        'Chunk %s is too large: %d.' % (type, length))
+                data, checksum = await self._chunk_data(length, type)
+                head.extend(data)
+                head.extend(checksum)
+        reader = Reader(bytes=bytes(head), **self.reader_options)
+        reader.preamble(lenient=lenient)
+        self.reader = reader
+
+    async def _iter_idat(self, lenient=False):
+        """Yield the contents of each ``IDAT`` chunk."""
+
+        r = self.reader
+        check_order = r.validation.check_order()
+        # The reader has already consumed the first IDAT header.
+        length, type = r.atchunk
+        r.atchunk = None
+        while True:
+            data, checksum = await self._chunk_data(length, type)
+            type, data = r._check_chunk(type, data, checksum, lenient)
+            if type == b'IEND':
+                # http://www.w3.org/TR/PNG/#11IEND
+                return
+            if type == b'IDAT':
+                if check_order and r.colormap and not r.plte:
+                    warnings.warn("PLTE chunk is required before IDAT chunk")
+                yield data
+            x = await self._read_exactly(8)
+            if not x:
+                raise ChunkError("No more chunks.")
+            length, type = r._parse_chunk_header(x)
 
+    async def _iter_rows(self, lenient=False):
+        loop = asyncio.get_running_loop()
+        decoder = RowDecoder(self.reader, self.batch_size)
 
-def decompress(data_blocks):
+        async def drain(final):
+            while True:
+                rows, more = await loop.run_in_executor(
+                    self.executor, decoder.decode, final)
+                for row in rows:
+                    yield row
+                if not more:
+                    return
+
+        async for data in self._iter_idat(lenient):
+            decoder.feed(data)
+            if len(decoder.tail) >= self.batch_size:
+                async for row in drain(False):
+                    yield row
+        async for row in drain(True):
+            yield row
+
+    async def read(self, lenient=False):
+        """
+        Read the PNG file and decode it;
+        like :meth:`Reader.read`, but
+        `rows` is an asynchronous iterator.
+        """
+
+        await self.preamble(lenient=lenient)
+        r = self.reader
+        return r.width, r.height, self._iter_rows(lenient), r._info()
+
+
+class AsyncWriter:
+    """
+    PNG encoder for :mod:`asyncio` programs.
+
+    The PNG file is written to `stream`, which is
+    an :class:`asyncio.StreamWriter` or
+    any object with a ``write(data)`` method and
+    a coroutine method ``drain()``.
+    Encoding is done by a :class:`Writer`
+    (made from the remaining keyword arguments)
+    running in `executor`
+    (``None`` means the event loop's default executor).
+    Each piece of output is drained before encoding continues,
+    so a slow stream holds back the encoder
+    rather than filling memory.
+    """
+
+    def __init__(self, stream, executor=None, **kwargs):
+        self.stream = stream
+        self.executor = executor
+        self.writer = Writer(**kwargs)
+
+    async def _write_bytes(self, data):
+        self.stream.write(data)
+        await self.stream.drain()
+
+    async def write(self, rows):
+        """
+        Write the image; `rows` is as for :meth:`Writer.write`,
+        or an asynchronous iterable of rows.
+        """
+
+        loop = asyncio.get_running_loop()
+        stream = self
+
+        class Outfile:
+            # A file for the Writer, in the executor thread,
+            # that hands each write to the event loop and waits.
+            def write(self, data):
+                asyncio.run_coroutine_threadsafe(
+                    stream._write_bytes(bytes(data)), loop).result()
+
+        if hasattr(rows, '__aiter__'):
+            rows = self._iter_sync(rows, loop)
+        await loop.run_in_executor(
+            self.executor, self.writer.write, Outfile(), rows)
+
+    @staticmethod
+    def _iter_sync(rows, loop):
+        """
+        Iterate, from a thread other than the event loop's,
+        over an asynchronous iterable of rows.
+        """
+
+        iterator = rows.__aiter__()
+        while True:
+            future = asyncio.run_coroutine_threadsafe(
+                iterator.__anext__(), loop)
+            try:
+                yield future.result()
+            except StopAsyncIteration:
+                return
+
+
+def decompress(data_blocks, max_length=2**16, limit=None):
     """
     `data_blocks` should be an iterable that
     yields the compressed data (from the ``IDAT`` chunks).
     This yields decompressed byte strings.
+
+    Each yielded block is at most `max_length` bytes,
+    however the input happens to be chunked;
+    a `max_length` of 0 (or ``None``) yields
+    whatever each ``IDAT`` chunk decompresses to.
+    If `limit` is given,
+    a :class:`FormatError` is raised as soon as
+    the total decompressed size would exceed it
+    (see :meth:`Reader.raw_size`).
     """
 
-    # Currently, with no max_length parameter to decompress,
-    # this routine will do one yield per IDAT chunk: Not very
-    # incremental.
     d = zlib.decompressobj()
+    total = 0
+
+    def check(block):
+        if limit is not None and total > limit:
+            raise FormatError(
+                "Decompressed IDAT data exceeds %d bytes"
+                " expected from IHDR." % limit)
+        return bytearray(block)
+
     # Each IDAT chunk is passed to the decompressor, then any
     # remaining state is decompressed out.
     for data in data_blocks:
-        # :todo: add a max_length argument here to limit output size.
-        yield bytearray(d.decompress(data))
-    yield bytearray(d.flush())
+        if not max_length:
+            block = d.decompress(data)
+            total += len(block)
+            yield check(block)
+            continue
+        # Feed the decompressor until it has consumed all the input
+        # and has no more output pending
+        # (a full block means there may be more to come).
+        while True:
+            block = d.decompress(data, max_length)
+            total += len(block)
+            if block:
+                yield check(block)
+            data = d.unconsumed_tail
+            if not data and len(block) < max_length:
+                break
+    block = d.flush()
+    total += len(block)
+    yield check(block)
+
+
+def threaded(iterable, maxsize):
+    """
+    Iterate over `iterable` in a separate thread,
+    yielding its items in the calling thread.
+    At most `maxsize` items are queued between the two threads.
+    An exception raised by `iterable` is re-raised in the calling thread.
+
+    Nothing happens until the first item is requested;
+    if the caller stops early, the thread stops too.
+    """
+
+    q = queue.Queue(maxsize)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException as e:
+            put((done, e))
+        else:
+            put((done, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = q.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
 
 
 def check_bitdepth_colortype(bitdepth, colortype):
@@ -2267,6 +3307,344 @@ def undo_filter_paeth(filter_unit, scanline, previous, result):
         ai += 1
 
 
+def to_lanes(bs, size=1):
+    """
+    Spread a sequence of bytes into a (big) integer
+    with one 16-bit lane for each byte, the first byte most significant.
+    Arithmetic on such integers works on every byte at once,
+    provided that each lane stays between 0 and 65535.
+    With `size` 2, `bs` holds big-endian 16-bit samples,
+    and each sample gets a 32-bit lane.
+    """
+
+    lanes = bytearray(2 * len(bs))
+    for i in range(size):
+        lanes[size + i::2 * size] = bs[i::size]
+    return int.from_bytes(lanes, 'big')
+
+
+def from_lanes(v, n, size=1):
+    """
+    Return the low byte of each of the `n` 16-bit lanes of `v`
+    (the inverse of :meth:`to_lanes`, modulo 256),
+    or with `size` 2 the low 16 bits of each of `n` 32-bit lanes,
+    as big-endian samples.
+    """
+
+    if size == 1:
+        return v.to_bytes(2 * n, 'big')[1::2]
+    lanes = v.to_bytes(2 * size * n, 'big')
+    bs = bytearray(size * n)
+    for i in range(size):
+        bs[i::size] = lanes[size + i::2 * size]
+    return bs
+
+
+def filter_scanline(filter_type, filter_unit, line, previous):
+    """
+    Apply the filter `filter_type` (0 to 4) to a scanline;
+    the inverse of :meth:`Reader.undo_filter`.
+    `line` and `previous` are ``bytes``;
+    `previous` is ``None`` for the first scanline of
+    an image (or of a pass of an interlaced image).
+    Returns the filtered scanline as ``bytes``
+    (without the filter type byte).
+    """
+
+    if filter_type not in (0, 1, 2, 3, 4):
+        raise ProtocolError("filter type %r is not 0 to 4" % filter_type)
+    for _, filtered in iter_filtered_scanlines(
+            (filter_type,), filter_unit, line, previous):
+        return filtered
+
+
+def iter_filtered_scanlines(filter_types, filter_unit, line, previous):
+    """
+    Yield a (*filter_type*, *filtered*) pair for
+    each of `filter_types` applied to the scanline `line`;
+    arguments are as for :meth:`filter_scanline`.
+
+    All the byte arithmetic is done at once on
+    16-bit lanes of big integers (see :meth:`to_lanes`),
+    so there is no per byte Python code;
+    the lanes are shared between the filters.
+    """
+
+    n = len(line)
+    if not previous:
+        previous = bytes(n)
+    one = int.from_bytes(b'\x00\x01' * n, 'big')
+    x = to_lanes(line)
+    # a, b, c as in https://www.w3.org/TR/PNG/#9Filter-types
+    a = to_lanes(bytes(filter_unit) + line[:-filter_unit])
+    b = to_lanes(previous)
+    for filter_type in filter_types:
+        if filter_type == 0:
+            yield 0, line
+        elif filter_type == 1:
+            yield 1, from_lanes(x + 256 * one - a, n)
+        elif filter_type == 2:
+            yield 2, from_lanes(x + 256 * one - b, n)
+        elif filter_type == 3:
+            # Shifting moves each lane's bottom bit into
+            # the top of the next lane, which the mask clears.
+            average = ((a + b) >> 1) & (255 * one)
+            yield 3, from_lanes(x + 256 * one - average, n)
+        else:
+            c = to_lanes(bytes(filter_unit) + previous[:-filter_unit])
+            yield 4, from_lanes(x + 256 * one - paeth_lanes(a, b, c, one), n)
+
+
+def paeth_lanes(a, b, c, one):
+    """
+    The Paeth predictor for each lane of `a`, `b`, `c`
+    (see :meth:`to_lanes`);
+    `one` has 1 in every lane.
+    """
+
+    full = 0xffff * one
+    bias = 1024 * one
+
+    def distance(p, q):
+        """|p - q| in each lane, for lanes up to 510."""
+        pq = p + bias - q
+        qp = q + bias - p
+        # 0xffff in lanes where p >= q, 0 elsewhere.
+        mask = ((pq >> 10) & one) * 0xffff
+        return ((pq & mask) | (qp & (full ^ mask))) - bias
+
+    def at_most(p, q):
+        """1 in lanes where p <= q, 0 elsewhere."""
+        return ((q + 2 * bias - p) >> 11) & one
+
+    pa = distance(b, c)
+    pb = distance(a, c)
+    pc = distance(a + b, c + c)
+    use_a = at_most(pa, pb) & at_most(pa, pc)
+    use_b = (one ^ use_a) & at_most(pb, pc)
+    use_c = one ^ use_a ^ use_b
+    return ((a & use_a * 0xffff) |
+            (b & use_b * 0xffff) |
+            (c & use_c * 0xffff))
+
+
+# Maps each filtered byte to its magnitude as a signed byte.
+signed_magnitude = bytes(min(i, 256 - i) for i in range(256))
+
+
+def filter_scanline_adaptive(filter_unit, line, previous,
+                             filter_types=(0, 1, 2, 3, 4)):
+    """
+    Filter a scanline with whichever of `filter_types` gives
+    the smallest sum of absolute values of the filtered bytes
+    (taken as signed);
+    the heuristic recommended by the PNG specification,
+    https://www.w3.org/TR/PNG/#12Filter-selection .
+    Returns a (*filter_type*, *filtered*) pair.
+    """
+
+    if not previous:
+        # On the first line, Up is None and Paeth is Sub.
+        filter_types = [t for t in filter_types if t not in (2, 4)] or [0]
+    best = None
+    for filter_type, filtered in iter_filtered_scanlines(
+            filter_types, filter_unit, line, previous):
+        cost = sum(filtered.translate(signed_magnitude))
+        if best is None or cost < best[0]:
+            best = cost, filter_type, filtered
+    return best[1:]
+
+
+def expand_palette_rows(rows, palette):
+    """
+    Yield each row of palette indexes converted to
+    an ``array('B')`` of RGB or RGBA values
+    (according to the size of the `palette` entries).
+
+    Each channel of the palette is a ``bytes.translate`` table,
+    so a row is converted with one translate and
+    one strided slice per channel,
+    with no Python code run for each pixel.
+    """
+
+    planes = len(palette[0])
+    tables = [bytes(entry[i] for entry in palette).ljust(256, b'\x00')
+              for i in range(planes)]
+    for row in rows:
+        row = bytes(row)
+        if row and max(row) >= len(palette):
+            raise FormatError(
+                "Palette index %d is beyond the end of the palette." %
+                max(row))
+        out = bytearray(len(row) * planes)
+        for i, table in enumerate(tables):
+            out[i::planes] = row.translate(table)
+        yield array('B', out)
+
+
+def add_transparency_rows(rows, planes, maxval, transparent):
+    """
+    Yield each row with an alpha channel added:
+    0 for pixels that are the `transparent` colour
+    (a tuple with one value for each of the `planes`),
+    `maxval` for every other pixel.
+    Rows are yielded as ``array('B')``, or ``array('H')``
+    when `maxval` is more than 255.
+
+    The work is done on the bytes of each row:
+    each byte of the transparent colour has a translate table
+    that marks the bytes equal to it,
+    and the marks for all the bytes of a pixel are combined
+    with a single AND on big integers.
+    """
+
+    typecode = 'BH'[maxval > 255]
+    itemsize = 1 + (maxval > 255)
+    # Bytes per pixel in and out.
+    stride = planes * itemsize
+    out_stride = stride + itemsize
+    # The alpha value of an opaque pixel, in each of its bytes.
+    on = maxval & 0xff
+    if max(transparent) > maxval:
+        # No pixel can be the transparent colour.
+        key = None
+    else:
+        # The transparent colour, in the same byte order as the rows.
+        key = array(typecode, transparent).tobytes()
+        tables = [bytes(on * (i == k) for i in range(256)) for k in key]
+
+    for row in rows:
+        if isarray(row):
+            bs = row.tobytes()
+        else:
+            bs = bytes(row)
+        n = len(bs) // stride
+        opaque = bytes([on]) * n
+        if key is not None:
+            # A pixel is transparent when all its bytes match.
+            match = int.from_bytes(opaque, 'big')
+            for i, table in enumerate(tables):
+                match &= int.from_bytes(bs[i::stride].translate(table), 'big')
+            opaque = (match ^ int.from_bytes(opaque, 'big')).to_bytes(n, 'big')
+        out = bytearray(n * out_stride)
+        for i in range(stride):
+            out[i::out_stride] = bs[i::stride]
+        for i in range(stride, out_stride):
+            out[i::out_stride] = opaque
+        yield array(typecode, out)
+
+
+def rescale_16_to_8(values):
+    """
+    Rescale 16-bit values to 8-bit, returning an ``array('B')``;
+    the same result as :meth:`make_rescale_table` gives, which is
+    ``round(x / 257)``.
+
+    Writing x as ``256*h + l``,
+    that is h, plus 1 when ``l - h >= 129``, minus 1 when ``h - l >= 129``;
+    this is worked out on the high and low bytes of
+    all the values at once (see :meth:`to_lanes`).
+    """
+
+    if not isarray(values):
+        values = array('H', values)
+    bs = values.tobytes()
+    if sys.byteorder == 'little':
+        low, high = bs[0::2], bs[1::2]
+    else:
+        high, low = bs[0::2], bs[1::2]
+    n = len(high)
+    one = int.from_bytes(b'\x00\x01' * n, 'big')
+    h = to_lanes(high)
+    l = to_lanes(low)
+    # Bit 10 of each lane is set when the difference is at least 129.
+    up = ((l + 895 * one - h) >> 10) & one
+    down = ((h + 895 * one - l) >> 10) & one
+    return array('B', from_lanes(h + up - down, n))
+
+
+def new_pixel_array(bitdepth, n, planes):
+    """
+    Return a fresh ``bytearray`` (or ``array('H')`` when `bitdepth`
+    is more than 8) for `n` pixels of `planes` channels each.
+    When there are 4 channels,
+    the alpha channel is initialized to the maximum value
+    (fully opaque) and the rest to 0;
+    otherwise everything is 0.
+    """
+
+    if planes == 4:
+        maxval = 2 ** bitdepth - 1
+        pixel = [0, 0, 0, maxval]
+    else:
+        pixel = [0] * planes
+    if bitdepth > 8:
+        return array('H', pixel) * n
+    return bytearray(pixel) * n
+
+
+def flatten_rows(rows, bitdepth):
+    """
+    Join the rows into a single ``array('B')``
+    (or ``array('H')`` when `bitdepth` is more than 8),
+    copying each row in bulk.
+    """
+
+    if bitdepth > 8:
+        a = array('H')
+        for row in rows:
+            if isarray(row):
+                a.extend(row)
+            else:
+                a.fromlist(list(row))
+        return a
+    a = array('B')
+    for row in rows:
+        if isarray(row) or isinstance(row, (bytes, bytearray)):
+            a.frombytes(row)
+        else:
+            a.fromlist(list(row))
+    return a
+
+
+def copy_into(pixels, out):
+    """Copy `pixels` into `out` (if given) and return the result."""
+
+    if out is None:
+        return pixels
+    if isinstance(out, array):
+        # slice assignment to an array needs an array of the same type
+        out[:] = array(out.typecode, pixels)
+    else:
+        out[:] = pixels
+    return out
+
+
+def rgba_conversion(info):
+    """
+    Return the function that converts
+    pixels as described by `info` (L, LA, or RGB) to RGBA:
+    one of :meth:`convert_la_to_rgba`, :meth:`convert_l_to_rgba`,
+    or :meth:`convert_rgb_to_rgba`.
+    """
+
+    if info['alpha'] and info['greyscale']:
+        return convert_la_to_rgba
+    if info['greyscale']:
+        return convert_l_to_rgba
+    assert not info['alpha'] and not info['greyscale']
+    return convert_rgb_to_rgba
+
+
+def convert_l_to_rgb(row, result):
+    """
+    Convert a grayscale image to RGB.
+    Works on a single row or on the values of a whole image.
+    """
+    for i in range(3):
+        result[i::3] = row
+
+
 def convert_la_to_rgba(row, result):
     for i in range(3):
         result[i::4] = row[0::2]
@@ -2325,11 +3703,252 @@ def cli_open(path):
     return open(path, "rb")
 
 
+@contextlib.contextmanager
+def cli_create(path):
+    if path == "-":
+        yield binary_stdout()
+        return
+    with open(path, "wb") as output:
+        yield output
+
+
+def cli_writer_options(info):
+    """
+    Convert the *info* dictionary returned by :meth:`Reader.read`
+    (or :meth:`Reader.asDirect`) into keyword arguments for
+    a straightlaced :class:`Writer`.
+    """
+
+    options = dict(info)
+    options['interlace'] = False
+    physical = options.pop('physical', None)
+    if physical:
+        options['x_pixels_per_unit'] = physical.x
+        options['y_pixels_per_unit'] = physical.y
+        options['unit_is_meter'] = physical.unit_is_meter
+    return options
+
+
+def luma_rows(rows, width, planes, bitdepth):
+    """
+    Convert RGB or RGBA `rows` to greyscale (L or LA) rows,
+    with the Rec. 601 luma weights.
+    The weighted sum is done once per row on lanes
+    (see :meth:`to_lanes`), using weights scaled to 256 (77, 150, 29):
+    16-bit lanes for 8-bit rows, 32-bit lanes for 16-bit rows,
+    so that the sum of a lane always fits.
+    """
+
+    alpha = planes == 4
+    if bitdepth > 8:
+        size = 2
+        half = to_lanes(b'\x00\x80' * width, size)
+    else:
+        size = 1
+        half = to_lanes(b'\x80' * width)
+    for row in rows:
+        if size == 2:
+            # big-endian bytes, the order of the lanes
+            row = array('H', row)
+            if sys.byteorder == 'little':
+                row.byteswap()
+        row = bytes(row)
+        lanes = (77 * to_lanes(channel_bytes(row, 0, planes, size), size) +
+                 150 * to_lanes(channel_bytes(row, 1, planes, size), size) +
+                 29 * to_lanes(channel_bytes(row, 2, planes, size), size) +
+                 half)
+        grey = from_lanes(lanes >> 8, width, size)
+        if alpha:
+            out = bytearray(2 * width * size)
+            for i in range(size):
+                out[i::2 * size] = grey[i::size]
+                out[size + i::2 * size] = row[3 * size + i::4 * size]
+            grey = out
+        if size == 2:
+            grey = array('H', bytes(grey))
+            if sys.byteorder == 'little':
+                grey.byteswap()
+        yield grey
+
+
+def channel_bytes(row, channel, planes, size):
+    """
+    The bytes of one channel of the interleaved `row`
+    of `planes` channels of `size`-byte samples.
+    """
+
+    if size == 1:
+        return row[channel::planes]
+    bs = bytearray(size * (len(row) // (planes * size)))
+    for i in range(size):
+        bs[i::size] = row[channel * size + i::planes * size]
+    return bs
+
+
+def cli_info(args):
+    """
+    Print the metadata of a PNG file;
+    only the chunks before the image data are read.
+    """
+
+    r = Reader(file=cli_open(args.input))
+    r.preamble()
+    colour_types = {0: 'greyscale', 2: 'RGB', 3: 'palette',
+                    4: 'greyscale with alpha', 6: 'RGB with alpha'}
+    lines = [
+        ('size', '%dx%d' % (r.width, r.height)),
+        ('bitdepth', r.bitdepth),
+        ('colour type', '%d (%s)' % (r.color_type,
+                                     colour_types[r.color_type])),
+        ('interlace', r.interlace),
+    ]
+    if r.plte:
+        lines.append(('palette', '%d entries' % (len(r.plte) // 3)))
+    if r.trns and r.colormap:
+        lines.append(('palette alpha', '%d entries' % len(r.trns)))
+    for attr in 'transparent background gamma sbit'.split():
+        a = getattr(r, attr, None)
+        if a is not None:
+            if attr == 'sbit':
+                a = tuple(bytearray(a))
+            lines.append((attr, a))
+    if getattr(r, 'x_pixels_per_unit', None):
+        lines.append(('physical', '%dx%d per %s' % (
+            r.x_pixels_per_unit, r.y_pixels_per_unit,
+            ['unit', 'metre'][r.unit_is_meter])))
+    for key, value in lines:
+        print('%s: %s' % (key, value))
+
+
+def cli_togrey(args):
+    """Convert a PNG file to greyscale, one row at a time."""
+
+    width, height, pixels, info = Reader(file=cli_open(args.input)).asDirect()
+    options = cli_writer_options(info)
+    # asDirect has already expanded the palette and applied sBIT
+    palette = options.pop('palette', None)
+    options.pop('sbit', None)
+    if palette and options.get('background') is not None:
+        # the background of a palette image is a palette index
+        options['background'] = palette[options['background'][0]][:3]
+    if info['alpha']:
+        # asDirect has already turned a transparent colour into alpha
+        options.pop('transparent', None)
+    if not info['greyscale']:
+        pixels = luma_rows(pixels, width, info['planes'], info['bitdepth'])
+        options['greyscale'] = True
+        options['planes'] = info['planes'] - 2
+        for key in ('transparent', 'background'):
+            if options.get(key) is not None:
+                grey, = luma_rows([list(options[key])], 1, 3,
+                                  info['bitdepth'])
+                options[key] = grey[0]
+    w = Writer(**options)
+    with cli_create(args.output) as output:
+        w.write(output, pixels)
+
+
+def cli_crop(args):
+    """
+    Copy a range of rows of a PNG file.
+    Decoding stops after the last row wanted.
+    """
+
+    start, _, stop = args.rows.partition(':')
+    width, height, pixels, info = Reader(file=cli_open(args.input)).read()
+    start, stop, _ = slice(int(start or 0),
+                           int(stop) if stop else None).indices(height)
+    if stop <= start:
+        raise ProtocolError("row range %r is empty" % args.rows)
+    options = cli_writer_options(info)
+    options['size'] = (width, stop - start)
+    w = Writer(**options)
+    with cli_create(args.output) as output:
+        w.write(output, itertools.islice(pixels, start, stop))
+
+
+# The zlib strategies for ``recompress --strategy``.
+cli_strategies = {
+    'default': zlib.Z_DEFAULT_STRATEGY,
+    'filtered': zlib.Z_FILTERED,
+    'huffman-only': zlib.Z_HUFFMAN_ONLY,
+    'rle': zlib.Z_RLE,
+    'fixed': zlib.Z_FIXED,
+}
+
+
+def cli_recompress(args):
+    """Re-encode a PNG file with different filter and compression."""
+
+    width, height, pixels, info = Reader(file=cli_open(args.input)).read()
+    options = cli_writer_options(info)
+    options['compression'] = args.level
+    options['filter_type'] = args.filter
+    options['strategy'] = cli_strategies.get(args.strategy)
+    options['compress_workers'] = args.workers
+    w = Writer(**options)
+    with cli_create(args.output) as output:
+        w.write(output, pixels)
+
+
 def main(argv):
     """
     Run command line PNG.
+
+    All the commands stream rows from the input
+    (a file, or ``-`` for stdin)
+    to the output (``-o``, stdout by default),
+    so memory use does not grow with the height of the image.
+    Interlaced input is the exception:
+    it has to be decoded completely before the first row is known.
     """
-    print("What should the command line tool do?", file=sys.stderr)
+
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog=argv[0] if argv else None,
+        description="Inspect and convert PNG files.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_command(name, function, help):
+        p = subparsers.add_parser(name, help=help,
+                                  description=function.__doc__)
+        p.add_argument('input', nargs='?', default='-',
+                       help="PNG file to read (default: stdin)")
+        p.set_defaults(function=function)
+        return p
+
+    add_command('info', cli_info, "print the image metadata")
+    for p in [
+            add_command('togrey', cli_togrey, "convert to greyscale"),
+            add_command('crop', cli_crop, "copy a range of rows"),
+            add_command('recompress', cli_recompress,
+                        "change the filter and compression")]:
+        p.add_argument('-o', '--output', default='-',
+                       help="PNG file to write (default: stdout)")
+
+    crop = subparsers.choices['crop']
+    crop.add_argument('--rows', required=True, metavar='START:STOP',
+                      help="rows to keep, as a Python slice (no step)")
+
+    recompress = subparsers.choices['recompress']
+    recompress.add_argument(
+        '--filter', default=0,
+        type=lambda f: f if f == 'adaptive' else int(f),
+        choices=[0, 1, 2, 3, 4, 'adaptive'],
+        help="filter type for every row, or adaptive (default 0)")
+    recompress.add_argument(
+        '--level', type=int, default=None, choices=range(-1, 10),
+        help="zlib compression level")
+    recompress.add_argument(
+        '--strategy', default=None, choices=sorted(cli_strategies),
+        help="zlib strategy")
+    recompress.add_argument(
+        '--workers', type=int, default=None,
+        help="compress the image data with this many threads")
+
+    args = parser.parse_args(argv[1:])
+    args.function(args)
 
 
 if __name__ == '__main__':
@@ -2337,3 +3956,4 @@ if __name__ == '__main__':
         main(sys.argv)
     except Error as e:
         print(e, file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1 @@
+# tests, run with python -m pytest (or python -m unittest discover tests)
@@ -0,0 +1,64 @@
+
+import unittest
+
+from benchmarks.BaselineComparison import CALIBRATION, compareReports, regressions
+from benchmarks.BenchmarkRunner import benchmarkPipeline, importDetection, pngModes, timeCall
+from benchmarks.SyntheticPosters import SyntheticPoster
+
+
+def report(seconds):
+    return {"meta": {}, "results": {name: {"seconds": value, "median": value} for name, value in seconds.items()}}
+
+
+class TestBaselineComparison(unittest.TestCase):
+    def test_slower_machine_is_not_a_regression(self):
+        baseline = report({CALIBRATION: 0.01, "png/encode": 0.02, "pipeline/total": 1.0})
+        current = report({CALIBRATION: 0.03, "png/encode": 0.06, "pipeline/total": 3.0})
+        rows = compareReports(baseline, current)
+        self.assertEqual([row["status"] for row in rows], ["ok", "ok"])
+        # the calibration itself included
+        self.assertEqual(len(regressions(compareReports(baseline, current, normalise=False))), 3)
+
+    def test_regression_relative_to_calibration(self):
+        baseline = report({CALIBRATION: 0.01, "pipeline/total": 1.0})
+        current = report({CALIBRATION: 0.01, "pipeline/total": 1.5})
+        self.assertEqual([row["name"] for row in regressions(compareReports(baseline, current))], ["pipeline/total"])
+
+    def test_relative_timings_are_compared_when_both_reports_have_them(self):
+        baseline = report({CALIBRATION: 0.01, "pipeline/total": 1.0})
+        current = report({CALIBRATION: 0.01, "pipeline/total": 1.5})
+        baseline["results"]["pipeline/total"]["relative"] = 100
+        current["results"]["pipeline/total"]["relative"] = 110
+        (row,) = compareReports(baseline, current)
+        self.assertEqual((row["baseline"], row["current"], row["status"]), (100, 110, "ok"))
+        del baseline["results"]["pipeline/total"]["relative"]
+        self.assertEqual(compareReports(baseline, current)[0]["status"], "regression")
+
+
+class TestRunner(unittest.TestCase):
+    def test_time_call_relative_to_calibration(self):
+        result = timeCall(lambda: sum(range(20000)), 3, lambda: sum(range(10000)))
+        self.assertEqual(set(result), {"seconds", "median", "relative"})
+        self.assertGreater(result["relative"], 0)
+        self.assertNotIn("relative", timeCall(lambda: None, 3))
+
+    def test_one_bit_rows_are_bytes(self):
+        options, rows = pngModes(SyntheticPoster(16, 8, seed=1), [1])["grey1"]
+        self.assertEqual(options["bitdepth"], 1)
+        self.assertTrue(all(isinstance(row, bytes) and set(row) <= {0, 1} for row in rows))
+
+
+class TestPipelineBenchmark(unittest.TestCase):
+    def test_runs_once(self):
+        detection = importDetection()
+        if detection is None:
+            self.skipTest("QRCodeDetection can't be imported")
+        # not square, as the posters of the benchmarks aren't
+        poster = SyntheticPoster(48, 64, seed=1)
+        results = benchmarkPipeline(detection, poster, "test", 1)
+        self.assertIn("pipeline/total/test", results)
+        self.assertIn("pipeline/threshold/test", results)
+
+
+if __name__ == "__main__":
+    unittest.main()
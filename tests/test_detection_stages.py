@@ -0,0 +1,54 @@
+
+import random
+import unittest
+
+from benchmarks.BenchmarkRunner import importDetection
+
+
+# the 3x3 neighbourhood of (x, y) inside a width x height image
+def neighbours(x, y, width, height):
+    return [(x + dx, y + dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+            if 0 <= x + dx < width and 0 <= y + dy < height]
+
+
+class TestNonSquareStages(unittest.TestCase):
+    def setUp(self):
+        self.detection = importDetection()
+        if self.detection is None:
+            self.skipTest("QRCodeDetection can't be imported")
+        self.rng = random.Random(0)
+
+    def test_box_averaging(self):
+        for width, height in ((9, 5), (5, 9), (12, 3)):
+            pixels = [[self.rng.randrange(256) for x in range(width)] for y in range(height)]
+            blurred = self.detection.computeBoxAveraging3x3(pixels, width, height)
+            self.assertEqual((len(blurred), len(blurred[0])), (height, width))
+            for y in range(height):
+                for x in range(width):
+                    if x in (0, width - 1) or y in (0, height - 1):
+                        self.assertEqual(blurred[y][x], 0)
+                    else:
+                        expected = sum(pixels[ny][nx] for nx, ny in neighbours(x, y, width, height)) / 9
+                        self.assertAlmostEqual(blurred[y][x], expected, msg=(width, height, x, y))
+
+    def test_dilation_and_erosion(self):
+        for width, height in ((9, 5), (5, 9), (12, 3)):
+            # the first row is clear, as dilation treats set pixels that match the first row specially
+            mask = [[0] * width] + [[int(self.rng.random() < 0.3) for x in range(width)] for y in range(1, height)]
+            # a pixel on the last row and column, and one on the first column
+            mask[height - 1][width - 1] = 1
+            mask[height // 2][0] = 1
+            dilation = self.detection.computeDilation8Nbh3x3FlatSE(mask, width, height)
+            erosion = self.detection.computeErosion8Nbh3x3FlatSE(mask, width, height)
+            for array in (dilation, erosion):
+                self.assertEqual((len(array), [len(row) for row in array]), (height, [width] * height))
+            for y in range(height):
+                for x in range(width):
+                    around = [mask[ny][nx] for nx, ny in neighbours(x, y, width, height)]
+                    self.assertEqual(dilation[y][x], int(any(around)), (width, height, x, y))
+                    inside = 0 < x < width - 1 and 0 < y < height - 1
+                    self.assertEqual(erosion[y][x], int(inside and all(around)), (width, height, x, y))
+
+
+if __name__ == "__main__":
+    unittest.main()
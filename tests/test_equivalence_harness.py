@@ -0,0 +1,67 @@
+
+import random
+import unittest
+
+from benchmarks import EquivalenceHarness
+from benchmarks.SyntheticPosters import SyntheticPoster
+
+
+# wraps the reference of a stage into a backend whose results are wrong in one place
+def wrongBackend(function, kind):
+    def wrong(*arguments):
+        result = function(*arguments)
+        if kind == "pixels":
+            result = [list(row) for row in result]
+            result[0][0] += 100
+        elif kind == "labels":
+            (labels, sizes) = result
+            labels = [list(row) for row in labels]
+            labels[0][0] = max(sizes, default=0) + 1
+            result = (labels, sizes)
+        else:
+            result = tuple(value + 1 for value in result)
+        return result
+    return wrong
+
+
+class TestEquivalenceHarness(unittest.TestCase):
+    def setUp(self):
+        self.detection = EquivalenceHarness.registerReference()
+        if self.detection is None:
+            self.skipTest("QRCodeDetection can't be imported")
+        for stage, backends in EquivalenceHarness.BACKENDS.items():
+            EquivalenceHarness.registerBackend(
+                stage, "wrong", wrongBackend(backends["reference"][0], EquivalenceHarness.STAGE_KINDS[stage]))
+
+    def tearDown(self):
+        for backends in EquivalenceHarness.BACKENDS.values():
+            backends.pop("wrong", None)
+
+    def verdicts(self, results):
+        return {(row["stage"], row["backend"]): row["verdict"] for row in results}
+
+    def test_square_poster(self):
+        poster = SyntheticPoster(40, 40, seed=1)
+        rows = list(poster.rows())
+        channels = tuple([list(row[channel::3]) for row in rows] for channel in range(3))
+        stage_inputs = EquivalenceHarness.pipelineInputs(self.detection, *channels, poster.width, poster.height)
+        results = EquivalenceHarness.runHarness([("poster", poster.width, poster.height, stage_inputs)])
+        verdicts = self.verdicts(results)
+        self.assertEqual({stage for stage, backend in verdicts}, set(EquivalenceHarness.BACKENDS))
+        self.assertEqual({verdict for (stage, backend), verdict in verdicts.items() if backend == "wrong"}, {"fail"})
+        self.assertEqual(verdicts[("greyscale", "lanes")], "pass")
+        self.assertIn("poster", EquivalenceHarness.formatRows(results))
+
+    def test_random_inputs(self):
+        inputs = EquivalenceHarness.randomInputs(random.Random(0), 4, max_size=12)
+        # not all square, and some with pixels set on the border
+        self.assertTrue(any(width != height for name, width, height, stage_inputs in inputs))
+        self.assertTrue(any(row[0] or row[-1] for name, width, height, stage_inputs in inputs
+                            for row in stage_inputs["dilate"][0]))
+        results = EquivalenceHarness.runHarness(inputs)
+        for row in results:
+            self.assertEqual(row["verdict"], "fail" if row["backend"] == "wrong" else "pass", row)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+
+import unittest
+
+from PipelineInstrumentation import PipelineInstrumentation
+
+
+class TestPipelineInstrumentation(unittest.TestCase):
+    def test_stage_records(self):
+        instrumentation = PipelineInstrumentation()
+        try:
+            for name in ("read", "blur", "blur"):
+                with instrumentation.stage(name):
+                    values = [0.5] * 10000
+        finally:
+            instrumentation.close()
+        report = instrumentation.report()
+        self.assertEqual([record["stage"] for record in report["stages"]], ["read", "blur", "blur"])
+        for record in report["stages"]:
+            self.assertGreater(record["peak_allocated_bytes"], 9000 * 8)
+            # the process peak RSS isn't a figure for a stage
+            self.assertNotIn("peak_rss_bytes", record)
+        self.assertIn("process_peak_rss_bytes", report["total"])
+        self.assertIn("process peak RSS", instrumentation.formatTable())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+
+import unittest
+
+from LocalThreshold import localThresholdRows
+
+
+class TestLocalThreshold(unittest.TestCase):
+    def setUp(self):
+        self.rows = [[(11 * x + 29 * y) % 256 for x in range(9)] for y in range(7)]
+
+    def test_window_must_be_odd(self):
+        for window in (0, 2, 30, -1):
+            with self.assertRaises(ValueError):
+                localThresholdRows(self.rows, 9, window)
+
+    def test_mean_matches_direct_computation(self):
+        window = 3
+        expected = []
+        for y, row in enumerate(self.rows):
+            expected_row = []
+            for x, value in enumerate(row):
+                values = [self.rows[j][i] for j in range(max(0, y - 1), min(7, y + 2))
+                          for i in range(max(0, x - 1), min(9, x + 2))]
+                expected_row.append(255 if value >= sum(values) / len(values) + 10 else 0)
+            expected.append(expected_row)
+        self.assertEqual(list(localThresholdRows(self.rows, 9, window, "mean")), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+
+import argparse
+import contextlib
+import io
+import unittest
+
+import ParameterSweep
+from benchmarks.BenchmarkRunner import importDetection
+from benchmarks.SyntheticPosters import SyntheticPoster
+
+
+class TestParameterSweep(unittest.TestCase):
+    def test_sweep_matches_pipeline(self):
+        detection = importDetection()
+        if detection is None:
+            self.skipTest("QRCodeDetection can't be imported")
+        poster = SyntheticPoster(40, 48, seed=1)
+        rows = list(poster.rows())
+        r, g, b = ([list(row[channel::3]) for row in rows] for channel in range(3))
+        image = ("poster", r, g, b, poster.width, poster.height)
+        sweep_rows, wall_seconds = ParameterSweep.sweepImage(
+            image, ParameterSweep.expandGrid({"threshold": [70, "otsu"], "dilate_iterations": [1, 2]}))
+        self.assertEqual(len(sweep_rows), 4)
+        for row in sweep_rows:
+            self.assertNotIn("error", row)
+            # the rows with the default dilation are runs of the whole pipeline
+            if row["dilate_iterations"] == 2:
+                self.assertEqual(row["bbox"], detection.computeQRCodeBoundingBox(
+                    r, g, b, poster.width, poster.height, threshold=row["threshold"]))
+        self.assertIn("otsu=", ParameterSweep.formatTable(sweep_rows, {"poster": wall_seconds}))
+
+
+class TestThresholdArgument(unittest.TestCase):
+    def test_values(self):
+        for text, value in [("70", 70), ("70.5", 70.5), ("-3", -3), ("otsu", "otsu"), ("p90", "p90"),
+                            ("p99.5", "p99.5"), ("sauvola", "sauvola"), ("mean45", "mean45")]:
+            parsed = ParameterSweep.parseThreshold(text)
+            self.assertEqual(parsed, value)
+            self.assertIs(type(parsed), type(value))
+
+    def test_bad_values(self):
+        for text in ["seventy", "", "nan", "inf", "p", "p101", "pxx", "sauvola44", "mean0", "otsu2"]:
+            with self.assertRaises(argparse.ArgumentTypeError, msg=text):
+                ParameterSweep.parseThreshold(text)
+
+    def test_command_line_error(self):
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            with self.assertRaises(SystemExit) as exit:
+                ParameterSweep.main(["ParameterSweep.py", "image.png", "--threshold", "70", "70,5"])
+        self.assertEqual(exit.exception.code, 2)
+        self.assertIn("invalid threshold '70,5'", stderr.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
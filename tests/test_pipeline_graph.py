@@ -0,0 +1,90 @@
+
+import sys
+import unittest
+
+from PipelineGraph import PipelineGraph, ResultCache, StageNode, estimateSize
+
+
+def add(value, amount, image_width, image_height):
+    return value + amount
+
+
+def multiply(value, other, image_width, image_height):
+    return value * other
+
+
+def rows(value, image_width, image_height):
+    return [[value] * image_width for y in range(image_height)]
+
+
+# changes its input in place, as a careless stage might
+def clearFirstRow(pixel_array, image_width, image_height):
+    pixel_array[0][:] = [0] * image_width
+    return len(pixel_array)
+
+
+class TestPipelineGraph(unittest.TestCase):
+    def setUp(self):
+        self.graph = PipelineGraph([
+            StageNode("a", add, ["source"], ["first"]),
+            StageNode("b", add, ["a"], ["second"]),
+            StageNode("c", add, ["a"], ["first"]),
+            StageNode("d", multiply, ["b", "c"]),
+        ], {"first": 1, "second": 10})
+
+    def test_only_changed_nodes_rerun(self):
+        self.assertEqual(self.graph.run({"source": 1}, 1, 1, targets=["d"]), {"d": 36})
+        self.assertEqual(sorted(self.graph.executed), ["a", "b", "c", "d"])
+        self.assertEqual(self.graph.run({"source": 1}, 1, 1, {"second": 20}, ["d"]), {"d": 66})
+        self.assertEqual(sorted(self.graph.executed), ["b", "d"])
+        self.assertEqual(sorted(self.graph.cached), ["a", "c"])
+
+    def test_path_seconds_counts_cached_nodes_once(self):
+        self.graph.run({"source": 1}, 1, 1, targets=["d"])
+        self.graph.run({"source": 1}, 1, 1, {"second": 20}, ["d"])
+        seconds = {name: self.graph.seconds[self.graph.fingerprints[name]] for name in "abcd"}
+        self.assertAlmostEqual(self.graph.pathSeconds("d"), sum(seconds.values()))
+        self.assertAlmostEqual(self.graph.pathSeconds("b"), seconds["a"] + seconds["b"])
+
+
+
+class TestResultCache(unittest.TestCase):
+    def test_results_are_not_shared(self):
+        graph = PipelineGraph([StageNode("rows", rows, ["source"]), StageNode("clear", clearFirstRow, ["rows"])])
+        values = graph.run({"source": 7}, 3, 2)
+        self.assertEqual(values["rows"], [[0, 0, 0], [7, 7, 7]])
+        values["rows"][1][0] = 99
+        # the cached rows are the ones the stage returned, not changed by clear or by the caller
+        values = graph.run({"source": 7}, 3, 2, targets=["rows"])
+        self.assertEqual(graph.cached, ["rows"])
+        self.assertEqual(values["rows"], [[7, 7, 7], [7, 7, 7]])
+        values["rows"][0][0] = 1
+        self.assertEqual(graph.run({"source": 7}, 3, 2, targets=["rows"])["rows"], [[7, 7, 7], [7, 7, 7]])
+
+    def test_copies_keep_their_types(self):
+        cache = ResultCache()
+        value = (3, [[1.5, 2.5]], {1: [4]})
+        cache.put("key", value)
+        copy = cache.get("key")
+        self.assertEqual(copy, value)
+        self.assertIsNot(copy[1][0], value[1][0])
+        self.assertIsNot(copy[2][1], value[2][1])
+
+
+class TestEstimateSize(unittest.TestCase):
+    def test_nested_lists_are_counted(self):
+        image = [[i * 300 + j for j in range(50)] for i in range(40)]
+        rows_size = sys.getsizeof(image) + sum(sys.getsizeof(row) for row in image)
+        self.assertEqual(estimateSize(image), rows_size)
+        # a list of images and a tuple holding one count every row
+        self.assertEqual(estimateSize([image, image]), sys.getsizeof([image, image]) + 2 * rows_size)
+        self.assertEqual(estimateSize((5, image)), sys.getsizeof((5, image)) + sys.getsizeof(5) + rows_size)
+        # rows that are themselves lists of pixels
+        pixels = [[[1, 2, 3] for j in range(10)] for i in range(4)]
+        self.assertGreater(estimateSize(pixels), 40 * sys.getsizeof([1, 2, 3]))
+        floats = [[0.5] * 10 for i in range(4)]
+        self.assertEqual(estimateSize(floats) - estimateSize([[0] * 10 for i in range(4)]), 40 * sys.getsizeof(0.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
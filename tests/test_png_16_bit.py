@@ -0,0 +1,42 @@
+
+import io
+import random
+import struct
+import unittest
+from array import array
+
+import imageIO.png
+
+
+class Test16Bit(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.row = [rng.randrange(65536) for x in range(15)] + [0, 1, 255, 256, 65535]
+        self.packed = struct.pack(">%dH" % len(self.row), *self.row)
+
+    def test_unpack_rows(self):
+        for row in (self.row, tuple(self.row), array('H', self.row), memoryview(array('H', self.row))):
+            (unpacked,) = imageIO.png.unpack_rows([row])
+            self.assertEqual(bytes(unpacked), self.packed, type(row))
+
+    def test_unpack_16(self):
+        values = imageIO.png.unpack_16(self.packed)
+        self.assertEqual(values.typecode, 'H')
+        self.assertEqual(list(values), self.row)
+
+    def test_round_trip(self):
+        rng = random.Random(1)
+        for planes, options in ((1, dict(greyscale=True)), (3, dict(greyscale=False)),
+                                (4, dict(greyscale=False, alpha=True))):
+            for interlace in (False, True):
+                width, height = 7, 5
+                rows = [array('H', [rng.randrange(65536) for x in range(width * planes)]) for y in range(height)]
+                file = io.BytesIO()
+                imageIO.png.Writer(width, height, bitdepth=16, interlace=interlace, **options).write(file, rows)
+                info = imageIO.png.Reader(bytes=file.getvalue()).read()
+                self.assertEqual(info[3]["bitdepth"], 16)
+                self.assertEqual([list(row) for row in info[2]], [list(row) for row in rows], (planes, interlace))
+
+
+if __name__ == "__main__":
+    unittest.main()
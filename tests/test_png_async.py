@@ -0,0 +1,75 @@
+
+import asyncio
+import io
+import random
+import unittest
+
+import imageIO.png
+
+
+# a stream for AsyncWriter that keeps what is written, counting the drains
+class MemoryStream:
+    def __init__(self):
+        self.data = bytearray()
+        self.drains = 0
+
+    def write(self, data):
+        self.data.extend(data)
+
+    async def drain(self):
+        self.drains += 1
+
+
+# reads the PNG in data with an AsyncReader, returning its info and rows
+async def readAsync(data, **options):
+    stream = asyncio.StreamReader()
+    stream.feed_data(data)
+    stream.feed_eof()
+    width, height, rows, info = await imageIO.png.AsyncReader(stream, **options).read()
+    return info, [list(row) async for row in rows]
+
+
+class TestAsync(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.width, self.height = 37, 29
+        self.rows = [[rng.randrange(256) for x in range(self.width * 3)] for y in range(self.height)]
+
+    def encode(self, **options):
+        file = io.BytesIO()
+        imageIO.png.Writer(self.width, self.height, greyscale=False, **options).write(file, self.rows)
+        return file.getvalue()
+
+    def test_read(self):
+        for options in (dict(), dict(interlace=True), dict(chunk_limit=256)):
+            data = self.encode(**options)
+            for batch_size in (2**18, 100):
+                info, rows = asyncio.run(readAsync(data, batch_size=batch_size))
+                self.assertEqual((info["size"], info["planes"]), ((self.width, self.height), 3))
+                self.assertEqual(rows, self.rows, (options, batch_size))
+
+    def test_read_bad_crc(self):
+        data = bytearray(self.encode())
+        # The last byte of the IHDR CRC.
+        data[32] ^= 1
+        with self.assertRaises(imageIO.png.ChunkError):
+            asyncio.run(readAsync(bytes(data)))
+        info, rows = asyncio.run(readAsync(bytes(data), validation="trusted"))
+        self.assertEqual(rows, self.rows)
+
+    def test_write(self):
+        async def asyncRows():
+            for row in self.rows:
+                await asyncio.sleep(0)
+                yield row
+
+        for rows in (self.rows, asyncRows):
+            stream = MemoryStream()
+            writer = imageIO.png.AsyncWriter(stream, width=self.width, height=self.height, greyscale=False)
+            asyncio.run(writer.write(rows() if callable(rows) else rows))
+            self.assertEqual(bytes(stream.data), self.encode())
+            self.assertGreater(stream.drains, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+
+import io
+import random
+import unittest
+from array import array
+
+import imageIO.png
+
+
+class TestBuffers(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(0)
+
+    def decode(self, file):
+        return [list(row) for row in imageIO.png.Reader(bytes=file.getvalue()).read()[2]]
+
+    def check(self, buffer, width, height, **options):
+        flat = list(imageIO.png.buffer_values(buffer))
+        vpr = len(flat) // height
+        rows = [flat[y * vpr:(y + 1) * vpr] for y in range(height)]
+        for interlace in (False, True):
+            file = io.BytesIO()
+            imageIO.png.Writer(width, height, interlace=interlace, **options).write(file, buffer)
+            self.assertEqual(self.decode(file), rows, (type(buffer), options, interlace))
+            # The same image written from rows of lists.
+            expected = io.BytesIO()
+            imageIO.png.Writer(width, height, interlace=interlace, **options).write(expected, rows)
+            self.assertEqual(file.getvalue(), expected.getvalue())
+
+    def test_write_buffers(self):
+        width, height = 7, 5
+        rgb = [self.rng.randrange(256) for i in range(width * height * 3)]
+        self.check(bytearray(rgb), width, height, greyscale=False)
+        self.check(array('B', rgb), width, height, greyscale=False)
+        self.check(memoryview(bytearray(rgb)), width, height, greyscale=False)
+        self.check(memoryview(bytearray(rgb)).cast('B', (height, width * 3)), width, height, greyscale=False)
+        grey16 = [self.rng.randrange(65536) for i in range(width * height)]
+        self.check(array('H', grey16), width, height, greyscale=True, bitdepth=16)
+        self.check(memoryview(array('H', grey16)), width, height, greyscale=True, bitdepth=16)
+        grey2 = [self.rng.randrange(4) for i in range(width * height)]
+        self.check(bytearray(grey2), width, height, greyscale=True, bitdepth=2)
+
+    def test_wrong_size(self):
+        with self.assertRaises(imageIO.png.ProtocolError):
+            imageIO.png.Writer(4, 4, greyscale=True).write(io.BytesIO(), bytearray(15))
+
+    def test_from_array(self):
+        width, height = 6, 4
+        values = bytearray(self.rng.randrange(256) for i in range(width * height * 3))
+        image = imageIO.png.from_array(memoryview(values).cast('B', (height, width * 3)), 'RGB')
+        file = io.BytesIO()
+        image.write(file)
+        self.assertEqual(self.decode(file), [list(values[y * width * 3:(y + 1) * width * 3]) for y in range(height)])
+        grey16 = array('H', (self.rng.randrange(65536) for i in range(width * height)))
+        image = imageIO.png.from_array(memoryview(grey16).cast('B').cast('H', (height, width)), 'L')
+        file = io.BytesIO()
+        image.write(file)
+        info = imageIO.png.Reader(bytes=file.getvalue()).read()
+        self.assertEqual(info[3]["bitdepth"], 16)
+        self.assertEqual([list(row) for row in info[2]], [list(grey16[y * width:(y + 1) * width]) for y in range(height)])
+
+
+if __name__ == "__main__":
+    unittest.main()
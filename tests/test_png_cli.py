@@ -0,0 +1,84 @@
+
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import imageIO.png
+
+
+class TestCommandLine(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.input = os.path.join(directory.name, "input.png")
+        self.output = os.path.join(directory.name, "output.png")
+        writer = imageIO.png.Writer(3, 2, greyscale=False, gamma=0.45, background=(10, 20, 30),
+                                    x_pixels_per_unit=2835, y_pixels_per_unit=2835, unit_is_meter=True)
+        with open(self.input, "wb") as file:
+            writer.write(file, [[1, 2, 3] * 3, [200, 100, 50] * 3])
+
+    def test_togrey_keeps_metadata(self):
+        imageIO.png.main(["png", "togrey", self.input, "-o", self.output])
+        width, height, rows, info = imageIO.png.Reader(filename=self.output).read()
+        self.assertTrue(info["greyscale"])
+        self.assertEqual(info["gamma"], 0.45)
+        self.assertEqual(tuple(info["physical"]), (2835, 2835, True))
+        self.assertEqual(len(info["background"]), 1)
+        self.assertEqual([list(row) for row in rows], [[2] * 3, [124] * 3])
+
+    def test_togrey_palette(self):
+        for palette, alpha in [([(0, 0, 0), (255, 0, 0), (0, 255, 0)], False),
+                               ([(0, 0, 0, 0), (255, 0, 0, 128), (0, 255, 0, 255)], True)]:
+            with open(self.input, "wb") as file:
+                imageIO.png.Writer(3, 2, palette=palette, bitdepth=2).write(file, [[0, 1, 2], [2, 1, 0]])
+            imageIO.png.main(["png", "togrey", self.input, "-o", self.output])
+            width, height, rows, info = imageIO.png.Reader(filename=self.output).read()
+            self.assertTrue(info["greyscale"])
+            self.assertEqual(info["alpha"], alpha)
+            grey = [(77 * entry[0] + 150 * entry[1] + 29 * entry[2] + 128) >> 8 for entry in palette]
+            expected = [[grey[i] for i in row] for row in [[0, 1, 2], [2, 1, 0]]]
+            if alpha:
+                expected = [[value for i, g in zip(row, grey_row) for value in (g, palette[i][3])]
+                            for row, grey_row in zip([[0, 1, 2], [2, 1, 0]], expected)]
+            self.assertEqual([list(row) for row in rows], expected)
+
+    def test_togrey_16_bit(self):
+        pixels = [[65535, 0, 0, 0, 65535, 0, 0, 0, 65535, 1000, 2000, 3000]]
+        for alpha in (False, True):
+            planes = 3 + alpha
+            row = [value for i in range(0, 12, 3) for value in pixels[0][i:i + 3] + [7] * alpha]
+            with open(self.input, "wb") as file:
+                imageIO.png.Writer(4, 1, greyscale=False, alpha=alpha, bitdepth=16).write(file, [row])
+            imageIO.png.main(["png", "togrey", self.input, "-o", self.output])
+            width, height, rows, info = imageIO.png.Reader(filename=self.output).read()
+            self.assertEqual(info["bitdepth"], 16)
+            expected = [(77 * r + 150 * g + 29 * b + 128) >> 8 for r, g, b in zip(*[row[i::planes] for i in range(3)])]
+            if alpha:
+                expected = [value for grey in expected for value in (grey, 7)]
+            self.assertEqual(list(next(iter(rows))), expected)
+
+    def test_failure_exits_with_an_error(self):
+        with open(self.input, "wb") as file:
+            file.write(b"not a png file")
+        result = subprocess.run([sys.executable, "-m", "imageIO.png", "togrey", self.input, "-o", self.output],
+                                capture_output=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual(result.returncode, 1)
+        self.assertIn(b"Error", result.stderr)
+
+    def test_recompress_strategy(self):
+        imageIO.png.main(["png", "recompress", "--strategy", "rle", self.input, "-o", self.output])
+        self.assertEqual([list(row) for row in imageIO.png.Reader(filename=self.output).read()[2]],
+                         [[1, 2, 3] * 3, [200, 100, 50] * 3])
+
+    def test_unknown_strategy_is_a_usage_error(self):
+        with contextlib.redirect_stderr(io.StringIO()) as stderr, self.assertRaises(SystemExit):
+            imageIO.png.main(["png", "recompress", "--strategy", "bogus", self.input, "-o", self.output])
+        self.assertIn("invalid choice", stderr.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+
+import io
+import random
+import unittest
+
+import imageIO.png
+
+
+def encode(rows, width, **options):
+    file = io.BytesIO()
+    imageIO.png.Writer(width, len(rows), greyscale=True, **options).write(file, rows)
+    return file.getvalue()
+
+
+def idatChunks(data):
+    return [chunk for tag, chunk in imageIO.png.Reader(bytes=data).chunks() if tag == b"IDAT"]
+
+
+def decode(data):
+    return [list(row) for row in imageIO.png.Reader(bytes=data).read()[2]]
+
+
+class TestIDATChunks(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.small = [[rng.randrange(256) for x in range(4)] for y in range(4)]
+        self.large = [[rng.randrange(256) for x in range(300)] for y in range(300)]
+
+    def test_small_image_is_one_chunk(self):
+        for workers in (None, 1, 2):
+            data = encode(self.small, 4, compress_workers=workers)
+            self.assertEqual(len(idatChunks(data)), 1)
+            self.assertEqual(decode(data), self.small)
+
+    def test_parallel_chunks(self):
+        data = encode(self.large, 300, compress_workers=2, compress_block=2**13)
+        self.assertEqual(len(idatChunks(data)), 1)
+        self.assertEqual(decode(data), self.large)
+        # pieces are joined up to chunk_limit, the header and end of the stream are never chunks of their own
+        chunks = idatChunks(encode(self.large, 300, compress_workers=2, compress_block=2**13, chunk_limit=2**14))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) > 2**14 for chunk in chunks[:-1]))
+        self.assertGreater(len(chunks[-1]), 6)
+
+    def test_serial_chunks(self):
+        # a chunk each time the filtered data goes over chunk_limit (every 55 rows of 301 bytes),
+        # the last one ending the stream
+        chunks = idatChunks(encode(self.large, 300, chunk_limit=2**14))
+        self.assertEqual(len(chunks), 5)
+        # the zlib header goes in the first chunk with the deflate data
+        self.assertGreater(len(chunks[0]), 2**14)
+        self.assertEqual(decode(encode(self.large, 300, chunk_limit=2**14)), self.large)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+
+import io
+import struct
+import unittest
+import zlib
+
+import imageIO.png
+
+
+# a PNG file of an 8 bit greyscale image whose IDAT data is compressed from raw (the filtered scanlines)
+def pngWithRawData(width, height, raw):
+    file = io.BytesIO()
+    imageIO.png.write_chunks(file, [
+        (b"IHDR", struct.pack("!2I5B", width, height, 8, 0, 0, 0, 0)),
+        (b"IDAT", zlib.compress(raw, 9)),
+        (b"IEND", b""),
+    ])
+    return file.getvalue()
+
+
+class TestDecompress(unittest.TestCase):
+    def setUp(self):
+        self.rows = [[(x * 7 + y * 13) % 256 for x in range(50)] for y in range(40)]
+        file = io.BytesIO()
+        imageIO.png.Writer(50, 40, greyscale=True).write(file, self.rows)
+        self.data = file.getvalue()
+
+    def test_decompression_bomb(self):
+        # 4x4 pixels are 20 bytes of raw data, these 10 MB compress to about 10 KB
+        data = pngWithRawData(4, 4, bytes(10 * 2**20))
+        self.assertLess(len(data), 2**14)
+        with self.assertRaises(imageIO.png.FormatError):
+            for row in imageIO.png.Reader(bytes=data).read()[2]:
+                pass
+
+    def test_raw_size_is_allowed(self):
+        data = pngWithRawData(4, 4, bytes(20))
+        self.assertEqual([list(row) for row in imageIO.png.Reader(bytes=data).read()[2]], [[0] * 4] * 4)
+
+    def test_blocks(self):
+        for decompress_block in (0, None, 1, 100, 2**16):
+            reader = imageIO.png.Reader(bytes=self.data, decompress_block=decompress_block)
+            self.assertEqual([list(row) for row in reader.read()[2]], self.rows, decompress_block)
+
+    def test_block_size(self):
+        compressed = zlib.compress(bytes(range(256)) * 100)
+        pieces = [compressed[i:i + 1000] for i in range(0, len(compressed), 1000)]
+        blocks = list(imageIO.png.decompress(pieces, max_length=300))
+        self.assertTrue(all(len(block) <= 300 for block in blocks))
+        self.assertEqual(b"".join(blocks), bytes(range(256)) * 100)
+        self.assertEqual(b"".join(imageIO.png.decompress(pieces, max_length=0)), bytes(range(256)) * 100)
+        with self.assertRaises(imageIO.png.FormatError):
+            list(imageIO.png.decompress(pieces, max_length=300, limit=25599))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+
+import io
+import random
+import unittest
+import zlib
+
+import imageIO.png
+
+
+# the Paeth predictor for one byte, as written in the PNG specification
+def paeth(a, b, c):
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    if pb <= pc:
+        return b
+    return c
+
+
+# filters a scanline one byte at a time
+def filterSlowly(filter_type, filter_unit, line, previous):
+    previous = previous or bytes(len(line))
+    out = bytearray()
+    for i, x in enumerate(line):
+        a = line[i - filter_unit] if i >= filter_unit else 0
+        b = previous[i]
+        c = previous[i - filter_unit] if i >= filter_unit else 0
+        predictor = (0, a, b, (a + b) // 2, paeth(a, b, c))[filter_type]
+        out.append((x - predictor) & 0xff)
+    return bytes(out)
+
+
+class TestFilters(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(0)
+
+    def randomBytes(self, n):
+        return bytes(self.rng.randrange(256) for i in range(n))
+
+    def test_paeth_lanes(self):
+        triples = [(a, b, c) for a in (0, 1, 127, 128, 254, 255) for b in (0, 1, 128, 255) for c in (0, 2, 128, 255)]
+        triples += [tuple(self.rng.randrange(256) for i in range(3)) for j in range(500)]
+        a, b, c = (bytes(triple[i] for triple in triples) for i in range(3))
+        one = int.from_bytes(b'\x00\x01' * len(triples), 'big')
+        predicted = imageIO.png.from_lanes(imageIO.png.paeth_lanes(
+            imageIO.png.to_lanes(a), imageIO.png.to_lanes(b), imageIO.png.to_lanes(c), one), len(triples))
+        self.assertEqual(list(predicted), [paeth(*triple) for triple in triples])
+
+    def test_filter_scanline_and_undo(self):
+        reader = imageIO.png.Reader(bytes=b'')
+        for filter_unit in (1, 2, 3, 4, 8):
+            line, previous = self.randomBytes(6 * filter_unit + 1), self.randomBytes(6 * filter_unit + 1)
+            for prior in (None, previous):
+                for filter_type in (0, 1, 2, 3, 4):
+                    filtered = imageIO.png.filter_scanline(filter_type, filter_unit, line, prior)
+                    self.assertEqual(bytes(filtered), filterSlowly(filter_type, filter_unit, line, prior))
+                    reader.psize = filter_unit
+                    recon = reader.undo_filter(filter_type, bytearray(filtered), prior and bytearray(prior))
+                    self.assertEqual(bytes(recon), line, (filter_unit, filter_type, prior is None))
+        with self.assertRaises(imageIO.png.ProtocolError):
+            imageIO.png.filter_scanline(5, 1, line, None)
+
+    def test_round_trip(self):
+        modes = ((3, 8, dict(greyscale=False)), (1, 16, dict(greyscale=True)), (1, 1, dict(greyscale=True)))
+        for planes, bitdepth, options in modes:
+            width, height = 11, 6
+            rows = [[self.rng.randrange(2 ** bitdepth) for x in range(width * planes)] for y in range(height)]
+            for filter_type in (0, 1, 2, 3, 4, 'adaptive'):
+                file = io.BytesIO()
+                imageIO.png.Writer(width, height, bitdepth=bitdepth, filter_type=filter_type,
+                                   **options).write(file, rows)
+                reader = imageIO.png.Reader(bytes=file.getvalue())
+                raw = zlib.decompress(b''.join(data for tag, data in reader.chunks() if tag == b'IDAT'))
+                stride = len(raw) // height
+                used = {raw[y * stride] for y in range(height)}
+                if filter_type == 'adaptive':
+                    self.assertLessEqual(used, {0, 1, 2, 3, 4})
+                else:
+                    self.assertEqual(used, {filter_type})
+                decoded = imageIO.png.Reader(bytes=file.getvalue()).read()[2]
+                self.assertEqual([list(row) for row in decoded], rows, (planes, bitdepth, filter_type))
+
+
+if __name__ == "__main__":
+    unittest.main()
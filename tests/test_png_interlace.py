@@ -0,0 +1,47 @@
+
+import io
+import random
+import unittest
+
+import imageIO.png
+
+
+SIZES = ((1, 1), (1, 9), (9, 1), (2, 2), (3, 5), (5, 3), (7, 9), (13, 2), (17, 11))
+
+MODES = ((1, 1, dict(greyscale=True)),
+         (1, 8, dict(greyscale=True)),
+         (2, 16, dict(greyscale=True, alpha=True)),
+         (3, 8, dict(greyscale=False)),
+         (4, 16, dict(greyscale=False, alpha=True)),
+         (1, 2, dict(palette=[(i * 80, 0, 0) for i in range(4)])))
+
+
+class TestAdam7(unittest.TestCase):
+    def test_passes_cover_every_pixel_once(self):
+        for width, height in SIZES:
+            seen = []
+            for xstart, ystart, xstep, ystep, ppr in imageIO.png.adam7_passes(width, height):
+                for y in range(ystart, height, ystep):
+                    xs = range(xstart, width, xstep)
+                    self.assertEqual(len(xs), ppr)
+                    seen.extend((x, y) for x in xs)
+            self.assertEqual(sorted(seen), [(x, y) for x in range(width) for y in range(height)], (width, height))
+
+    def test_round_trip_odd_sizes(self):
+        rng = random.Random(0)
+        for planes, bitdepth, options in MODES:
+            for width, height in SIZES:
+                rows = [[rng.randrange(2 ** bitdepth) for x in range(width * planes)] for y in range(height)]
+                encoded = {}
+                for interlace in (False, True):
+                    file = io.BytesIO()
+                    imageIO.png.Writer(width, height, bitdepth=bitdepth, interlace=interlace,
+                                       **options).write(file, rows)
+                    encoded[interlace] = file.getvalue()
+                    decoded = imageIO.png.Reader(bytes=encoded[interlace]).read()[2]
+                    self.assertEqual([list(row) for row in decoded], rows, (planes, bitdepth, width, height, interlace))
+                self.assertNotEqual(encoded[False], encoded[True])
+
+
+if __name__ == "__main__":
+    unittest.main()
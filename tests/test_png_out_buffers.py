@@ -0,0 +1,54 @@
+
+import io
+import unittest
+from array import array
+
+import imageIO.png
+
+
+# encodes a width x height image of 16 bit values with the given number of planes (1 to 4) as png bytes
+def png16(width, height, planes):
+    values = [(y * 7919 + x * 104729) % 65536 for y in range(height) for x in range(width * planes)]
+    rows = [values[y * width * planes:(y + 1) * width * planes] for y in range(height)]
+    writer = imageIO.png.Writer(width, height, greyscale=planes < 3, alpha=planes in (2, 4), bitdepth=16)
+    file = io.BytesIO()
+    writer.write(file, rows)
+    return file.getvalue(), values
+
+
+class TestOutBuffers(unittest.TestCase):
+    def assertFillsOut(self, method, data, size):
+        out = array('H', [0]) * size
+        width, height, pixels, info = getattr(imageIO.png.Reader(bytes=data), method)(out=out)
+        expected = getattr(imageIO.png.Reader(bytes=data), method)()[2]
+        self.assertIs(pixels, out)
+        self.assertEqual(list(out), list(expected))
+        self.assertEqual(info['bitdepth'], 16)
+
+    def test_rgb16_into_array(self):
+        data, values = png16(5, 3, 3)
+        self.assertFillsOut("asRGB_flat", data, 5 * 3 * 3)
+        self.assertEqual(list(imageIO.png.Reader(bytes=data).asRGB_flat()[2]), values)
+
+    def test_rgba16_into_array(self):
+        data, values = png16(5, 3, 4)
+        self.assertFillsOut("asRGBA_flat", data, 5 * 3 * 4)
+        self.assertEqual(list(imageIO.png.Reader(bytes=data).asRGBA_flat()[2]), values)
+
+    def test_grey16_expanded_into_array(self):
+        data, values = png16(4, 4, 1)
+        self.assertFillsOut("asRGB_flat", data, 4 * 4 * 3)
+        self.assertFillsOut("asRGBA_flat", data, 4 * 4 * 4)
+
+    def test_rgb8_into_bytearray(self):
+        writer = imageIO.png.Writer(2, 2, greyscale=False)
+        file = io.BytesIO()
+        writer.write(file, [[1, 2, 3, 4, 5, 6], [7, 8, 9, 10, 11, 12]])
+        out = bytearray(12)
+        pixels = imageIO.png.Reader(bytes=file.getvalue()).asRGB_flat(out=out)[2]
+        self.assertIs(pixels, out)
+        self.assertEqual(list(out), list(range(1, 13)))
+
+
+if __name__ == "__main__":
+    unittest.main()
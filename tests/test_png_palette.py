@@ -0,0 +1,89 @@
+
+import io
+import random
+import unittest
+from array import array
+
+import imageIO.png
+
+
+# writes rows with the Writer options given and returns a Reader of the result
+def writeAndRead(width, height, rows, **options):
+    file = io.BytesIO()
+    imageIO.png.Writer(width, height, **options).write(file, rows)
+    return imageIO.png.Reader(bytes=file.getvalue())
+
+
+class TestPalette(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(0)
+        self.width, self.height = 9, 4
+
+    def randomRows(self, maximum, planes=1):
+        return [[self.rng.randrange(maximum + 1) for x in range(self.width * planes)] for y in range(self.height)]
+
+    def test_palette_expansion(self):
+        opaque = [tuple(self.rng.randrange(256) for i in range(3)) for j in range(6)]
+        translucent = [entry + (self.rng.randrange(256),) for entry in opaque[:3]] + opaque[3:]
+        for bitdepth in (4, 8):
+            rows = self.randomRows(len(opaque) - 1)
+            for palette in (opaque, translucent):
+                # Entries without alpha are opaque.
+                full = [tuple(entry) + (255,) * (4 - len(entry)) for entry in palette]
+                alpha = palette is translucent
+                reader = writeAndRead(self.width, self.height, rows, palette=palette, bitdepth=bitdepth)
+                width, height, pixels, info = reader.asDirect()
+                self.assertEqual((info["alpha"], info["planes"], info["bitdepth"]), (alpha, 3 + alpha, 8))
+                expected = [[value for index in row for value in full[index][:3 + alpha]] for row in rows]
+                self.assertEqual([list(row) for row in pixels], expected)
+                reader = writeAndRead(self.width, self.height, rows, palette=palette, bitdepth=bitdepth)
+                expected = [[value for index in row for value in full[index]] for row in rows]
+                self.assertEqual([list(row) for row in reader.asRGBA8()[2]], expected)
+                if not alpha:
+                    reader = writeAndRead(self.width, self.height, rows, palette=palette, bitdepth=bitdepth)
+                    expected = [[value for index in row for value in full[index][:3]] for row in rows]
+                    self.assertEqual([list(row) for row in reader.asRGB8()[2]], expected)
+
+    def test_index_beyond_palette(self):
+        reader = writeAndRead(2, 1, [[0, 3]], palette=[(0, 0, 0), (1, 1, 1)], bitdepth=2)
+        with self.assertRaises(imageIO.png.FormatError):
+            list(reader.asDirect()[2])
+
+    def test_transparent_colour(self):
+        for bitdepth in (2, 8, 16):
+            maximum = 2 ** bitdepth - 1
+            for greyscale, planes in ((True, 1), (False, 3)):
+                rows = self.randomRows(min(maximum, 3), planes)
+                transparent = rows[0][:planes]
+                rows[2][-planes:] = transparent
+                options = dict(greyscale=greyscale, bitdepth=bitdepth,
+                               transparent=transparent[0] if greyscale else transparent)
+                if not greyscale and bitdepth < 8:
+                    continue
+                info = writeAndRead(self.width, self.height, rows, **options).asDirect()
+                self.assertTrue(info[3]["alpha"])
+                expected = []
+                for row in rows:
+                    pixels = [row[x:x + planes] for x in range(0, len(row), planes)]
+                    expected.append([value for pixel in pixels
+                                     for value in pixel + [0 if pixel == transparent else maximum]])
+                self.assertEqual([list(row) for row in info[2]], expected, (bitdepth, greyscale))
+
+    def test_as_rgb_into_out(self):
+        for bitdepth, buffer in ((8, bytearray), (16, lambda n: array('H', [0] * n))):
+            out, out4 = buffer(3 * self.width), buffer(4 * self.width)
+            rows = self.randomRows(2 ** bitdepth - 1)
+            reader = writeAndRead(self.width, self.height, rows, greyscale=True, bitdepth=bitdepth)
+            seen = []
+            for row in reader.asRGB(out=out)[2]:
+                self.assertIs(row, out)
+                seen.append(list(row))
+            self.assertEqual(seen, [[value for value in row for i in range(3)] for row in rows])
+            reader = writeAndRead(self.width, self.height, rows, greyscale=True, bitdepth=bitdepth)
+            seen = [list(row) for row in reader.asRGBA(out=out4)[2]]
+            self.assertEqual(seen, [[channel for value in row for channel in (value,) * 3 + (2 ** bitdepth - 1,)]
+                                    for row in rows])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+
+import io
+import threading
+import time
+import unittest
+import zlib
+
+import imageIO.png
+
+
+def encode(rows, width, **options):
+    file = io.BytesIO()
+    imageIO.png.Writer(width, len(rows), greyscale=True, **options).write(file, rows)
+    return file.getvalue()
+
+
+class TestPipelinedRead(unittest.TestCase):
+    def setUp(self):
+        self.rows = [[(x * x + y * 3) % 256 for x in range(120)] for y in range(100)]
+
+    def read(self, data, **options):
+        return [list(row) for row in imageIO.png.Reader(bytes=data, **options).read()[2]]
+
+    def test_same_rows(self):
+        for options in ({}, {"interlace": True}, {"chunk_limit": 500}):
+            data = encode(self.rows, 120, **options)
+            for pipeline in (1, 4):
+                self.assertEqual(self.read(data, pipeline=pipeline, decompress_block=256), self.rows,
+                                 (options, pipeline))
+
+    def test_threads_stop_when_the_reader_stops_early(self):
+        data = encode(self.rows, 120, chunk_limit=200)
+        threads = threading.active_count()
+        rows = imageIO.png.Reader(bytes=data, pipeline=1, decompress_block=128).read()[2]
+        self.assertEqual(list(next(rows)), self.rows[0])
+        self.assertGreater(threading.active_count(), threads)
+        rows.close()
+        deadline = time.monotonic() + 5
+        while threading.active_count() > threads and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_errors_reach_the_reader(self):
+        data = bytearray(encode(self.rows, 120))
+        # corrupt the compressed data, leaving the chunk checksums alone
+        start = data.index(b"IDAT") + 10
+        data[start:start + 20] = bytes(20)
+        # the same error as without the pipeline, raised in the thread reading the rows
+        for pipeline in (0, 2):
+            with self.assertRaises(zlib.error):
+                self.read(bytes(data), pipeline=pipeline, validation="trusted")
+
+
+if __name__ == "__main__":
+    unittest.main()
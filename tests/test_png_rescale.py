@@ -0,0 +1,70 @@
+
+import io
+import random
+import unittest
+from array import array
+from unittest import mock
+
+import imageIO.png
+
+
+# writes rows with the Writer options given and returns a Reader of the result
+def writeAndRead(width, height, rows, **options):
+    file = io.BytesIO()
+    imageIO.png.Writer(width, height, **options).write(file, rows)
+    return imageIO.png.Reader(bytes=file.getvalue())
+
+
+class TestRescale(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(0)
+
+    def test_rescale_tables(self):
+        for source, target in ((1, 8), (2, 8), (4, 8), (5, 8), (8, 8), (3, 16), (8, 16), (12, 8)):
+            table = imageIO.png.make_rescale_table(source, target)
+            values = list(range(2 ** source))
+            scaled = [(value * (2 ** target - 1) + (2 ** source - 1) // 2) // (2 ** source - 1) for value in values]
+            self.assertEqual(list(imageIO.png.map_values(table, values, 'BH'[target > 8])), scaled, (source, target))
+            self.assertEqual(isinstance(table, bytes), source <= 8 and target <= 8)
+
+    def test_rescale_16_to_8(self):
+        values = array('H', range(65536))
+        expected = imageIO.png.map_values(imageIO.png.make_rescale_table(16, 8), values, 'B')
+        self.assertEqual(imageIO.png.rescale_16_to_8(values), expected)
+        self.assertEqual(list(expected[::257]), list(range(256)))
+        self.assertEqual(list(imageIO.png.rescale_16_to_8([128, 129, 385, 386])), [0, 1, 1, 2])
+
+    def test_as_rgb8_of_16_bit(self):
+        width, height = 5, 3
+        rows = [[self.rng.randrange(65536) for x in range(width * 3)] for y in range(height)]
+        reader = writeAndRead(width, height, rows, greyscale=False, bitdepth=16)
+        with mock.patch.object(imageIO.png, "make_rescale_table", wraps=imageIO.png.make_rescale_table) as table:
+            width, height, pixels, info = reader.asRGB8()
+            self.assertEqual([list(row) for row in pixels], [[round(value / 257) for value in row] for row in rows])
+        self.assertEqual(info["bitdepth"], 8)
+        # The 16 to 8 bit path doesn't need the 65536 entry table.
+        table.assert_not_called()
+
+    def test_as_rgba8_of_low_bit_depths(self):
+        width, height = 6, 2
+        for bitdepth in (1, 2, 4):
+            rows = [[self.rng.randrange(2 ** bitdepth) for x in range(width)] for y in range(height)]
+            info = writeAndRead(width, height, rows, greyscale=True, bitdepth=bitdepth).asRGBA8()
+            scale = 255 // (2 ** bitdepth - 1)
+            self.assertEqual([list(row) for row in info[2]],
+                             [[channel for value in row for channel in (value * scale,) * 3 + (255,)] for row in rows])
+
+    def test_significant_bits(self):
+        width, height = 4, 3
+        for bitdepth, written in ((5, 8), (3, 8), (12, 16)):
+            rows = [[self.rng.randrange(2 ** bitdepth) for x in range(width * 3)] for y in range(height)]
+            reader = writeAndRead(width, height, rows, greyscale=False, bitdepth=bitdepth)
+            self.assertEqual(reader.read()[3]["bitdepth"], written)
+            reader = writeAndRead(width, height, rows, greyscale=False, bitdepth=bitdepth)
+            width, height, pixels, info = reader.asDirect()
+            self.assertEqual(info["bitdepth"], bitdepth)
+            self.assertEqual([list(row) for row in pixels], rows)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+
+import io
+import random
+import unittest
+
+import imageIO.png
+
+
+# packs values of bitdepth bits into bytes one value at a time, most significant first, padding the last byte
+def packSlowly(values, bitdepth):
+    spb = 8 // bitdepth
+    values = list(values) + [0] * (-len(values) % spb)
+    packed = bytearray()
+    for i in range(0, len(values), spb):
+        byte = 0
+        for value in values[i:i + spb]:
+            byte = (byte << bitdepth) | value
+        packed.append(byte)
+    return packed
+
+
+class TestSubByte(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(0)
+
+    def test_pack_and_unpack(self):
+        for bitdepth in (1, 2, 4):
+            for width in (1, 3, 7, 8, 9, 33):
+                row = [self.rng.randrange(2 ** bitdepth) for x in range(width)]
+                (packed,) = imageIO.png.pack_rows([row], bitdepth)
+                self.assertEqual(packed, packSlowly(row, bitdepth), (bitdepth, width))
+                self.assertEqual(list(imageIO.png.unpack_sub_byte(packed, bitdepth, width)), row)
+
+    def test_values_too_large(self):
+        with self.assertRaises(imageIO.png.ProtocolError):
+            list(imageIO.png.pack_rows([[0, 4]], 2))
+
+    def test_round_trip(self):
+        for bitdepth in (1, 2, 4):
+            for width, height in ((1, 1), (5, 3), (17, 4)):
+                rows = [[self.rng.randrange(2 ** bitdepth) for x in range(width)] for y in range(height)]
+                for options in (dict(greyscale=True), dict(palette=[(i, i, i) for i in range(2 ** bitdepth)])):
+                    for interlace in (False, True):
+                        file = io.BytesIO()
+                        imageIO.png.Writer(width, height, bitdepth=bitdepth, interlace=interlace,
+                                           **options).write(file, rows)
+                        reader = imageIO.png.Reader(bytes=file.getvalue())
+                        self.assertEqual([list(row) for row in reader.read()[2]], rows,
+                                         (bitdepth, width, height, options.keys(), interlace))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+
+import io
+import random
+import struct
+import unittest
+
+import imageIO.png
+
+
+# returns a PNG with several IDAT chunks and a list of the (type, length) of its chunks
+def makePNG():
+    file = io.BytesIO()
+    rng = random.Random(0)
+    rows = [[rng.randrange(256) for x in range(200)] for y in range(200)]
+    imageIO.png.Writer(200, 200, greyscale=True, chunk_limit=2 ** 12).write(file, rows)
+    data = file.getvalue()
+    chunks, offset = [], 8
+    while offset < len(data):
+        length, type = struct.unpack("!I4s", data[offset:offset + 8])
+        chunks.append((type, length, offset))
+        offset += length + 12
+    return data, rows, chunks
+
+
+# flips a bit in the CRC of the first chunk of the given type
+def corruptCRC(data, chunks, type):
+    for chunkType, length, offset in chunks:
+        if chunkType == type:
+            data = bytearray(data)
+            data[offset + 8 + length] ^= 1
+            return bytes(data)
+
+
+class TestValidation(unittest.TestCase):
+    def setUp(self):
+        self.data, self.rows, self.chunks = makePNG()
+        self.assertGreater(sum(type == b'IDAT' for type, length, offset in self.chunks), 2)
+
+    def read(self, data, validation):
+        return [list(row) for row in imageIO.png.Reader(bytes=data, validation=validation).read()[2]]
+
+    def test_counters(self):
+        n = len(self.chunks)
+        covered = {type: length + 4 for type, length, offset in self.chunks}
+        expected = {
+            "full": dict(chunks=n, crc_checked=n, crc_skipped=0, type_checked=n,
+                         crc_bytes=sum(length + 4 for type, length, offset in self.chunks)),
+            "header": dict(chunks=n, crc_checked=2, crc_skipped=n - 2, type_checked=2,
+                           crc_bytes=covered[b'IHDR'] + covered[b'IEND']),
+            "trusted": dict(chunks=n, crc_checked=0, crc_skipped=n, type_checked=0, crc_bytes=0)}
+        for profile, counts in expected.items():
+            policy = imageIO.png.ValidationPolicy(profile)
+            self.assertEqual(self.read(self.data, policy), self.rows)
+            self.assertEqual({key: policy.counters[key] for key in counts}, counts, profile)
+            # A policy shared between readers adds up their work.
+            self.read(self.data, policy)
+            self.assertEqual(policy.counters["chunks"], 2 * n)
+
+    def test_bad_crc(self):
+        data = corruptCRC(self.data, self.chunks, b'IDAT')
+        with self.assertRaises(imageIO.png.ChunkError):
+            self.read(data, "full")
+        self.assertEqual(self.read(data, "header"), self.rows)
+        self.assertEqual(self.read(data, "trusted"), self.rows)
+        data = corruptCRC(self.data, self.chunks, b'IHDR')
+        for profile in ("full", "header"):
+            with self.assertRaises(imageIO.png.ChunkError):
+                self.read(data, profile)
+        self.assertEqual(self.read(data, "trusted"), self.rows)
+
+    def test_unknown_profile(self):
+        with self.assertRaises(imageIO.png.ProtocolError):
+            imageIO.png.Reader(bytes=self.data, validation="none")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+
+import os
+import tempfile
+import unittest
+
+import imageIO.png
+from benchmarks.BenchmarkRunner import importDetection
+from benchmarks.SyntheticPosters import SyntheticPoster
+
+
+def readPNG(filename):
+    width, height, rows, info = imageIO.png.Reader(filename=filename).read()
+    return [list(row) for row in rows], info
+
+
+class TestStageDumps(unittest.TestCase):
+    def test_dumps_are_the_stage_results(self):
+        detection = importDetection()
+        if detection is None:
+            self.skipTest("QRCodeDetection can't be imported")
+        poster = SyntheticPoster(50, 36, seed=3)
+        rows = list(poster.rows())
+        r, g, b = ([list(row[channel::3]) for row in rows] for channel in range(3))
+        width, height = poster.width, poster.height
+        with tempfile.TemporaryDirectory() as directory:
+            prefix = os.path.join(directory, "poster")
+            box = detection.computeQRCodeBoundingBox(r, g, b, width, height, dump_prefix=prefix)
+            self.assertEqual(box, detection.computeQRCodeBoundingBox(r, g, b, width, height))
+            edges, info = readPNG(prefix + "_edges.png")
+            self.assertEqual(info["bitdepth"], 8)
+            dumps = {}
+            for name in ("threshold", "dilation", "erosion"):
+                dumps[name], info = readPNG(prefix + "_{}.png".format(name))
+                self.assertEqual((info["size"], info["bitdepth"]), ((width, height), 1))
+        # each mask follows from the one before it, set pixels being 1 in the 1 bit files
+        threshold = detection.computeThresholdGE(edges, 70, width, height)
+        self.assertEqual(dumps["threshold"], [[int(bool(value)) for value in row] for row in threshold])
+        dilation = dumps["threshold"]
+        erosion = dumps["dilation"]
+        for i in range(2):
+            dilation = detection.computeDilation8Nbh3x3FlatSE(dilation, width, height)
+            erosion = detection.computeErosion8Nbh3x3FlatSE(erosion, width, height)
+        self.assertEqual(dumps["dilation"], [[int(bool(value)) for value in row] for row in dilation])
+        self.assertEqual(dumps["erosion"], [[int(bool(value)) for value in row] for row in erosion])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+
+import unittest
+
+from benchmarks.BenchmarkRunner import importDetection
+
+
+class TestThresholdModes(unittest.TestCase):
+    def setUp(self):
+        self.detection = importDetection()
+        if self.detection is None:
+            self.skipTest("QRCodeDetection can't be imported")
+        self.pixel_array = [[(7 * x + 13 * y) % 256 for x in range(12)] for y in range(10)]
+
+    def test_automatic_threshold(self):
+        for threshold in (70, "otsu", "p90", "mean", "sauvola5"):
+            threshold_value, threshold_array = self.detection.computeAutomaticThresholdGE(
+                self.pixel_array, threshold, 12, 10)
+            self.assertEqual(threshold_value, self.detection.computeThresholdValue(self.pixel_array, threshold, 12, 10))
+            self.assertEqual(threshold_array, self.detection.computeThresholdGE(self.pixel_array, threshold_value, 12, 10))
+        self.assertEqual(self.detection.computeAutomaticThresholdGE(self.pixel_array, 70, 12, 10)[0], 70)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            self.detection.computeAutomaticThresholdGE(self.pixel_array, "bogus", 12, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
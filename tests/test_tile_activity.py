@@ -0,0 +1,35 @@
+
+import unittest
+
+from TileActivity import activeRegions, mergeBoxes
+from benchmarks.BenchmarkRunner import importDetection
+from benchmarks.SyntheticPosters import SyntheticPoster
+
+
+class TestActiveRegions(unittest.TestCase):
+    def test_regions_stay_inside_the_image(self):
+        self.assertEqual(sorted(activeRegions({(0, 0), (3, 1)}, 10, 4, 35, 18)), [(0, 0, 14, 14), (26, 6, 35, 18)])
+
+    def test_touching_boxes_merge(self):
+        self.assertEqual(mergeBoxes([(0, 0, 5, 5), (5, 0, 8, 3), (20, 20, 30, 30)]), [(0, 0, 8, 5), (20, 20, 30, 30)])
+
+
+class TestActiveTilesPipeline(unittest.TestCase):
+    def test_matches_whole_image(self):
+        detection = importDetection()
+        if detection is None:
+            self.skipTest("QRCodeDetection can't be imported")
+        for width, height, seed in [(80, 60, 2), (60, 80, 1)]:
+            poster = SyntheticPoster(width, height, seed=seed, noise=0)
+            rows = list(poster.rows())
+            r, g, b = ([list(row[channel::3]) for row in rows] for channel in range(3))
+            expected = detection.computeQRCodeBoundingBox(r, g, b, width, height)
+            # always on the active regions, however much of the image they cover, and measuring the activity
+            # of every pixel, as downsampling can miss the one pixel high lines of text
+            self.assertEqual(detection.computeQRCodeBoundingBoxOnActiveTiles(
+                r, g, b, width, height, tile_size=16, halo=8, sample=1, max_coverage=2), expected)
+            self.assertEqual(detection.computeQRCodeBoundingBoxOnActiveTiles(r, g, b, width, height), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()